@@ -0,0 +1,362 @@
+################################################################################
+#
+# Copyright (c) 2011-2012, Daniel Baeumges (dbaeumges@googlemail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+################################################################################
+
+from common import Logger
+from optparse import OptionParser
+
+import os
+import socket
+import struct
+import threading
+import time
+
+
+# ================================================================================
+# Adb Client Error Object
+# ================================================================================
+class AdbClientError(Exception):
+    CONNECTION_ERROR = 1 # service was not started (server or device not available)
+    SERVICE_ERROR    = 2 # service failed after it was started
+
+    def __init__(self, theValue, theCode=SERVICE_ERROR, theBaseError=None):
+        self.value = theValue
+        self.code = theCode
+        self.baseError = theBaseError
+
+    def __str__(self):
+        return repr(self.value)
+
+    def getCode(self):
+        return self.code
+
+
+# ================================================================================
+# Adb Client
+# ================================================================================
+class AdbClient:
+    """
+    Talks the host protocol of the adb server (localhost:5037) directly
+    instead of running the adb binary for each command.
+    Each shell command uses its own connection (the protocol dedicates a
+    connection to one service); push and pull reuse one sync connection.
+    The server is started by the adb binary, e.g. by 'adb wait-for-device'.
+    """
+    ADB_SERVER_PORT = 5037
+    TIMEOUT = 10 # max time to connect and to open a service
+    SYNC_DATA_MAX = 64 * 1024
+    INSTALL_DIR = '/data/local/tmp'
+
+    def __init__(self, theSerial, theHost='localhost', thePort=ADB_SERVER_PORT, theTimeout=TIMEOUT, theLogger=Logger()):
+        self.serial = theSerial
+        self.host = theHost
+        self.port = thePort
+        self.timeout = theTimeout
+        self.log = theLogger
+
+        self.lock = threading.Lock()
+        self.syncSocket = None # reused for push and pull
+        self.openSocketSet = set() # sockets of running services, closed by close()
+
+    def close(self):
+        """
+        Closes the sync connection and all running services.
+        Blocked calls in other threads fail with a SERVICE_ERROR.
+        """
+        self.lock.acquire()
+        try:
+            socketList = list(self.openSocketSet)
+            self.openSocketSet.clear()
+            self.syncSocket = None
+        finally:
+            self.lock.release()
+        for aSocket in socketList:
+            self.__closeSocket(aSocket)
+
+    def getVersion(self):
+        """
+        Returns the protocol version of the adb server.
+        """
+        aSocket = self.__connect()
+        try:
+            self.__sendRequest(aSocket, 'host:version')
+            return int(self.__recvExactly(aSocket, int(self.__recvExactly(aSocket, 4), 16)), 16)
+        finally:
+            self.__closeSocket(aSocket)
+
+
+    # ================================================================================
+    # Shell
+    # ================================================================================
+    def shell(self, theCommand):
+        """
+        Runs the command with the shell of the device and returns its output
+        (stdout and stderr).
+        """
+        self.log.debug('Adb shell (%s): %s' % (self.serial, theCommand))
+        aSocket = self.__openService('shell:%s' % theCommand)
+        try:
+            chunkList = []
+            while True:
+                chunk = aSocket.recv(self.SYNC_DATA_MAX)
+                if chunk == '':
+                    break
+                chunkList.append(chunk)
+            return ''.join(chunkList)
+        except socket.error, sockErr:
+            raise AdbClientError('Shell command %s failed: %s' % (theCommand, str(sockErr)), theBaseError=sockErr)
+        finally:
+            self.__closeSocket(aSocket)
+
+    def install(self, theApkFile):
+        """
+        Installs the APK like 'adb install': the APK is pushed to INSTALL_DIR,
+        installed with pm, and removed. Returns the output of pm.
+        """
+        remoteFile = '%s/%s' % (self.INSTALL_DIR, os.path.basename(theApkFile))
+        self.push(theApkFile, remoteFile)
+        try:
+            return self.shell("pm install '%s'" % remoteFile)
+        finally:
+            self.shell("rm '%s'" % remoteFile)
+
+    def uninstall(self, thePackage):
+        """
+        Removes the package like 'adb uninstall'. Returns the output of pm.
+        """
+        return self.shell('pm uninstall %s' % thePackage)
+
+
+    # ================================================================================
+    # Sync
+    # ================================================================================
+    def push(self, theLocalFile, theRemoteFile, theMode=0644):
+        """
+        Copies the local file to the device.
+        """
+        self.log.debug('Adb push (%s): %s -> %s' % (self.serial, theLocalFile, theRemoteFile))
+        localFile = open(theLocalFile, 'rb')
+        try:
+            self.__runSync(self.__push, localFile, theRemoteFile, theMode)
+        finally:
+            localFile.close()
+
+    def pull(self, theRemoteFile, theLocalFile):
+        """
+        Copies the file of the device to the local file.
+        The data is written to a temporary file next to the local file which
+        replaces it when the pull is done, so a failed pull leaves an existing
+        local file untouched and does not create a truncated one.
+        """
+        self.log.debug('Adb pull (%s): %s -> %s' % (self.serial, theRemoteFile, theLocalFile))
+        tmpFileName = '%s.part' % theLocalFile
+        localFile = open(tmpFileName, 'wb')
+        try:
+            try:
+                self.__runSync(self.__pull, theRemoteFile, localFile)
+            finally:
+                localFile.close()
+            os.rename(tmpFileName, theLocalFile)
+        except:
+            if os.path.exists(tmpFileName):
+                os.remove(tmpFileName)
+            raise
+
+    def __runSync(self, theFunc, *theArgs):
+        """
+        Runs a sync request on the sync connection, which is opened if there
+        is none. After errors the connection is not reused. If a reused
+        connection fails (e.g. the emulator was reset), the request is run
+        once more on a new connection.
+        """
+        self.lock.acquire()
+        try:
+            aSocket = self.syncSocket
+            self.syncSocket = None # in use
+        finally:
+            self.lock.release()
+
+        while True:
+            reusedFlag = not aSocket is None
+            if not reusedFlag:
+                aSocket = self.__openService('sync:')
+            try:
+                theFunc(aSocket, *theArgs)
+                break
+            except (socket.error, AdbClientError), err:
+                self.__closeSocket(aSocket)
+                aSocket = None
+                if reusedFlag:
+                    self.log.debug('Reused sync connection failed (%s), reconnect' % str(err))
+                    continue
+                if isinstance(err, AdbClientError):
+                    raise
+                raise AdbClientError('Sync failed: %s' % str(err), theBaseError=err)
+
+        self.lock.acquire()
+        try:
+            if self.syncSocket is None and aSocket in self.openSocketSet:
+                self.syncSocket = aSocket
+                aSocket = None
+        finally:
+            self.lock.release()
+        if not aSocket is None:
+            self.__closeSocket(aSocket)
+
+    def __push(self, theSocket, theLocalFile, theRemoteFile, theMode):
+        theLocalFile.seek(0)
+        self.__sendSyncRequest(theSocket, 'SEND', '%s,%d' % (theRemoteFile, theMode))
+        while True:
+            data = theLocalFile.read(self.SYNC_DATA_MAX)
+            if data == '':
+                break
+            self.__sendSyncRequest(theSocket, 'DATA', data)
+        theSocket.sendall('DONE' + struct.pack('<I', int(time.time())))
+        syncId, length = self.__recvSyncHeader(theSocket)
+        if syncId == 'FAIL':
+            raise AdbClientError('Push to %s failed: %s' % (theRemoteFile, self.__recvExactly(theSocket, length)))
+        if syncId != 'OKAY':
+            raise AdbClientError('Unexpected sync response %s' % repr(syncId))
+
+    def __pull(self, theSocket, theRemoteFile, theLocalFile):
+        theLocalFile.seek(0)
+        theLocalFile.truncate()
+        self.__sendSyncRequest(theSocket, 'RECV', theRemoteFile)
+        while True:
+            syncId, length = self.__recvSyncHeader(theSocket)
+            if syncId == 'DATA':
+                theLocalFile.write(self.__recvExactly(theSocket, length))
+            elif syncId == 'DONE':
+                return
+            elif syncId == 'FAIL':
+                raise AdbClientError('Pull of %s failed: %s' % (theRemoteFile, self.__recvExactly(theSocket, length)))
+            else:
+                raise AdbClientError('Unexpected sync response %s' % repr(syncId))
+
+    def __sendSyncRequest(self, theSocket, theId, theData):
+        theSocket.sendall(theId + struct.pack('<I', len(theData)) + theData)
+
+    def __recvSyncHeader(self, theSocket):
+        return struct.unpack('<4sI', self.__recvExactly(theSocket, 8))
+
+
+    # ================================================================================
+    # Helpers
+    # ================================================================================
+    def __connect(self):
+        try:
+            aSocket = socket.create_connection((self.host, self.port), self.timeout)
+        except socket.error, sockErr:
+            raise AdbClientError('Failed to connect to adb server %s:%d: %s' % (self.host, self.port, str(sockErr)),
+                                 theCode=AdbClientError.CONNECTION_ERROR,
+                                 theBaseError=sockErr)
+        self.lock.acquire()
+        try:
+            self.openSocketSet.add(aSocket)
+        finally:
+            self.lock.release()
+        return aSocket
+
+    def __closeSocket(self, theSocket):
+        self.lock.acquire()
+        try:
+            self.openSocketSet.discard(theSocket)
+        finally:
+            self.lock.release()
+        try:
+            theSocket.shutdown(socket.SHUT_RDWR) # wakes up blocked reads
+        except socket.error:
+            pass
+        theSocket.close()
+
+    def __openService(self, theService):
+        """
+        Returns a connection to the service of the device.
+        """
+        aSocket = self.__connect()
+        try:
+            self.__sendRequest(aSocket, 'host:transport:%s' % self.serial)
+            self.__sendRequest(aSocket, theService)
+        except AdbClientError, adbErr:
+            self.__closeSocket(aSocket)
+            raise AdbClientError(adbErr.value, theCode=AdbClientError.CONNECTION_ERROR, theBaseError=adbErr.baseError)
+        except socket.error, sockErr:
+            self.__closeSocket(aSocket)
+            raise AdbClientError('Failed to open %s: %s' % (theService, str(sockErr)),
+                                 theCode=AdbClientError.CONNECTION_ERROR,
+                                 theBaseError=sockErr)
+        aSocket.settimeout(None) # services like monkey run for a long time
+        return aSocket
+
+    def __sendRequest(self, theSocket, theRequest):
+        """
+        Sends a request (length as 4 hex digits and payload) and reads its
+        OKAY or FAIL status.
+        """
+        theSocket.sendall('%04x%s' % (len(theRequest), theRequest))
+        status = self.__recvExactly(theSocket, 4)
+        if status == 'OKAY':
+            return
+        if status == 'FAIL':
+            message = self.__recvExactly(theSocket, int(self.__recvExactly(theSocket, 4), 16))
+            raise AdbClientError('Request %s failed: %s' % (theRequest, message))
+        raise AdbClientError('Unexpected response %s to request %s' % (repr(status), theRequest))
+
+    def __recvExactly(self, theSocket, theSize):
+        chunkList = []
+        size = 0
+        while size < theSize:
+            chunk = theSocket.recv(theSize - size)
+            if chunk == '':
+                raise AdbClientError('Connection closed by adb server')
+            chunkList.append(chunk)
+            size += len(chunk)
+        return ''.join(chunkList)
+
+
+# ================================================================================
+# Main method
+# ================================================================================
+def main():
+    # Parse options
+    parser = OptionParser(usage='usage: %prog [options] shell <cmd>|push <local> <remote>|pull <remote> <local>|install <apk>', version='%prog 0.1')
+    parser.add_option('-s', '--serial', action='store', type='string', dest='serial', default='emulator-5554',
+                      help='Serial of the device (default: emulator-5554)')
+    parser.add_option('-p', '--port', action='store', type='int', dest='port', default=AdbClient.ADB_SERVER_PORT,
+                      help='Port of the adb server')
+    (options, args) = parser.parse_args()
+    if len(args) < 2:
+        parser.error('Provide a command and its arguments')
+
+    # Run
+    adb = AdbClient(options.serial, thePort=options.port)
+    try:
+        if args[0] == 'shell':
+            print adb.shell(' '.join(args[1:]))
+        elif args[0] == 'push' and len(args) == 3:
+            adb.push(args[1], args[2])
+        elif args[0] == 'pull' and len(args) == 3:
+            adb.pull(args[1], args[2])
+        elif args[0] == 'install':
+            print adb.install(args[1])
+        else:
+            parser.error('Unknown command %s' % args[0])
+    finally:
+        adb.close()
+
+if __name__ == '__main__':
+    main()
@@ -16,11 +16,13 @@
 #
 ################################################################################
 
-from common import Logger, LogLevel, Utils
+from axml_parser import AXMLParser, AXMLParserError
+from common import APK_HASH_CACHE_SUFFIX, Logger, LogLevel, Utils
 from optparse import OptionParser
 
 import copy
 import hashlib
+import json
 import os
 import random
 import subprocess
@@ -41,10 +43,13 @@ class APKWrapperError(Exception):
 # APK Wrapper
 # ================================================================================
 class APKWrapper:
-    def __init__(self, theApkFile, theSdkPath='', theLogger=Logger()):
+    def __init__(self, theApkFile, theSdkPath='', theLogger=Logger(), theHashCacheFlag=True):
         self.apkFile = theApkFile
         self.sdkPath = Utils.addSlashToPath(theSdkPath)
         self.log = theLogger
+        self.hashCacheFlag = theHashCacheFlag
+        self.md5Hash = None # computed on first use
+        self.sha256Hash = None
 
         self.sampleId = random.randint(1, 1000000)
         self.apkFileName = Utils.splitFileIntoDirAndName(theApkFile)[1]
@@ -57,8 +62,7 @@ class APKWrapper:
                          'providerList':[],
                          'uses-permission':[]}
         
-        self.__extractFromPermissions()
-        self.__extractApplication()
+        self.__extractManifest()
 
     def getId(self):
         """
@@ -112,25 +116,67 @@ class APKWrapper:
         """
         Return the MD5 Hash of the APK file.
         """
-        md5 = hashlib.md5()
-        return self.__getHash(md5)
+        if self.md5Hash is None:
+            self.__computeHashes()
+        return self.md5Hash
 
     def getSha256Hash(self):
         """
         Return the SHA256 Hash of the APK file.
         """
-        sha256 = hashlib.sha256()
-        return self.__getHash(sha256)
+        if self.sha256Hash is None:
+            self.__computeHashes()
+        return self.sha256Hash
+
+    def __computeHashes(self):
+        """
+        Computes MD5 and SHA256 in one pass over the APK file. The hashes are
+        stored in <apk>.hashes and reused while path, size, and mtime of
+        the APK file are unchanged.
+        """
+        apk = self.getApk()
+        stat = os.stat(apk)
+        cacheKey = [os.path.abspath(apk), stat.st_size, stat.st_mtime]
+        cacheFileName = apk + APK_HASH_CACHE_SUFFIX
+        if self.hashCacheFlag and os.path.exists(cacheFileName):
+            try:
+                cacheFile = open(cacheFileName, 'r')
+                try:
+                    cache = json.load(cacheFile)
+                finally:
+                    cacheFile.close()
+                if cache['key'] == cacheKey:
+                    self.md5Hash = str(cache['md5'])
+                    self.sha256Hash = str(cache['sha256'])
+                    return
+            except (IOError, ValueError, KeyError, TypeError):
+                pass # hash again and rewrite cache
 
-    def __getHash(self, theAlg):
+        md5 = hashlib.md5()
+        sha256 = hashlib.sha256()
         blockSize = 2**16
-        apkFile = open(self.getApk(), "r")
-        while True:
-            data = apkFile.read(blockSize)
-            if not data:
-                break
-            theAlg.update(data)
-        return theAlg.hexdigest()
+        apkFile = open(apk, 'rb')
+        try:
+            while True:
+                data = apkFile.read(blockSize)
+                if not data:
+                    break
+                md5.update(data)
+                sha256.update(data)
+        finally:
+            apkFile.close()
+        self.md5Hash = md5.hexdigest()
+        self.sha256Hash = sha256.hexdigest()
+
+        if self.hashCacheFlag:
+            try:
+                cacheFile = open(cacheFileName, 'w')
+                try:
+                    json.dump({'key':cacheKey, 'md5':self.md5Hash, 'sha256':self.sha256Hash}, cacheFile)
+                finally:
+                    cacheFile.close()
+            except IOError, ioErr:
+                self.log.debug('Hashes of %s are not cached: %s' % (apk, ioErr))
 
     def getMainActivityName(self):
         """
@@ -176,6 +222,27 @@ class APKWrapper:
                 serviceList.append(service['android:name'])
         return serviceList
 
+    def __extractManifest(self):
+        """
+        Extract package, permissions, and application information from the
+        AndroidManifest.xml in the APK. aapt is only used if it cannot be
+        decoded.
+        """
+        try:
+            axml = AXMLParser(AXMLParser.getManifestData(self.apkFile))
+            package = axml.getPackage()
+            permissionList = axml.getUsesPermissionList()
+            xmlTreeLines = axml.getXmlTreeLines()
+        except AXMLParserError, axmlErr:
+            self.log.debug('Decoding AndroidManifest.xml failed, use aapt: %s' % str(axmlErr))
+            self.__extractFromPermissions()
+            self.__extractApplication()
+            return
+
+        self.package = package
+        self.manifest['uses-permission'].extend(permissionList)
+        self.__extractFromXmlTree(xmlTreeLines)
+
     def __extractFromPermissions(self):
         """
         Extract package and permissions and store them in self.manifest
@@ -221,14 +288,6 @@ class APKWrapper:
         """
         Extract application information and store them in self.manifest
         """
-        # Modes
-        level = self.Level.START
-        mainLevel = self.Level.START
-        subLevel = self.Level.START
-        obj = {}
-        mainObj = {}
-        subObj = {}
-        
         # Run aapt
         try:
             args = ['%saapt' % Utils.getAaptPath(self.sdkPath),
@@ -242,9 +301,21 @@ class APKWrapper:
         except OSError, osErr:
             raise APKWrapperError('Failed to start aapt \'%s\': %s' % (args, osErr.strerror))
         out = aapt.communicate()[0]
-        outLines = out.split('\n')
+        self.__extractFromXmlTree(out.split('\n'))
+
+    def __extractFromXmlTree(self, theLines):
+        """
+        Extract application information out of the lines of 'aapt d xmltree'
+        """
+        # Modes
+        level = self.Level.START
+        mainLevel = self.Level.START
+        subLevel = self.Level.START
+        obj = {}
+        mainObj = {}
+        subObj = {}
 
-        for fullLine in outLines:
+        for fullLine in theLines:
             line = fullLine.lstrip()
             self.log.dev(line)
             if mainLevel == self.Level.START:
@@ -0,0 +1,95 @@
+################################################################################
+#
+# Copyright (c) 2011-2012, Daniel Baeumges (dbaeumges@googlemail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+################################################################################
+
+from common import Logger
+from threading import Thread
+
+import Queue
+
+
+# ================================================================================
+# App Loader
+# ================================================================================
+class AppLoader:
+    """
+    Loads the apps of a list of APK files in several threads (manifest and
+    hashes) and hands them out in the order they are ready.
+    fetchApp is meant as theFetchAppFunc of the RunnerScheduler, so the
+    first apps are analyzed while the others are still loaded.
+    """
+    FETCH_INTERVAL = 1 # poll interval of the scheduler for loaded apps (fetchApp does not wait)
+
+    def __init__(self, theAppNameList, theLoadFunc, theErrorFunc, theNumThreads=4, theLogger=Logger()):
+        """
+        theLoadFunc(theAppName) returns the loaded app (e.g. an APKWrapper).
+        theErrorFunc(theAppName, theError) is called by fetchApp for each app
+        which could not be loaded.
+        """
+        self.loadFunc = theLoadFunc
+        self.errorFunc = theErrorFunc
+        self.numThreads = max(1, min(theNumThreads, len(theAppNameList)))
+        self.log = theLogger
+
+        self.appNameQueue = Queue.Queue()
+        for appName in theAppNameList:
+            self.appNameQueue.put(appName)
+        self.loadedQueue = Queue.Queue()
+        self.numPendingApps = len(theAppNameList)
+        self.threadList = []
+
+    def getNumPendingApps(self):
+        """
+        Returns the number of apps which were not fetched yet.
+        """
+        return self.numPendingApps
+
+    def start(self):
+        for i in xrange(self.numThreads):
+            loaderThread = Thread(target=self.__loadApps)
+            loaderThread.daemon = True
+            loaderThread.start()
+            self.threadList.append(loaderThread)
+
+    def fetchApp(self):
+        """
+        Returns the next loaded app, None if no app is loaded yet, or raises
+        StopIteration if all apps were handed out. Does not block, the
+        scheduler calls it again after its fetch interval.
+        """
+        while self.numPendingApps > 0:
+            try:
+                appName, app, error = self.loadedQueue.get_nowait()
+            except Queue.Empty:
+                return None
+            self.numPendingApps -= 1
+            if error is None:
+                return app
+            self.errorFunc(appName, error)
+        raise StopIteration
+
+    def __loadApps(self):
+        while True:
+            try:
+                appName = self.appNameQueue.get_nowait()
+            except Queue.Empty:
+                return
+            try:
+                self.loadedQueue.put((appName, self.loadFunc(appName), None))
+            except Exception, ex:
+                self.log.debug('App %s could not be load: %s' % (appName, str(ex)))
+                self.loadedQueue.put((appName, None, ex))
@@ -0,0 +1,309 @@
+################################################################################
+#
+# Copyright (c) 2011-2012, Daniel Baeumges (dbaeumges@googlemail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+################################################################################
+
+from optparse import OptionParser
+
+import struct
+import zipfile
+import zlib
+
+
+# ================================================================================
+# AXML Parser Error
+# ================================================================================
+class AXMLParserError(Exception):
+    def __init__(self, theValue):
+        self.value = theValue
+
+    def __str__(self):
+        return repr(self.value)
+
+
+# ================================================================================
+# AXML Chunk and Value Types
+# ================================================================================
+class AXMLChunkEnum:
+    STRING_POOL = 0x0001
+    XML = 0x0003
+    XML_START_NAMESPACE = 0x0100
+    XML_END_NAMESPACE = 0x0101
+    XML_START_ELEMENT = 0x0102
+    XML_END_ELEMENT = 0x0103
+    XML_CDATA = 0x0104
+    XML_RESOURCE_MAP = 0x0180
+
+class AXMLValueEnum:
+    NULL = 0x00
+    REFERENCE = 0x01
+    ATTRIBUTE = 0x02
+    STRING = 0x03
+
+ANDROID_NAMESPACE = 'http://schemas.android.com/apk/res/android'
+STRING_POOL_UTF8_FLAG = 0x100
+
+
+# ================================================================================
+# AXML Parser
+# ================================================================================
+class AXMLParser:
+    """
+    Decodes the binary XML (AXML) of AndroidManifest.xml in an APK without
+    aapt. The tree is dumped in the format of 'aapt d xmltree' so that the
+    APKWrapper manifest parsing is the same for both.
+    Manifests of analyzed apps may be crafted: all sizes, counts, offsets,
+    and string indices are checked and all strings are resolved while
+    parsing, so malformed data only raises an AXMLParserError.
+    """
+    def __init__(self, theData):
+        self.data = theData
+        self.stringList = [] # UTF-8 encoded like the aapt output
+        self.resourceIdList = []
+        self.namespaceDict = {} # uri -> prefix
+        self.nodeList = [] # ('N'|'E', depth, ...) in document order
+
+        try:
+            self.__parse()
+        except (struct.error, IndexError, ValueError), ex:
+            raise AXMLParserError('Malformed AXML: %s' % str(ex))
+
+    @staticmethod
+    def getManifestData(theApkFile):
+        """
+        Returns the binary AndroidManifest.xml of the APK.
+        """
+        try:
+            apk = zipfile.ZipFile(theApkFile, 'r')
+            try:
+                return apk.read('AndroidManifest.xml')
+            finally:
+                apk.close()
+        except (IOError, KeyError, zipfile.BadZipfile, zlib.error, RuntimeError, NotImplementedError), ex:
+            raise AXMLParserError('Failed to read AndroidManifest.xml of %s: %s' % (theApkFile, str(ex)))
+
+    def getXmlTreeLines(self):
+        """
+        Returns the lines 'aapt d xmltree <apk> AndroidManifest.xml' prints.
+        """
+        lines = []
+        for node in self.nodeList:
+            indent = '  ' * node[1]
+            if node[0] == 'N':
+                lines.append('%sN: %s=%s' % (indent, node[2], node[3]))
+            else:
+                lines.append('%sE: %s (line=%d)' % (indent, node[2], node[3]))
+                for attr in node[4]:
+                    lines.append('%s  A: %s' % (indent, self.__getAttributeString(attr)))
+        return lines
+
+    def getPackage(self):
+        """
+        Returns the package attribute of the manifest element.
+        """
+        for node in self.nodeList:
+            if node[0] == 'E' and node[2] == 'manifest':
+                for attr in node[4]:
+                    if attr[0] == 'package':
+                        return self.__getAttributeStringValue(attr)
+        return ''
+
+    def getUsesPermissionList(self):
+        """
+        Returns the android:name of all uses-permission elements.
+        """
+        permissionList = []
+        for node in self.nodeList:
+            if node[0] == 'E' and node[2] == 'uses-permission':
+                for attr in node[4]:
+                    if attr[0] == 'android:name':
+                        permissionList.append(self.__getAttributeStringValue(attr))
+        return permissionList
+
+    def __getString(self, theIndex):
+        if theIndex == 0xffffffff:
+            return None
+        if theIndex >= len(self.stringList):
+            raise AXMLParserError('Invalid string index %d (%d strings)' % (theIndex, len(self.stringList)))
+        return self.stringList[theIndex]
+
+    def __getName(self, theIndex):
+        name = self.__getString(theIndex)
+        if name is None:
+            raise AXMLParserError('Missing name')
+        return name
+
+    def __getAttributeStringValue(self, theAttr):
+        name, resourceId, rawValue, dataType, data = theAttr
+        if dataType == AXMLValueEnum.STRING:
+            return data # resolved by __parseStartElement
+        if rawValue is not None:
+            return rawValue
+        return ''
+
+    def __getAttributeString(self, theAttr):
+        name, resourceId, rawValue, dataType, data = theAttr
+        attrStr = name
+        if resourceId is not None:
+            attrStr += '(0x%08x)' % resourceId
+        if dataType == AXMLValueEnum.NULL:
+            attrStr += '=(null)'
+        elif dataType == AXMLValueEnum.REFERENCE:
+            attrStr += '=@0x%x' % data
+        elif dataType == AXMLValueEnum.ATTRIBUTE:
+            attrStr += '=?0x%x' % data
+        elif dataType == AXMLValueEnum.STRING:
+            attrStr += '="%s"' % data
+        else:
+            attrStr += '=(type 0x%x)0x%x' % (dataType, data)
+        if rawValue is not None:
+            attrStr += ' (Raw: "%s")' % rawValue
+        return attrStr
+
+    def __parse(self):
+        chunkType, headerSize, size = struct.unpack_from('<HHI', self.data, 0)
+        if chunkType != AXMLChunkEnum.XML:
+            raise AXMLParserError('No AXML document (chunk type 0x%x)' % chunkType)
+        end = min(size, len(self.data))
+        offset = headerSize
+        depth = 0
+        while offset + 8 <= end:
+            chunkType, headerSize, size = struct.unpack_from('<HHI', self.data, offset)
+            if size < 8 or headerSize < 8 or headerSize > size or offset + size > end:
+                raise AXMLParserError('Invalid chunk (header size %d, size %d) at %d' % (headerSize, size, offset))
+            if chunkType == AXMLChunkEnum.STRING_POOL:
+                self.__parseStringPool(offset, headerSize, size)
+            elif chunkType == AXMLChunkEnum.XML_RESOURCE_MAP:
+                numIds = (size - headerSize) / 4
+                self.resourceIdList = list(struct.unpack_from('<%dI' % numIds, self.data, offset + headerSize))
+            elif chunkType == AXMLChunkEnum.XML_START_NAMESPACE:
+                self.__checkChunkSize(offset, size, 24)
+                lineNumber, comment, prefix, uri = struct.unpack_from('<IIII', self.data, offset + 8)
+                prefix = self.__getString(prefix)
+                uri = self.__getString(uri)
+                self.namespaceDict[uri] = prefix
+                self.nodeList.append(('N', depth, prefix, uri))
+                depth += 1
+            elif chunkType == AXMLChunkEnum.XML_END_NAMESPACE:
+                depth -= 1
+            elif chunkType == AXMLChunkEnum.XML_START_ELEMENT:
+                self.nodeList.append(self.__parseStartElement(offset, headerSize, size, depth))
+                depth += 1
+            elif chunkType == AXMLChunkEnum.XML_END_ELEMENT:
+                depth -= 1
+            offset += size
+
+    def __checkChunkSize(self, theOffset, theSize, theMinSize):
+        if theSize < theMinSize:
+            raise AXMLParserError('Chunk at %d too small (%d < %d bytes)' % (theOffset, theSize, theMinSize))
+
+    def __parseStringPool(self, theOffset, theHeaderSize, theSize):
+        self.__checkChunkSize(theOffset, theHeaderSize, 28)
+        stringCount, styleCount, flags, stringsStart = struct.unpack_from('<IIII', self.data, theOffset + 8)
+        if theHeaderSize + stringCount * 4 > theSize or stringsStart > theSize:
+            raise AXMLParserError('Invalid string pool (%d strings at %d) at %d' % (stringCount, stringsStart, theOffset))
+        offsetList = struct.unpack_from('<%dI' % stringCount, self.data, theOffset + theHeaderSize)
+        stringsOffset = theOffset + stringsStart
+        end = theOffset + theSize
+        utf8Flag = (flags & STRING_POOL_UTF8_FLAG) != 0
+        self.stringList = []
+        for stringOffset in offsetList:
+            pos = stringsOffset + stringOffset
+            if pos + 2 > end:
+                raise AXMLParserError('String offset %d outside of the string pool at %d' % (stringOffset, theOffset))
+            if utf8Flag:
+                pos = self.__skipUtf8Length(pos) # length in UTF-16 chars
+                length = ord(self.data[pos])
+                pos += 1
+                if length & 0x80:
+                    length = ((length & 0x7f) << 8) | ord(self.data[pos])
+                    pos += 1
+                if pos + length > end:
+                    raise AXMLParserError('String at %d exceeds the string pool at %d' % (pos, theOffset))
+                self.stringList.append(self.data[pos:pos+length])
+            else:
+                length = struct.unpack_from('<H', self.data, pos)[0]
+                pos += 2
+                if length & 0x8000:
+                    length = ((length & 0x7fff) << 16) | struct.unpack_from('<H', self.data, pos)[0]
+                    pos += 2
+                if pos + length * 2 > end:
+                    raise AXMLParserError('String at %d exceeds the string pool at %d' % (pos, theOffset))
+                self.stringList.append(self.data[pos:pos+length*2].decode('utf-16-le').encode('utf-8'))
+
+    def __skipUtf8Length(self, thePos):
+        if ord(self.data[thePos]) & 0x80:
+            return thePos + 2
+        return thePos + 1
+
+    def __parseStartElement(self, theOffset, theHeaderSize, theSize, theDepth):
+        self.__checkChunkSize(theOffset, theSize - theHeaderSize, 20)
+        lineNumber = struct.unpack_from('<I', self.data, theOffset + 8)[0]
+        extOffset = theOffset + theHeaderSize
+        ns, name, attributeStart, attributeSize, attributeCount = struct.unpack_from('<IIHHH', self.data, extOffset)
+        if attributeCount > 0 and (attributeSize < 20 or theHeaderSize + attributeStart + attributeCount * attributeSize > theSize):
+            raise AXMLParserError('Invalid attributes (%d of %d bytes at %d) of element at %d' % (attributeCount, attributeSize, attributeStart, theOffset))
+        elementName = self.__getQualifiedName(ns, name)
+        attrList = []
+        for i in xrange(attributeCount):
+            attrOffset = extOffset + attributeStart + i * attributeSize
+            attrNs, attrName, rawValue, valueSize, res0, dataType, data = struct.unpack_from('<IIIHBBI', self.data, attrOffset)
+            resourceId = None
+            if attrName < len(self.resourceIdList):
+                resourceId = self.resourceIdList[attrName]
+            if dataType == AXMLValueEnum.STRING:
+                data = self.__getString(data)
+            attrList.append((self.__getQualifiedName(attrNs, attrName),
+                             resourceId,
+                             self.__getString(rawValue),
+                             dataType,
+                             data))
+        return ('E', theDepth, elementName, lineNumber, attrList)
+
+    def __getQualifiedName(self, theNs, theName):
+        name = self.__getName(theName)
+        uri = self.__getString(theNs)
+        if uri is None:
+            return name
+        prefix = self.namespaceDict.get(uri)
+        if prefix is None:
+            if uri == ANDROID_NAMESPACE:
+                prefix = 'android'
+            else:
+                prefix = uri
+        return '%s:%s' % (prefix, name)
+
+
+# ================================================================================
+# Main method
+# ================================================================================
+def main():
+    # Parse options
+    parser = OptionParser(usage='usage: %prog [options] apk', version='%prog 0.1')
+    (options, args) = parser.parse_args()
+    if len(args) < 1:
+        parser.error('Provide an APK')
+
+    # Run
+    axml = AXMLParser(AXMLParser.getManifestData(args[0]))
+    print 'package: %s' % axml.getPackage()
+    for permission in axml.getUsesPermissionList():
+        print 'uses-permission: %s' % permission
+    for line in axml.getXmlTreeLines():
+        print line
+
+if __name__ == '__main__':
+    main()
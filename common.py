@@ -190,67 +190,52 @@ class TaintTagEnum:
     TAINT_USER_INPUT    = 0x20000
     TAINT_MEDIA         = 0x40000
 
+    TAINT_STRING_LIST = [(TAINT_LOCATION,      'Location'),
+                         (TAINT_CONTACTS,      'Contact'),
+                         (TAINT_MIC,           'Microphone'),
+                         (TAINT_PHONE_NUMBER,  'Phone Number'),
+                         (TAINT_LOCATION_GPS,  'GPS Location'),
+                         (TAINT_LOCATION_NET,  'Net Location'),
+                         (TAINT_LOCATION_LAST, 'Last Location'),
+                         (TAINT_CAMERA,        'Camera'),
+                         (TAINT_ACCELEROMETER, 'Accelerometer'),
+                         (TAINT_SMS,           'SMS'),
+                         (TAINT_IMEI,          'IMEI'),
+                         (TAINT_IMSI,          'IMSI'),
+                         (TAINT_ICCID,         'ICCID'),
+                         (TAINT_DEVICE_SN,     'Device SN'),
+                         (TAINT_ACCOUNT,       'Account'),
+                         (TAINT_HISTORY,       'History'),
+                         (TAINT_INCOMING_DATA, 'Incoming'),
+                         (TAINT_USER_INPUT,    'UserInput'),
+                         (TAINT_MEDIA,         'Media')]
+    taintStringCache = {} # tag -> taint string
+
+    @staticmethod
+    def getTagInt(theTag):
+        """
+        Returns the tag as integer (TaintDroid logs tags as hex strings).
+        """
+        if isinstance(theTag, basestring):
+            return int(theTag, 16)
+        return theTag
+
     @staticmethod
     def appendTaintTags(theTag1, theTag2):
-        tagInt1 = int(theTag1, 16)
-        tagInt2 = int(theTag2, 16)
-        tagInt = tagInt1 | tagInt2
-        tag = "0x%X" % tagInt
-        return tag
+        return TaintTagEnum.getTagInt(theTag1) | TaintTagEnum.getTagInt(theTag2)
 
     @staticmethod
     def getTaintString(theTag):
+        tagInt = TaintTagEnum.getTagInt(theTag)
         try:
-            tagInt = int(theTag, 16)
-        except TypeError, typeErr:
-            if theTag == 0:
-                tagInt = theTag
-        tagString = str(theTag) + ' ('
+            return TaintTagEnum.taintStringCache[tagInt]
+        except KeyError:
+            pass
         if tagInt == TaintTagEnum.TAINT_CLEAR:
-            tagString += 'No Tag)'
+            tagString = '0x0 (No Tag)'
         else:
-            if tagInt & TaintTagEnum.TAINT_LOCATION:
-                tagString += 'Location, '
-            if tagInt & TaintTagEnum.TAINT_CONTACTS:
-                tagString += 'Contact, '
-            if tagInt & TaintTagEnum.TAINT_MIC:
-                tagString += 'Microphone, '
-            if tagInt & TaintTagEnum.TAINT_PHONE_NUMBER:
-                tagString += 'Phone Number, '
-            if tagInt & TaintTagEnum.TAINT_LOCATION_GPS:
-                tagString += 'GPS Location, '
-            if tagInt & TaintTagEnum.TAINT_LOCATION_NET:
-                tagString += 'Net Location, '
-            if tagInt & TaintTagEnum.TAINT_LOCATION_LAST:
-                tagString += 'Last Location, '
-            if tagInt & TaintTagEnum.TAINT_CAMERA:
-                tagString += 'Camera, '
-            if tagInt & TaintTagEnum.TAINT_ACCELEROMETER:
-                tagString += 'Accelerometer, '
-            if tagInt & TaintTagEnum.TAINT_SMS:
-                tagString += 'SMS, '
-            if tagInt & TaintTagEnum.TAINT_IMEI:
-                tagString += 'IMEI, '
-            if tagInt & TaintTagEnum.TAINT_IMSI:
-                tagString += 'IMSI, '
-            if tagInt & TaintTagEnum.TAINT_ICCID:
-                tagString += 'ICCID, '
-            if tagInt & TaintTagEnum.TAINT_DEVICE_SN:
-                tagString += 'Device SN, '
-            if tagInt & TaintTagEnum.TAINT_ACCOUNT:
-                tagString += 'Account ,'  
-            if tagInt & TaintTagEnum.TAINT_HISTORY:
-                tagString += 'History, '
-            if tagInt & TaintTagEnum.TAINT_INCOMING_DATA:
-                tagString += 'Incoming, '
-            if tagInt & TaintTagEnum.TAINT_USER_INPUT:
-                tagString += 'UserInput, '
-            if tagInt & TaintTagEnum.TAINT_MEDIA:
-                tagString += 'Media, '
-        if tagString[-2:] == ') ':
-            tagString = tagString[:-2]
-        elif tagString[-2:] == ', ':
-            tagString = tagString[:-2] + ')'
+            tagString = '0x%X (%s)' % (tagInt, ', '.join([taintString for taint, taintString in TaintTagEnum.TAINT_STRING_LIST if tagInt & taint]))
+        TaintTagEnum.taintStringCache[tagInt] = tagString
         return tagString
 
     
@@ -292,6 +277,23 @@ class Logger:
         elif theMode == LogMode.ARRAY:
             self.log = ArrayLogFile()
 
+    def __getstate__(self):
+        """
+        Loggers are pickled without their stream (e.g. for multiprocessing),
+        it is reopened by __setstate__.
+        """
+        state = self.__dict__.copy()
+        if self.mode != LogMode.ARRAY:
+            del state['log']
+        return state
+
+    def __setstate__(self, theState):
+        self.__dict__.update(theState)
+        if self.mode == LogMode.DEFAULT:
+            self.log = sys.stdout
+        elif self.mode == LogMode.FILE:
+            self.log = open(self.logFile, 'a')
+
     def getLevel(self):
         return self.level
 
@@ -331,6 +333,8 @@ class Logger:
 # TaintDroid Runner Utils Class
 # ================================================================================
 
+APK_HASH_CACHE_SUFFIX = '.hashes' # hashes of <apk> are cached in <apk>.hashes
+
 class Utils:
     @staticmethod
     def getEmulatorPath(theSdkPath):
@@ -386,6 +390,6 @@ class Utils:
         appList = []
         for root, dirs, files in os.walk(theDir):
             for fileName in files:
-                if fileName.find('.apk') != -1:
+                if fileName.find('.apk') != -1 and not fileName.endswith(APK_HASH_CACHE_SUFFIX):
                     appList.append(os.path.join(root, fileName))
         return appList
@@ -16,13 +16,17 @@
 #
 ################################################################################
 
+from adb_client import AdbClient, AdbClientError
 from emulator_telnet_client import EmulatorTelnetClient
 from common import Logger, TaintLogKeyEnum, Utils
+from threading import Lock, Thread
 
 import os
+import re
 import signal
 import subprocess
 import time
+import traceback
 
 
 # ================================================================================
@@ -38,6 +42,8 @@ class EmulatorClientError(Exception):
     MONKEY_ERROR = 6
     INSTALLATION_ERROR_SYSTEM_NOT_RUNNING = 7
     LOGCAT_REDIRECT_RUNNING = 8
+    BOOT_TIMEOUT_ERROR = 9
+    DEVICE_SESSION_ERROR = 10
     
     def __init__(self, theValue, theCode=GENERAL_ERROR, theBaseError=None):        
         self.value = theValue
@@ -61,6 +67,145 @@ def _overwriteSignalsForProcess():
     """
     os.setpgrp()
 
+
+# ================================================================================
+# Logcat Stream Reader
+# ================================================================================
+class LogcatStreamReader(Thread):
+    """
+    Reads the logcat output of an adb process line by line until the
+    process ends. Each line is written to the log file and handed over to
+    theLineFunc (without line ending).
+    If theLineFunc fails, it is not called anymore but the remaining lines
+    are still written to the log file (and the pipe is drained).
+    """
+    def __init__(self, theProcess, theLogFile, theLineFunc=None, theLogger=Logger()):
+        Thread.__init__(self)
+        self.process = theProcess
+        self.logFile = theLogFile
+        self.lineFunc = theLineFunc
+        self.log = theLogger
+
+        self.numLines = 0
+        self.error = None
+        self.lineFuncLock = Lock()
+        self.daemon = True
+
+    def run(self):
+        try:
+            for line in iter(self.process.stdout.readline, ''):
+                self.logFile.write(line)
+                self.numLines += 1
+                if not self.lineFunc is None:
+                    self.__callLineFunc(line.rstrip('\r\n'))
+        except Exception, ex:
+            self.log.error('Reading logcat stream failed: %s' % str(ex))
+            self.error = ex
+        finally:
+            self.logFile.close()
+
+    def detachLineFunc(self):
+        """
+        Stops handing lines over to theLineFunc. When it returns, theLineFunc
+        is not running and not called anymore.
+        """
+        self.lineFuncLock.acquire()
+        try:
+            self.lineFunc = None
+        finally:
+            self.lineFuncLock.release()
+
+    def __callLineFunc(self, theLine):
+        self.lineFuncLock.acquire()
+        try:
+            if not self.lineFunc is None:
+                self.lineFunc(theLine)
+        except Exception, ex:
+            self.log.error('Handling logcat line %d failed, stop handling lines: %s' % (self.numLines, str(ex)))
+            traceback.print_exc(file=self.log.log)
+            self.lineFunc = None
+            self.error = ex
+        finally:
+            self.lineFuncLock.release()
+
+
+# ================================================================================
+# Device Session
+# ================================================================================
+class DeviceSession:
+    """
+    Queues shell commands for the device and runs them as one script with a
+    single adb shell call (flush). Each command is followed by a marker
+    with its exit status, so the results come back per command.
+    Long running commands like the logcat redirect are not meant for it.
+    """
+    STATUS_MARKER = 'TDROID_EXIT_STATUS:'
+    STATUS_REGEX = re.compile(STATUS_MARKER + '(\\d+)\\r*\\n?')
+    MAX_SCRIPT_LENGTH = 3000 # adb messages carry at most 4096 bytes, longer scripts are split
+
+    def __init__(self, theEmulator, theLogger=Logger()):
+        self.emulator = theEmulator
+        self.log = theLogger
+        self.cmdList = []
+
+    def getNumCommands(self):
+        return len(self.cmdList)
+
+    def addCommand(self, theArgs):
+        """
+        Queues a shell command, the arguments are joined with spaces like
+        adb shell does.
+        """
+        self.cmdList.append(' '.join(theArgs))
+
+    def setProperty(self, theKey, theValue):
+        self.addCommand(['setprop', theKey, theValue])
+
+    def changeGlobalTaintLogState(self, theState, theDoNotFollowFlag=False):
+        self.setProperty(TaintLogKeyEnum.GLOBAL_ACTIVE_KEY, theState)
+        if theDoNotFollowFlag:
+            self.setProperty(TaintLogKeyEnum.GLOBAL_SKIP_LOOKUP_KEY, '1')
+
+    def startService(self, thePackage, theService):
+        self.addCommand(['am', 'startservice', '-n', '%s/%s' % (thePackage, theService)])
+
+    def flush(self):
+        """
+        Runs all queued commands and returns (command, exitStatus, output) for
+        each of them. Raises an EmulatorClientError if commands did not report
+        their exit status (e.g. the shell was killed or a command called exit).
+        """
+        cmdList = self.cmdList
+        self.cmdList = []
+        resultList = []
+        for scriptCmdList in self.__splitScripts(cmdList):
+            script = ' '.join(['%s; echo %s$?;' % (cmd, self.STATUS_MARKER) for cmd in scriptCmdList])
+            output = self.emulator.runAdbCommand(['shell', script])[0]
+            start = 0
+            numResults = 0
+            for cmd, match in zip(scriptCmdList, self.STATUS_REGEX.finditer(output)):
+                resultList.append((cmd, int(match.group(1)), output[start:match.start()]))
+                start = match.end()
+                numResults += 1
+            if numResults < len(scriptCmdList):
+                raise EmulatorClientError('Commands %s did not report their exit status: %s' % (cmdList[len(resultList):], output),
+                                          theCode=EmulatorClientError.DEVICE_SESSION_ERROR)
+        for cmd, status, output in resultList:
+            if status != 0:
+                self.log.debug('Command %s failed with exit status %d: %s' % (cmd, status, output))
+        return resultList
+
+    def __splitScripts(self, theCmdList):
+        scriptList = []
+        length = 0
+        for cmd in theCmdList:
+            if len(scriptList) == 0 or length + len(cmd) > self.MAX_SCRIPT_LENGTH:
+                scriptList.append([])
+                length = 0
+            scriptList[-1].append(cmd)
+            length += len(cmd) + len(self.STATUS_MARKER) + 12 # '; echo $?;' and separator
+        return scriptList
+
         
 # ================================================================================
 # Emulator Client
@@ -71,6 +216,9 @@ class EmulatorClient:
                        theImageDirPath='',
                        theRunHeadlessFlag=False,
                        theAvdName=None,
+                       theBootTimeout=300,
+                       theSnapshotStorage=None,
+                       theAdbServerFlag=True,
                        theLogger=Logger()):
         self.sdkPath = Utils.addSlashToPath(theSdkPath)
         self.port = thePort
@@ -82,14 +230,29 @@ class EmulatorClient:
 
         self.emulator = None
 
+        self.bootTimeout = theBootTimeout
+        self.bootTimes = {}
+
+        self.snapshotStorage = theSnapshotStorage
+
         self.logcatRedirectFile = ''
         self.logcatRedirectProcess = None
 
+        self.logcatStreamProcess = None
+        self.logcatStreamReader = None
+
         self.adbProcess = None
+        self.adbClient = None # talks to the adb server, see runAdbCommand
+        if theAdbServerFlag:
+            self.adbClient = AdbClient('emulator-%s' % str(self.port), theLogger=self.log)
+
+        self.telnetClient = None # console session, see getTelnetClient
 
     def __del__(self):
         if not self.logcatRedirectProcess is None:
             self.logcatRedirectProcess.kill()
+        if not self.logcatStreamProcess is None:
+            self.logcatStreamProcess.kill()
         if not self.adbProcess is None:
             self.adbProcess.kill()
         if not self.emulator is None:
@@ -111,6 +274,10 @@ class EmulatorClient:
             args.extend(['-data',    '%suserdata.img' % self.imageDirPath])
             args.extend(['-port',    str(self.port)])
             args.extend(['-no-boot-anim'])
+            if self.snapshotStorage is not None:
+                # Snapshots are only saved and loaded on demand (see EmulatorPool)
+                args.extend(['-snapstorage', self.snapshotStorage])
+                args.extend(['-no-snapshot-load', '-no-snapshot-save'])
             if self.runHeadless:
                 args.extend(['-no-window'])
             self.log.debug('- args: %s' % args)
@@ -127,13 +294,82 @@ class EmulatorClient:
         #    print self.emulator.communicate()
         
         # Wait until started
+        startTime = time.time()
+        self.bootTimes = {}
         self.runAdbCommand(['wait-for-device'])
+        self.bootTimes['waitForDevice'] = time.time() - startTime
 
         # Set portable mode
         self.runAdbCommand(['shell', 'setprop', 'dalvik.vm.execution-mode', 'int:portable'])
         
-        # Wait
-        time.sleep(60)
+        # Wait until booted
+        self.waitForBoot(startTime)
+
+    def waitForBoot(self, theStartTime=None):
+        """
+        Polls the boot state of the emulator until the system is ready.
+        The boot is finished if sys.boot_completed is set, the boot animation
+        is stopped, and the package manager is available. Between two polls
+        the wait time is increased (1sec up to 8sec).
+        The wait times of the single steps are stored in self.bootTimes.
+        """
+        startTime = theStartTime
+        if startTime is None:
+            startTime = time.time()
+        stepList = [('bootCompleted', self._isBootCompleted),
+                    ('bootAnimationStopped', self._isBootAnimationStopped),
+                    ('packageManagerReady', self._isPackageManagerReady)]
+        waitTime = 1.0
+        numPolls = 0
+        for stepName, stepCheck in stepList:
+            while True:
+                numPolls += 1
+                if stepCheck():
+                    self.bootTimes[stepName] = time.time() - startTime
+                    self.log.debug('Boot step %s reached after %.1fsec' % (stepName, self.bootTimes[stepName]))
+                    break
+                if time.time() - startTime > self.bootTimeout:
+                    self.bootTimes['total'] = time.time() - startTime
+                    self.bootTimes['numPolls'] = numPolls
+                    raise EmulatorClientError('Emulator not booted within %dsec (step: %s)' % (self.bootTimeout, stepName),
+                                              theCode=EmulatorClientError.BOOT_TIMEOUT_ERROR)
+                time.sleep(waitTime)
+                waitTime = min(waitTime * 1.5, 8.0)
+        self.bootTimes['total'] = time.time() - startTime
+        self.bootTimes['numPolls'] = numPolls
+        self.log.info('Emulator booted after %.1fsec' % self.bootTimes['total'])
+
+    def getBootTimes(self):
+        """
+        Returns the wait times (in seconds) of the last boot.
+        """
+        return self.bootTimes
+
+    def _getShellOutput(self, theArgs):
+        """
+        Runs a shell command and returns its stripped output.
+        """
+        try:
+            return self.runAdbCommand(['shell'] + theArgs)[0].strip()
+        except EmulatorClientError, ecErr:
+            self.log.debug('Shell command %s failed: %s' % (theArgs, str(ecErr)))
+            return ''
+
+    def _isBootCompleted(self):
+        return self._getShellOutput(['getprop', 'sys.boot_completed']) == '1'
+
+    def _isBootAnimationStopped(self):
+        # Not set at all if the emulator is started with -no-boot-anim
+        return self._getShellOutput(['getprop', 'init.svc.bootanim']) in ['', 'stopped']
+
+    def _isPackageManagerReady(self):
+        return self._getShellOutput(['pm', 'path', 'android']).startswith('package:')
+
+    def isRunning(self):
+        """
+        Returns if the emulator process is (still) running
+        """
+        return not self.emulator is None and self.emulator.poll() is None
 
     def stop(self):
         """
@@ -141,6 +377,9 @@ class EmulatorClient:
         """
         if self.emulator is None:
             raise EmulatorClientError('Emulator not startet')
+        self.closeTelnetClient()
+        if not self.adbClient is None:
+            self.adbClient.close()
         self.emulator.terminate()
         self.emulator = None
 
@@ -155,18 +394,44 @@ class EmulatorClient:
             self.logcatRedirectProcess.kill()
             self.logcatRedirectProcess = None
 
+        if not self.logcatStreamProcess is None:
+            self.logcatStreamProcess.kill()
+            self.logcatStreamProcess = None
+
         if not self.adbProcess is None:
             self.adbProcess.kill()
             self.adbProcess = None
 
+        if not self.adbClient is None:
+            self.adbClient.close() # aborts running commands
+        self.closeTelnetClient()
         self.emulator.kill()
         self.emulator = None
 
+    def createDeviceSession(self):
+        """
+        Returns a DeviceSession which runs queued shell commands with one
+        adb shell call.
+        """
+        return DeviceSession(self, theLogger=self.log)
+
     def getTelnetClient(self):
         """
-        Returns an instance of the EmulatorTelnetClient for the started emulator
+        Returns the EmulatorTelnetClient for the started emulator.
+        The client and its console session are kept until the emulator is
+        stopped or killed.
         """
-        return EmulatorTelnetClient(thePort=self.port, theLogger=self.log)
+        if self.telnetClient is None:
+            self.telnetClient = EmulatorTelnetClient(thePort=self.port, theLogger=self.log)
+        return self.telnetClient
+
+    def closeTelnetClient(self):
+        """
+        Closes the console session of the telnet client (if any)
+        """
+        if not self.telnetClient is None:
+            self.telnetClient.close()
+            self.telnetClient = None
 
     def setProperty(self, theKey, theValue):
         """
@@ -339,10 +604,115 @@ class EmulatorClient:
         self.log.debug('Store logcat redirect file, logFile: %s, targetFile: %s' % (logFile, theTargetFile))
         self.runAdbCommand(['pull', logFile, theTargetFile])
 
+    def startLogcatStream(self, theTargetFile, theLineFunc=None):
+        """
+        Start reading the logcat output live via adb.
+        All lines are stored in the target file and handed over to
+        theLineFunc while the app is running. In contrast to the logcat
+        redirect the output is not limited by the ring buffer on the device.
+        """
+        self.log.debug('Start logcat stream, targetFile: %s' % theTargetFile)
+        if not self.logcatStreamProcess is None:
+            self.stopLogcatStream()
+
+        try:
+            args = ['%sadb' % Utils.getAdbPath(self.sdkPath), '-s', 'emulator-%s' % str(self.port),
+                    'logcat', '-v', 'thread']
+            self.logcatStreamProcess = subprocess.Popen(args,
+                                                        stdout=subprocess.PIPE,
+                                                        stdin=subprocess.PIPE,
+                                                        stderr=subprocess.PIPE,
+                                                        preexec_fn=_overwriteSignalsForProcess)
+        except OSError, osErr:
+            raise EmulatorClientError('Failed to run adb command \'%s\': %s' % (args, osErr.strerror),
+                                      theCode=EmulatorClientError.ADB_RUN_ERROR,
+                                      theBaseError=osErr)
+
+        self.logcatStreamReader = LogcatStreamReader(self.logcatStreamProcess,
+                                                     open(theTargetFile, 'w'),
+                                                     theLineFunc,
+                                                     theLogger=self.log)
+        self.logcatStreamReader.start()
+
+    def stopLogcatStream(self, theTimeout=30):
+        """
+        Stop reading the logcat output.
+        Lines still buffered in the pipe are read before returning. If this
+        takes longer than theTimeout, theLineFunc is detached and an
+        EmulatorClientError is raised.
+        """
+        self.log.debug('End logcat stream')
+        if not self.logcatStreamProcess is None:
+            try:
+                self.logcatStreamProcess.terminate()
+            except OSError, osErr:
+                self.log.debug('Terminating logcat stream failed: %s' % osErr.strerror)
+            self.logcatStreamProcess = None
+        if not self.logcatStreamReader is None:
+            self.logcatStreamReader.join(theTimeout)
+            if self.logcatStreamReader.isAlive():
+                # Lines handed over now would change the log entries while
+                # they are post processed
+                self.logcatStreamReader.detachLineFunc()
+                numLines = self.logcatStreamReader.numLines
+                self.logcatStreamReader = None
+                raise EmulatorClientError('Logcat stream not finished within %dsec, only the first %d lines were handled' % (theTimeout, numLines))
+            self.log.debug('Logcat stream finished after %d lines' % self.logcatStreamReader.numLines)
+            error = self.logcatStreamReader.error
+            self.logcatStreamReader = None
+            if not error is None:
+                raise EmulatorClientError('Failed to read logcat stream: %s' % str(error),
+                                          theBaseError=error)
+
+    def _runAdbClientCommand(self, theArgs):
+        """
+        Runs the adb command via the adb server. Returns None if the command
+        is not supported by AdbClient. Arguments of shell commands are joined
+        with spaces like adb does.
+        """
+        command = theArgs[0]
+        if command == 'shell' and len(theArgs) > 1:
+            return (self.adbClient.shell(' '.join(theArgs[1:])), '')
+        if command == 'logcat':
+            return (self.adbClient.shell(' '.join(theArgs)), '')
+        if command == 'install' and len(theArgs) == 2:
+            return (self.adbClient.install(theArgs[1]), '')
+        if command == 'uninstall' and len(theArgs) == 2:
+            return (self.adbClient.uninstall(theArgs[1]), '')
+        if command == 'push' and len(theArgs) == 3:
+            self.adbClient.push(theArgs[1], theArgs[2])
+            return ('', '')
+        if command == 'pull' and len(theArgs) == 3:
+            localFile = theArgs[2]
+            if os.path.isdir(localFile):
+                localFile = os.path.join(localFile, os.path.basename(theArgs[1]))
+            self.adbClient.pull(theArgs[1], localFile)
+            return ('', '')
+        return None
+
     def runAdbCommand(self, theArgs):
         """
-        Runs a simple adb command
+        Runs a simple adb command.
+        shell, logcat, install, uninstall, push, and pull are run via the adb
+        server (AdbClient) without starting adb; the adb binary is used for
+        other commands and if the server cannot be reached.
+        Returns (stdout, stderr) in both cases.
         """
+        if not self.adbClient is None:
+            try:
+                retval = self._runAdbClientCommand(theArgs)
+                if not retval is None:
+                    self.log.debug('Result: %s' % str(retval))
+                    return retval
+            except AdbClientError, adbErr:
+                if adbErr.getCode() != AdbClientError.CONNECTION_ERROR:
+                    self.log.debug('Adb command %s failed: %s' % (theArgs, adbErr.value))
+                    return ('', adbErr.value)
+                self.log.debug('Adb server not usable (%s), run adb' % adbErr.value)
+            except IOError, ioErr:
+                self.log.debug('Adb command %s failed: %s' % (theArgs, str(ioErr)))
+                return ('', str(ioErr))
+
         args = ['%sadb' % Utils.getAdbPath(self.sdkPath), '-s', 'emulator-%s' % str(self.port)]
         args.extend(theArgs)
         self.log.debug('Exec adb command: %s' % args)
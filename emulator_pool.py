@@ -0,0 +1,257 @@
+################################################################################
+#
+# Copyright (c) 2011-2012, Daniel Baeumges (dbaeumges@googlemail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+################################################################################
+
+from common import Logger, Utils
+from emulator_client import EmulatorClient, EmulatorClientError
+from emulator_telnet_client import EmulatorTelnetClientError
+from image_provisioner import ImageProvisioner, ImageProvisionMode
+
+import os
+import shutil
+import time
+
+
+# ================================================================================
+# Emulator Pool Enums
+# ================================================================================
+class EmulatorResetMode:
+    SNAPSHOT = 1 # load snapshot taken after the first boot
+    RESTORE  = 2 # restore userdata.img and sdcard.img and reboot
+
+    @staticmethod
+    def getModeFromString(theStr):
+        if theStr == 'snapshot':
+            return EmulatorResetMode.SNAPSHOT
+        elif theStr == 'restore':
+            return EmulatorResetMode.RESTORE
+        else:
+            raise ValueError('Invalid emulator reset mode: %s' % theStr)
+
+
+# ================================================================================
+# Emulator Pool Error
+# ================================================================================
+class EmulatorPoolError(Exception):
+    def __init__(self, theValue):
+        self.value = theValue
+
+    def __str__(self):
+        return repr(self.value)
+
+
+# ================================================================================
+# Emulator Pool
+# ================================================================================
+class EmulatorPool:
+    """
+    Pool of long-lived emulators, one per port slot.
+    A slot is leased by one runner thread at a time. Before an emulator is
+    handed out again it is brought back into the clean state of its first
+    boot. If an emulator died or was killed it is cold booted again.
+    """
+    SNAPSHOT_NAME = 'tdroid_clean'
+
+    def __init__(self, theNumSlots,
+                       theImageDirPath,
+                       theStartPort=5554,
+                       theSdkPath='',
+                       theAvdName=None,
+                       theRunHeadlessFlag=False,
+                       theBootTimeout=300,
+                       theResetMode=EmulatorResetMode.SNAPSHOT,
+                       theProvisionMode=ImageProvisionMode.SHARED,
+                       theAdbServerFlag=True,
+                       theLogger=Logger()):
+        self.imageDirPath = theImageDirPath
+        self.startPort = theStartPort
+        self.sdkPath = Utils.addSlashToPath(theSdkPath)
+        self.avdName = theAvdName
+        self.runHeadless = theRunHeadlessFlag
+        self.bootTimeout = theBootTimeout
+        self.resetMode = theResetMode
+        self.useAdbServer = theAdbServerFlag
+        self.log = theLogger
+
+        self.provisioner = ImageProvisioner(theImageDirPath, theProvisionMode, theLogger=theLogger)
+
+        self.slotList = []
+        for i in xrange(theNumSlots):
+            self.slotList.append({'port' : self.startPort + (i*2),
+                                  'imageDirPath' : None,
+                                  'emulator' : None,
+                                  'dirtyFlag' : False,
+                                  'numLeases' : 0})
+
+    def getImageDirPath(self, theSlot):
+        """
+        Returns the image directory of the slot (None before the first lease).
+        """
+        return self.slotList[theSlot]['imageDirPath']
+
+    def lease(self, theSlot, theLogger=None):
+        """
+        Returns a booted emulator in clean state for the provided slot
+        together with a dict containing the wait times of the lease.
+        """
+        slot = self.slotList[theSlot]
+        logger = theLogger
+        if logger is None:
+            logger = self.log
+        leaseTimes = {'coldBoot' : False,
+                      'imageProvisioning' : None}
+        startTime = time.time()
+
+        if slot['emulator'] is None or not slot['emulator'].isRunning():
+            leaseTimes['coldBoot'] = True
+            leaseTimes['imageProvisioning'] = self.__coldBoot(slot, logger)
+        else:
+            slot['emulator'].log = logger
+            if slot['dirtyFlag']:
+                try:
+                    leaseTimes['imageProvisioning'] = self.__reset(slot)
+                except (EmulatorClientError, EmulatorTelnetClientError), err:
+                    logger.error('Reset of emulator on port %d failed, cold boot: %s' % (slot['port'], str(err)))
+                    self.__kill(slot)
+                    leaseTimes['coldBoot'] = True
+                    leaseTimes['imageProvisioning'] = self.__coldBoot(slot, logger)
+
+        slot['dirtyFlag'] = True
+        slot['numLeases'] += 1
+        leaseTimes['total'] = time.time() - startTime
+        logger.info('Leased emulator on port %d after %.1fsec (cold boot: %s)' % (slot['port'], leaseTimes['total'], leaseTimes['coldBoot']))
+        return slot['emulator'], leaseTimes
+
+    def release(self, theSlot, theEmulator, theBrokenFlag=False):
+        """
+        Gives the emulator back to the pool.
+        Broken emulators are killed and cold booted with the next lease.
+        Emulators which were already replaced (e.g. after a thread was
+        canceled and the slot was leased again) are ignored.
+        """
+        slot = self.slotList[theSlot]
+        if not slot['emulator'] is theEmulator:
+            return
+        if theBrokenFlag:
+            self.__kill(slot)
+        else:
+            slot['emulator'].log = self.log
+
+    def shutdown(self, theCleanUpImageDirFlag=True):
+        """
+        Stops all emulators and removes the image directories.
+        """
+        for slot in self.slotList:
+            self.__kill(slot)
+            if theCleanUpImageDirFlag and not slot['imageDirPath'] is None:
+                shutil.rmtree(slot['imageDirPath'], True)
+                slot['imageDirPath'] = None
+
+    def __coldBoot(self, theSlot, theLogger):
+        """
+        Builds the image directory (first lease only) and boots the emulator.
+        Returns the image provisioning stats.
+        """
+        self.provisioner.log = theLogger
+        if theSlot['imageDirPath'] is None:
+            theSlot['imageDirPath'], provisionStats = self.__initImageDir(theSlot['port'], theLogger)
+        else:
+            theLogger.info('Restore writable images in %s' % theSlot['imageDirPath'])
+            provisionStats = self.provisioner.restoreWritableImages(theSlot['imageDirPath'])
+
+        snapshotStorage = None
+        if self.resetMode == EmulatorResetMode.SNAPSHOT:
+            snapshotStorage = os.path.join(theSlot['imageDirPath'], 'snapshots.img')
+
+        theSlot['emulator'] = EmulatorClient(theSdkPath=self.sdkPath,
+                                             thePort=theSlot['port'],
+                                             theImageDirPath=theSlot['imageDirPath'],
+                                             theAvdName=self.avdName,
+                                             theRunHeadlessFlag=self.runHeadless,
+                                             theBootTimeout=self.bootTimeout,
+                                             theSnapshotStorage=snapshotStorage,
+                                             theAdbServerFlag=self.useAdbServer,
+                                             theLogger=theLogger)
+        theSlot['emulator'].start()
+        theSlot['dirtyFlag'] = False
+
+        if self.resetMode == EmulatorResetMode.SNAPSHOT:
+            theLogger.debug('Save snapshot %s of emulator on port %d' % (self.SNAPSHOT_NAME, theSlot['port']))
+            theSlot['emulator'].getTelnetClient().saveSnapshot(self.SNAPSHOT_NAME)
+        return provisionStats
+
+    def __reset(self, theSlot):
+        """
+        Brings a running emulator back into the clean state.
+        Returns the image provisioning stats (None if no images were touched).
+        """
+        emulator = theSlot['emulator']
+        if self.resetMode == EmulatorResetMode.SNAPSHOT:
+            emulator.log.info('Load snapshot %s of emulator on port %d' % (self.SNAPSHOT_NAME, theSlot['port']))
+            emulator.getTelnetClient().loadSnapshot(self.SNAPSHOT_NAME)
+            emulator.runAdbCommand(['wait-for-device'])
+            emulator.waitForBoot()
+            return None
+        else: # self.resetMode == EmulatorResetMode.RESTORE
+            logger = emulator.log
+            self.__kill(theSlot)
+            return self.__coldBoot(theSlot, logger)
+
+    def __kill(self, theSlot):
+        """
+        Kills the emulator of the slot if it is still running.
+        """
+        if not theSlot['emulator'] is None:
+            try:
+                if theSlot['emulator'].isRunning():
+                    theSlot['emulator'].killRun()
+            except EmulatorClientError, ecErr:
+                self.log.debug('Kill of emulator on port %d failed: %s' % (theSlot['port'], str(ecErr)))
+            theSlot['emulator'] = None
+
+    def __initImageDir(self, thePort, theLogger):
+        """
+        Build a new directory with clean images for a slot.
+        """
+        newPath = '/tmp/tdroid_pool_%d' % thePort
+        if os.path.exists(newPath):
+            i = 1
+            while True:
+                newPath = '/tmp/tdroid_pool_%d_%02d' % (thePort, i)
+                if os.path.exists(newPath):
+                    i += 1
+                else:
+                    break
+
+        theLogger.info('Create pool image dir: %s' % newPath)
+        os.mkdir(newPath)
+        provisionStats = self.provisioner.provision(newPath)
+
+        if self.resetMode == EmulatorResetMode.SNAPSHOT:
+            shutil.copy2(self.__getSnapshotTemplate(), os.path.join(newPath, 'snapshots.img'))
+        return newPath, provisionStats
+
+    def __getSnapshotTemplate(self):
+        """
+        Returns the empty snapshot storage image, either from the image
+        directory or from the SDK.
+        """
+        for snapshotTemplate in [os.path.join(self.imageDirPath, 'snapshots.img'),
+                                 '%slib/emulator/snapshots.img' % Utils.getEmulatorPath(self.sdkPath)]:
+            if os.path.exists(snapshotTemplate):
+                return snapshotTemplate
+        raise EmulatorPoolError('No snapshots.img found in image dir or SDK, use reset mode restore')
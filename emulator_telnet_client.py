@@ -18,7 +18,10 @@
 
 from common import Logger
 
+import re
+import socket
 import telnetlib
+import threading
 
 
 # ================================================================================
@@ -92,15 +95,52 @@ class BatteryHealthState:
             return True
         return False
 
+# ================================================================================
+# Console Responses
+# ================================================================================
+# Each response of the console ends with a line 'OK' or 'KO: <message>'.
+# One regex for both, so the earliest terminator wins (expect tries a list
+# of regexes in order and would skip a KO in front of a later OK)
+RESPONSE_END_REGEX = re.compile('^(?:(OK)|KO:? ?(.*?))\r?\n', re.M)
+
+
 # ================================================================================
 # Emulator Telnet Client
 # ================================================================================ 
 class EmulatorTelnetClient:
-    def __init__(self, theHost='localhost', thePort=5554, theLogger=Logger()):        
+    """
+    Keeps one console session to the emulator open for all commands instead
+    of connecting for each command. Responses are framed by their final OK
+    or KO line, so several commands can be sent at once (runCommandList).
+    A lost session is reopened automatically.
+    """
+    TIMEOUT = 30 # max time to wait for the connection or a response
+
+    def __init__(self, theHost='localhost', thePort=5554, theLogger=Logger(), theTimeout=TIMEOUT):        
         self.host = theHost
         self.port = thePort
         self.log = theLogger
-        self.tn = telnetlib.Telnet()
+        self.timeout = theTimeout
+        self.tn = None # open console session
+        self.lock = threading.Lock()
+
+    def __del__(self):
+        self.__closeSession()
+
+    def close(self):
+        """
+        Closes the console session. It is reopened by the next command.
+        """
+        self.lock.acquire()
+        try:
+            if not self.tn is None:
+                try:
+                    self.tn.write('quit\n')
+                except socket.error:
+                    pass
+            self.__closeSession()
+        finally:
+            self.lock.release()
 
 
     # ================================================================================
@@ -173,7 +213,16 @@ class EmulatorTelnetClient:
         'sms send <phonenumber> <message>'
         Simulate new inbound SMS message.
         """
-        self.__runCommand('sms send %s %s' % (str(thePhoneNumber), theMessage))
+        self.__runCommand(self.__getSmsCommand(thePhoneNumber, theMessage))
+
+    def sendSmsList(self, thePhoneNumber, theMessageList):
+        """
+        Sends all messages with one batch of 'sms send' commands.
+        """
+        self.runCommandList([self.__getSmsCommand(thePhoneNumber, message) for message in theMessageList])
+
+    def __getSmsCommand(self, thePhoneNumber, theMessage):
+        return 'sms send %s %s' % (str(thePhoneNumber), theMessage)
 
 
     # ================================================================================
@@ -196,7 +245,17 @@ class EmulatorTelnetClient:
         <latitude>    latitude, in decimal degrees
         <altitude>    optional altitude in meters
         """
-        self.__runCommand('geo fix %s %s %s' % (str(theLongitude), str(theLatitude), str(theAltitude)))
+        self.__runCommand(self.__getLocationCommand(theLongitude, theLatitude, theAltitude))
+
+    def changeLocationList(self, theLocationList):
+        """
+        Sends a route of (longitude, latitude[, altitude]) fixes with one
+        batch of 'geo fix' commands.
+        """
+        self.runCommandList([self.__getLocationCommand(*location) for location in theLocationList])
+
+    def __getLocationCommand(self, theLongitude, theLatitude, theAltitude=''):
+        return 'geo fix %s %s %s' % (str(theLongitude), str(theLatitude), str(theAltitude))
 
         
     # ================================================================================
@@ -236,24 +295,94 @@ class EmulatorTelnetClient:
         self.__runCommand('power capacity %d' % capacity)
 
 
+    # ================================================================================
+    # Snapshots
+    # ================================================================================
+    def saveSnapshot(self, theName):
+        """
+        'avd snapshot save <name>'
+        Save the current state of the emulator in the snapshot storage.
+        """
+        self.__runCommand('avd snapshot save %s' % theName)
+
+    def loadSnapshot(self, theName):
+        """
+        'avd snapshot load <name>'
+        Restore the state of the emulator from the snapshot storage.
+        """
+        self.__runCommand('avd snapshot load %s' % theName)
+
+
     # ================================================================================
     # Helpers
     # ================================================================================
+    def runCommandList(self, theCmdList):
+        """
+        Sends the commands at once and reads their responses afterwards.
+        Returns the output of each command. If commands fail, an
+        EmulatorTelnetClientError is raised after all responses are read.
+        If the session was lost before any response was read, it is reopened
+        and the commands are sent again once.
+        """
+        if len(theCmdList) == 0:
+            return []
+        self.lock.acquire()
+        try:
+            for attempt in xrange(2):
+                responseList = []
+                try:
+                    if self.tn is None:
+                        self.__openSession()
+                    self.log.debug('Commands to sent: %s\n' % theCmdList)
+                    self.tn.write(''.join(['%s\n' % cmd for cmd in theCmdList]))
+                    for cmd in theCmdList:
+                        responseList.append(self.__readResponse(cmd))
+                    break
+                except (EOFError, socket.error), err:
+                    self.__closeSession()
+                    if attempt > 0 or len(responseList) > 0:
+                        raise EmulatorTelnetClientError('Failed to run commands %s: %s' % (theCmdList, str(err)))
+                    self.log.debug('Console session lost (%s), reconnect' % str(err))
+        finally:
+            self.lock.release()
+
+        failedCmdList = []
+        for cmd, (okFlag, output) in zip(theCmdList, responseList):
+            if not okFlag:
+                failedCmdList.append('%s (%s)' % (cmd, output))
+        if len(failedCmdList) == 1 and len(theCmdList) == 1:
+            raise EmulatorTelnetClientError('Failed to run command %s' % failedCmdList[0])
+        if len(failedCmdList) > 0:
+            raise EmulatorTelnetClientError('Failed to run commands %s' % failedCmdList)
+        return [output for okFlag, output in responseList]
+
     def __runCommand(self, theCmd):
-        self.tn.open(self.host, self.port)
-        self.log.debug('Command to sent: %s\n' % theCmd)
-        self.tn.write('%s\n' % theCmd)
-        self.tn.write('exit\n')
-        aTnOutStr = self.tn.read_all()
-        self.tn.close()
-        self.log.debug('Command out:\n%s' % aTnOutStr)
-        aTnOutLineVec = aTnOutStr.rsplit('\n', 2)
-        if aTnOutLineVec[2] == '':
-            if aTnOutLineVec[1].startswith('OK'):
-                pass
-            else:
-                raise EmulatorTelnetClientError('Failed to run command %s' % theCmd)
-        elif aTnOutLineVec[2].startswith('OK'):
-            pass
-        else:
-            raise EmulatorTelnetClientError('Failed to run command %s' % theCmd)        
+        return self.runCommandList([theCmd])[0]
+
+    def __openSession(self):
+        self.log.debug('Open console session on %s:%d' % (self.host, self.port))
+        self.tn = telnetlib.Telnet(self.host, self.port, self.timeout)
+        okFlag, output = self.__readResponse('connect') # banner
+        if not okFlag:
+            self.__closeSession()
+            raise EmulatorTelnetClientError('Failed to open console session: %s' % output)
+
+    def __closeSession(self):
+        if not self.tn is None:
+            self.tn.close()
+            self.tn = None
+
+    def __readResponse(self, theCmd):
+        """
+        Reads the response of one command. Returns (okFlag, output), the
+        output is the message for KO responses.
+        """
+        index, match, text = self.tn.expect([RESPONSE_END_REGEX], self.timeout)
+        if index == -1:
+            # Responses of later commands cannot be assigned anymore
+            self.__closeSession()
+            raise EmulatorTelnetClientError('No response to command %s within %dsec' % (theCmd, self.timeout))
+        self.log.debug('Command out:\n%s' % text)
+        if not match.group(1) is None:
+            return (True, text[:match.start()])
+        return (False, match.group(2))
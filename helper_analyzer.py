@@ -6,11 +6,126 @@ from taintlog_json import *
 from optparse import OptionParser
 
 import copy
+import cPickle
 import datetime
+import hashlib
+import itertools
+import multiprocessing
 import os
 import shutil
 
 
+# ================================================================================
+# Log Cache
+# ================================================================================
+
+LOG_CACHE_SUFFIX = '.cache'
+LOG_CACHE_VERSION = 1
+
+def getLogCacheFileName(theLogcatFile):
+    return theLogcatFile + LOG_CACHE_SUFFIX
+
+def getFileMd5Hash(theFile):
+    md5 = hashlib.md5()
+    blockSize = 2**16
+    hashFile = open(theFile, 'rb')
+    try:
+        while True:
+            data = hashFile.read(blockSize)
+            if not data:
+                break
+            md5.update(data)
+    finally:
+        hashFile.close()
+    return md5.hexdigest()
+
+def loadLogCache(theLogcatFile):
+    """
+    Return analyzer with the cached post-processed log entries of the logcat file.
+    Returns None if there is no cache or if it does not match the logcat file
+    (path, size, mtime and MD5 hash), e.g. because the logcat file was replaced.
+    """
+    cacheFileName = getLogCacheFileName(theLogcatFile)
+    if not os.path.exists(cacheFileName):
+        return None
+    try:
+        cacheFile = open(cacheFileName, 'rb')
+        try:
+            cache = cPickle.load(cacheFile)
+        finally:
+            cacheFile.close()
+    except Exception:
+        return None # broken or written by an incompatible version
+    if not isinstance(cache, dict) or cache.get('version') != LOG_CACHE_VERSION:
+        return None
+
+    # Cheap checks first, hash only if they match
+    stat = os.stat(theLogcatFile)
+    if cache['path'] != os.path.abspath(theLogcatFile) or \
+       cache['size'] != stat.st_size or \
+       cache['mtime'] != stat.st_mtime:
+        return None
+    if cache['md5'] != getFileMd5Hash(theLogcatFile):
+        return None
+
+    logAnalyzer = TaintLogAnalyzer(theLogger=Logger(theLevel=LogLevel.ERROR))
+    logAnalyzer.logFile = theLogcatFile
+    logAnalyzer.lineEnding = cache['lineEnding']
+    logAnalyzer.logEntryList = cache['logEntryList']
+    logAnalyzer.json2pyFailedList = cache['json2pyFailedList']
+    logAnalyzer.json2pyFailedErrorList = cache['json2pyFailedErrorList']
+    return logAnalyzer
+
+def storeLogCache(theLogcatFile, theLogAnalyzer):
+    """
+    Store the post-processed log entries of the analyzer next to the logcat file.
+    A cache which cannot be written (e.g. read-only report dir) is skipped.
+    """
+    stat = os.stat(theLogcatFile)
+    cache = {'version' : LOG_CACHE_VERSION,
+             'path' : os.path.abspath(theLogcatFile),
+             'size' : stat.st_size,
+             'mtime' : stat.st_mtime,
+             'md5' : getFileMd5Hash(theLogcatFile),
+             'lineEnding' : theLogAnalyzer.getLineEnding(),
+             'logEntryList' : theLogAnalyzer.getLogEntryList(),
+             'json2pyFailedList' : theLogAnalyzer.getJson2PyFailedList(),
+             'json2pyFailedErrorList' : theLogAnalyzer.getJson2PyFailedErrorList()}
+    cacheFileName = getLogCacheFileName(theLogcatFile)
+    tmpCacheFileName = '%s.%d.tmp' % (cacheFileName, os.getpid())
+    try:
+        cacheFile = open(tmpCacheFileName, 'wb')
+        try:
+            cPickle.dump(cache, cacheFile, cPickle.HIGHEST_PROTOCOL)
+        finally:
+            cacheFile.close()
+        os.rename(tmpCacheFileName, cacheFileName) # readers never see partial caches
+    except (IOError, OSError):
+        if os.path.exists(tmpCacheFileName):
+            os.remove(tmpCacheFileName)
+
+
+# ================================================================================
+# Pool Workers
+# ================================================================================
+
+def loadAppWorker(theArgs):
+    """
+    Returns APK and taint log (None if the logcat cannot be read) of one app.
+    """
+    analyzer, directory, appPath, logcatFile = theArgs
+    return (analyzer.getAppApk(appPath), analyzer.getAppTaintLog(directory, logcatFile))
+
+def analyzeAppWorker(theArgs):
+    """
+    Evaluates one app into its own result dict, merged by the parent process.
+    """
+    analyzer, directory, appPath, logcatFile = theArgs
+    resultDict = analyzer.getInitialResultDict()
+    analyzer.analyzeApp(directory, appPath, logcatFile, resultDict)
+    return resultDict
+
+
 # ================================================================================
 # Analyzer
 # ================================================================================
@@ -25,6 +140,14 @@ class Analyzer:
         self.printDictFile = None
         self.htmlOutputDir = None
         self.reportAppDir = None
+        self.useLogCache = True
+        self.numJobs = 1
+        self.pool = None # multiprocessing pool if numJobs > 1
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['pool'] = None # analyzer is sent to the pool workers
+        return state
         
     def getRuntime(self, theObj):
         startTime = datetime.datetime(int(theObj.startTime[0:4]),
@@ -83,38 +206,20 @@ class Analyzer:
             logcatFile = os.path.join(theDir, theLogcatFile)
         else:
             logcatFile = os.path.join(theDir, logcatFileParts[1])
-        logAnalyzer1 = TaintLogAnalyzer(theLogger=Logger(theLevel=LogLevel.ERROR))
+        if self.useLogCache and os.path.exists(logcatFile):
+            logAnalyzer = loadLogCache(logcatFile)
+            if logAnalyzer is not None:
+                return logAnalyzer
+        logAnalyzer = TaintLogAnalyzer(theLogger=Logger(theLevel=LogLevel.ERROR))
         try:
-            logAnalyzer1.setLogFile(logcatFile)
+            logAnalyzer.setLogFile(logcatFile)
         except IOError, ioErr:
             #raw_input('getAppTaintLog::IOError')
             return None
-        logAnalyzer1.extractLogEntries()
-
-        logAnalyzer2 = TaintLogAnalyzer(theLogger=Logger(theLevel=LogLevel.ERROR))
-        logAnalyzer2.setLogFile(logcatFile)
-        logAnalyzer2.numControlChars = 2
-        logAnalyzer2.extractLogEntries()
-
-        #print len(logAnalyzer1.getLogEntryList())
-        #print len(logAnalyzer1.getJson2PyFailedList())
-        #print '2: ', len(logAnalyzer2.getLogEntryList())
-        #print len(logAnalyzer2.getJson2PyFailedList())
-        #raw_input('xx')
-
-        if len(logAnalyzer1.getLogEntryList()) > len(logAnalyzer2.getLogEntryList()) and \
-           len(logAnalyzer1.getJson2PyFailedList()) < len(logAnalyzer2.getJson2PyFailedList()):
-            logAnalyzer = logAnalyzer1
-        else:
-            logAnalyzer = logAnalyzer2
-        
-        #if len(logAnalyzer.getLogEntryList()) == 0:
-        #    logAnalyzer.numControlChars = 2
-        #    logAnalyzer.extractLogEntries()
-        #if len(logAnalyzer.getLogEntryList()) == 0:
-            #raw_input('XX')
-        #    pass
+        logAnalyzer.extractLogEntries() # line endings (LF or CRLF) are detected per line
         logAnalyzer.postProcessLogObjects()
+        if self.useLogCache:
+            storeLogCache(logcatFile, logAnalyzer)
         return logAnalyzer
 
     def getAppApk(self, theAppPath):
@@ -140,186 +245,66 @@ class Analyzer:
                             'location':[0,[]],
                             'other':[0,[]],
                             'nothing':[0,[]]}
+    TAG_NUMBER_LIST = [('contact', [TaintTagEnum.TAINT_CONTACTS]),
+                       ('deviceInfos', [TaintTagEnum.TAINT_PHONE_NUMBER,
+                                        TaintTagEnum.TAINT_IMEI,
+                                        TaintTagEnum.TAINT_IMSI,
+                                        TaintTagEnum.TAINT_ICCID,
+                                        TaintTagEnum.TAINT_DEVICE_SN]),
+                       ('userInput', [TaintTagEnum.TAINT_USER_INPUT]),
+                       ('incomingData', [TaintTagEnum.TAINT_INCOMING_DATA]),
+                       ('location', [TaintTagEnum.TAINT_LOCATION,
+                                     TaintTagEnum.TAINT_LOCATION_GPS,
+                                     TaintTagEnum.TAINT_LOCATION_NET,
+                                     TaintTagEnum.TAINT_LOCATION_LAST]),
+                       ('other', [TaintTagEnum.TAINT_MIC,
+                                  TaintTagEnum.TAINT_CAMERA,
+                                  TaintTagEnum.TAINT_ACCELEROMETER,
+                                  TaintTagEnum.TAINT_HISTORY,
+                                  TaintTagEnum.TAINT_MEDIA,
+                                  TaintTagEnum.TAINT_SMS])]
     def evalTagNumbers(self, theTaintLog, theApk, theBaseObj, theNumbers, theReportMode=False):
-        oneMatch = False
-        
         noTag = copy.deepcopy(theBaseObj)
         noTag.tag = -1
-        if theTaintLog.doesMatch([noTag]):
-            if theReportMode:
-                theNumbers['noTag'][0] += len(theTaintLog.getMatchingLogEntries([noTag]))
-            else:
-                theNumbers['noTag'][0] += 1
-                theNumbers['noTag'][1].append(theApk)
-            oneMatch = True
-
-        if isinstance(theBaseObj, CallActionLogEntry) and oneMatch:
-            for key, value in self.INITIAL_NUMBERS_DICT.iteritems():
-                if key != 'noTag' and key != 'nothing':
-                    theNumbers[key][0] -= 1
-            
-        contact = copy.deepcopy(theBaseObj)
-        contact.tagList.append(TaintTagEnum.TAINT_CONTACTS)
-        if theTaintLog.doesMatch([contact]):
-            if theReportMode:
-                theNumbers['contact'][0] += len(theTaintLog.getMatchingLogEntries([contact]))
-            else:
-                theNumbers['contact'][0] += 1
-                theNumbers['contact'][1].append(theApk)
-            oneMatch = True
-            
-        deviceInfos = copy.deepcopy(theBaseObj)
-        deviceInfos.tagList.append(TaintTagEnum.TAINT_PHONE_NUMBER)
-        deviceInfos.tagList.append(TaintTagEnum.TAINT_IMEI)
-        deviceInfos.tagList.append(TaintTagEnum.TAINT_IMSI)
-        deviceInfos.tagList.append(TaintTagEnum.TAINT_ICCID)
-        deviceInfos.tagList.append(TaintTagEnum.TAINT_DEVICE_SN)
-        if theTaintLog.doesMatch([deviceInfos]):
-            if theReportMode:
-                theNumbers['deviceInfos'][0] += len(theTaintLog.getMatchingLogEntries([deviceInfos]))
-            else:
-                theNumbers['deviceInfos'][0] += 1
-                theNumbers['deviceInfos'][1].append(theApk)
-            oneMatch = True
-            
-        userInput = copy.deepcopy(theBaseObj)
-        userInput.tagList.append(TaintTagEnum.TAINT_USER_INPUT)
-        if theTaintLog.doesMatch([userInput]):
-            if theReportMode:
-                theNumbers['userInput'][0] += len(theTaintLog.getMatchingLogEntries([userInput]))
-            else:
-                theNumbers['userInput'][0] += 1
-                theNumbers['userInput'][1].append(theApk)
-            oneMatch = True
-            
-        incomingData = copy.deepcopy(theBaseObj)
-        incomingData.tagList.append(TaintTagEnum.TAINT_INCOMING_DATA)
-        if theTaintLog.doesMatch([incomingData]):
-            if theReportMode:
-                theNumbers['incomingData'][0] += len(theTaintLog.getMatchingLogEntries([incomingData]))
-            else:
-                theNumbers['incomingData'][0] += 1
-                theNumbers['incomingData'][1].append(theApk)
-            oneMatch = True
-            
-        location = copy.deepcopy(theBaseObj)
-        location.tagList.append(TaintTagEnum.TAINT_LOCATION)
-        location.tagList.append(TaintTagEnum.TAINT_LOCATION_GPS)
-        location.tagList.append(TaintTagEnum.TAINT_LOCATION_NET)
-        location.tagList.append(TaintTagEnum.TAINT_LOCATION_LAST)
-        if theTaintLog.doesMatch([location]):
-            if theReportMode:
-                theNumbers['location'][0] += len(theTaintLog.getMatchingLogEntries([location]))
-            else:
-                theNumbers['location'][0] += 1
-                theNumbers['location'][1].append(theApk)
-            oneMatch = True
-            
-        other = copy.deepcopy(theBaseObj)
-        other.tagList.append(TaintTagEnum.TAINT_MIC)
-        other.tagList.append(TaintTagEnum.TAINT_CAMERA)
-        other.tagList.append(TaintTagEnum.TAINT_ACCELEROMETER)
-        other.tagList.append(TaintTagEnum.TAINT_HISTORY)
-        other.tagList.append(TaintTagEnum.TAINT_MEDIA)
-        other.tagList.append(TaintTagEnum.TAINT_SMS)
-        if theTaintLog.doesMatch([other]):
-            if theReportMode:
-                theNumbers['other'][0] += len(theTaintLog.getMatchingLogEntries([other]))
-            else:
-                theNumbers['other'][0] += 1
-                theNumbers['other'][1].append(theApk)
-            oneMatch = True
-
-        if not oneMatch:
-            theNumbers['nothing'][0] += 1
-            if theReportMode: theNumbers['nothing'][1].append(theApk)
-
-        return oneMatch
+        patternList = [noTag]
+        for key, tagList in self.TAG_NUMBER_LIST:
+            pattern = copy.deepcopy(theBaseObj)
+            pattern.tagList.extend(tagList)
+            patternList.append(pattern)
+        return self.__addNumbers(theTaintLog, theApk, theBaseObj, patternList, theNumbers, theReportMode)
 
     def evalSmsDestTagNumbers(self, theTaintLog, theApk, theBaseObj, theNumbers, theReportMode=False):
-        oneMatch = False
-        
         noTag = copy.deepcopy(theBaseObj)
         noTag.destinationTag = -1
-        if theTaintLog.doesMatch([noTag]):
-            if theReportMode:
-                theNumbers['noTag'][0] += len(theTaintLog.getMatchingLogEntries([noTag]))
-            else:
-                theNumbers['noTag'][0] += 1
-                theNumbers['noTag'][1].append(theApk)
-            oneMatch = True
-            
-        contact = copy.deepcopy(theBaseObj)
-        contact.destinationTagList.append(TaintTagEnum.TAINT_CONTACTS)
-        if theTaintLog.doesMatch([contact]):
-            if theReportMode:
-                theNumbers['contact'][0] += len(theTaintLog.getMatchingLogEntries([contact]))
-            else:
-                theNumbers['contact'][0] += 1
-                theNumbers['contact'][1].append(theApk)
-            oneMatch = True
-            
-        deviceInfos = copy.deepcopy(theBaseObj)
-        deviceInfos.destinationTagList.append(TaintTagEnum.TAINT_PHONE_NUMBER)
-        deviceInfos.destinationTagList.append(TaintTagEnum.TAINT_IMEI)
-        deviceInfos.destinationTagList.append(TaintTagEnum.TAINT_IMSI)
-        deviceInfos.destinationTagList.append(TaintTagEnum.TAINT_ICCID)
-        deviceInfos.destinationTagList.append(TaintTagEnum.TAINT_DEVICE_SN)
-        if theTaintLog.doesMatch([deviceInfos]):
-            if theReportMode:
-                theNumbers['deviceInfos'][0] += len(theTaintLog.getMatchingLogEntries([deviceInfos]))
-            else:
-                theNumbers['deviceInfos'][0] += 1
-                theNumbers['deviceInfos'][1].append(theApk)
-            oneMatch = True
-            
-        userInput = copy.deepcopy(theBaseObj)
-        userInput.destinationTagList.append(TaintTagEnum.TAINT_USER_INPUT)
-        if theTaintLog.doesMatch([userInput]):
-            if theReportMode:
-                theNumbers['userInput'][0] += len(theTaintLog.getMatchingLogEntries([userInput]))
-            else:
-                theNumbers['userInput'][0] += 1
-                theNumbers['userInput'][1].append(theApk)
-            oneMatch = True
-            
-        incomingData = copy.deepcopy(theBaseObj)
-        incomingData.destinationTagList.append(TaintTagEnum.TAINT_INCOMING_DATA)
-        if theTaintLog.doesMatch([incomingData]):
-            if theReportMode:
-                theNumbers['incomingData'][0] += len(theTaintLog.getMatchingLogEntries([incomingData]))
-            else:
-                theNumbers['incomingData'][0] += 1
-                theNumbers['incomingData'][1].append(theApk)
-            oneMatch = True
-            
-        location = copy.deepcopy(theBaseObj)
-        location.destinationTagList.append(TaintTagEnum.TAINT_LOCATION)
-        location.destinationTagList.append(TaintTagEnum.TAINT_LOCATION_GPS)
-        location.destinationTagList.append(TaintTagEnum.TAINT_LOCATION_NET)
-        location.destinationTagList.append(TaintTagEnum.TAINT_LOCATION_LAST)
-        if theTaintLog.doesMatch([location]):
-            if theReportMode:
-                theNumbers['location'][0] += len(theTaintLog.getMatchingLogEntries([location]))
-            else:
-                theNumbers['location'][0] += 1
-                theNumbers['location'][1].append(theApk)
-            oneMatch = True
-            
-        other = copy.deepcopy(theBaseObj)
-        other.destinationTagList.append(TaintTagEnum.TAINT_MIC)
-        other.destinationTagList.append(TaintTagEnum.TAINT_CAMERA)
-        other.destinationTagList.append(TaintTagEnum.TAINT_ACCELEROMETER)
-        other.destinationTagList.append(TaintTagEnum.TAINT_HISTORY)
-        other.destinationTagList.append(TaintTagEnum.TAINT_MEDIA)
-        other.destinationTagList.append(TaintTagEnum.TAINT_SMS)
-        if theTaintLog.doesMatch([other]):
-            if theReportMode:
-                theNumbers['other'][0] += len(theTaintLog.getMatchingLogEntries([other]))
-            else:
-                theNumbers['other'][0] += 1
-                theNumbers['other'][1].append(theApk)
-            oneMatch = True
+        patternList = [noTag]
+        for key, tagList in self.TAG_NUMBER_LIST:
+            pattern = copy.deepcopy(theBaseObj)
+            pattern.destinationTagList.extend(tagList)
+            patternList.append(pattern)
+        return self.__addNumbers(theTaintLog, theApk, theBaseObj, patternList, theNumbers, theReportMode)
+
+    def __addNumbers(self, theTaintLog, theApk, theBaseObj, thePatternList, theNumbers, theReportMode):
+        """
+        Adds the matches of the noTag pattern and the TAG_NUMBER_LIST patterns
+        (in this order) to theNumbers. All patterns are matched in one pass
+        over the log entries.
+        """
+        numList = theTaintLog.getNumMatchingLogEntries(thePatternList)
+        keyList = ['noTag'] + [key for key, tagList in self.TAG_NUMBER_LIST]
+        oneMatch = False
+        for key, num in zip(keyList, numList):
+            if num > 0:
+                if theReportMode:
+                    theNumbers[key][0] += num
+                else:
+                    theNumbers[key][0] += 1
+                    theNumbers[key][1].append(theApk)
+                oneMatch = True
+
+            if key == 'noTag' and isinstance(theBaseObj, CallActionLogEntry) and oneMatch:
+                for numberKey in self.INITIAL_NUMBERS_DICT.iterkeys():
+                    if numberKey != 'noTag' and numberKey != 'nothing':
+                        theNumbers[numberKey][0] -= 1
 
         if not oneMatch:
             theNumbers['nothing'][0] += 1
@@ -337,6 +322,14 @@ class Analyzer:
         print '- Nothing at all: %d' % theNumbers['nothing'][0]
         print '- Errors: %d' % theNumbers['error'][0]
 
+    def __removeApps(self, theNumber, theAppSet):
+        """
+        Removes the apps of the set from a [count, appList] entry.
+        """
+        appList = [app for app in theNumber[1] if not app in theAppSet]
+        theNumber[0] -= len(theNumber[1]) - len(appList)
+        theNumber[1] = appList
+
     def consolidateResultDicts(self, theResultDicts):
         # Init overall list
         resultDict = {}
@@ -355,8 +348,16 @@ class Analyzer:
         numAnalyzeRuns = 0
         overallRuntime = 0
 
+        # Sets of the lists (membership checks), the lists keep the order
+        appSet = set()
+        numberSetDict = {}
+        for key, numbers in resultDict['numbers'].iteritems():
+            numberSetDict[key] = dict([(number, set()) for number in numbers.iterkeys()])
+        nothingSet = set()
+        errorSet = set()
+
         # Analyzed apps -> Do be removed from nothing and error
-        analyzedApps = []
+        analyzedApps = set()
 
         # For result dicts
         for resultDictPart in theResultDicts:
@@ -367,95 +368,105 @@ class Analyzer:
             # Consolidate numbers
             for key, numbers in resultDictPart['numbers'].iteritems():
                 for number, value in numbers.iteritems():
+                    numberSet = numberSetDict[key][number]
                     for app in value[1]:
                         md5 = app.getMd5Hash()
 
                         # Add to app list
-                        if not md5 in resultDict['appList']:
+                        if not md5 in appSet:
+                            appSet.add(md5)
                             resultDict['appList'].append(md5)
 
                         # Add to analyzed list
-                        if not md5 in analyzedApps:
-                            analyzedApps.append(md5)
+                        analyzedApps.add(md5)
 
                         # Add to numbers
-                        if not md5 in resultDict['numbers'][key][number][1]:
+                        if not md5 in numberSet:
+                            numberSet.add(md5)
                             resultDict['numbers'][key][number][0] += 1
                             resultDict['numbers'][key][number][1].append(md5)
 
             # Nothing
             for app in resultDictPart['nothing'][1]:
                 md5 = app.getMd5Hash()
-                if not md5 in resultDict['appList']:
+                if not md5 in appSet:
+                    appSet.add(md5)
                     resultDict['appList'].append(md5)
-                if not md5 in resultDict['nothing'][1]:
+                if not md5 in nothingSet:
+                    nothingSet.add(md5)
                     resultDict['nothing'][0] += 1
                     resultDict['nothing'][1].append(md5)
                     
             # Errors
             for app in resultDictPart['error'][1]:
                 md5 = app.getMd5Hash()
-                if not md5 in resultDict['appList']:
+                if not md5 in appSet:
+                    appSet.add(md5)
                     resultDict['appList'].append(md5)
-                if not md5 in resultDict['error'][1]:
+                if not md5 in errorSet:
+                    errorSet.add(md5)
                     resultDict['error'][0] += 1
                     resultDict['error'][1].append(md5)
 
         # CleanUp nothing (dict)
         for key, numbers in resultDict['numbers'].iteritems():
-            deleteIdxList = []
-            idx = 0
-            for app in numbers['nothing'][1]:
-                foundFlag = False
-                for number, value in numbers.iteritems():
-                    if number == 'nothing':
-                        continue
-                    if app in value[1]:
-                        foundFlag = True
-                        break
-                if foundFlag:
-                    deleteIdxList.append(idx)                    
-                idx += 1
-            deleteIdxList.sort()
-            for i in xrange(len(deleteIdxList)):
-                numbers['nothing'][0] -= 1
-                del numbers['nothing'][1][deleteIdxList[i] - i]
+            matchedApps = set()
+            for number, numberSet in numberSetDict[key].iteritems():
+                if number != 'nothing':
+                    matchedApps |= numberSet
+            self.__removeApps(numbers['nothing'], matchedApps)
                     
         # CleanUp nothing (main)
-        deleteIdxList = []
-        idx = 0
-        for app in resultDict['nothing'][1]:
-            if app in analyzedApps:
-                deleteIdxList.append(idx)
-            idx += 1
-        deleteIdxList.sort()
-        for i in xrange(len(deleteIdxList)):
-            resultDict['nothing'][0] -= 1
-            del resultDict['nothing'][1][deleteIdxList[i] - i]            
+        self.__removeApps(resultDict['nothing'], analyzedApps)
                     
         # CleanUp error
-        deleteIdxList = []
-        idx = 0
-        for app in resultDict['error'][1]:
-            if app in analyzedApps:
-                deleteIdxList.append(idx)
-            idx += 1
-        deleteIdxList.sort()
-        for i in xrange(len(deleteIdxList)):
-            resultDict['error'][0] -= 1
-            del resultDict['error'][1][deleteIdxList[i] - i]
+        self.__removeApps(resultDict['error'], analyzedApps)
         
         # Fill main list
         resultDict['avgAppRuntime'] = overallRuntime / numAnalyzeRuns
         return resultDict
     
-    def analyzeMain(self, theDir):  
-        # Factory
-        jsonFactory = JsonFactory()
-
-        # Read main report file
-        mainReport = self.getMainReport(theDir, jsonFactory)        
+    def getInitialResultDict(self):
+        return {'numbers' : {'sms' : copy.deepcopy(self.INITIAL_NUMBERS_DICT),
+                             'smsDest' : copy.deepcopy(self.INITIAL_NUMBERS_DICT),
+                             'call' : copy.deepcopy(self.INITIAL_NUMBERS_DICT),
+                             'netRead' : copy.deepcopy(self.INITIAL_NUMBERS_DICT),
+                             'netWrite' : copy.deepcopy(self.INITIAL_NUMBERS_DICT),
+                             'fsRead' : copy.deepcopy(self.INITIAL_NUMBERS_DICT),
+                             'fsWrite' : copy.deepcopy(self.INITIAL_NUMBERS_DICT),
+                             'cipher' : copy.deepcopy(self.INITIAL_NUMBERS_DICT),
+                             'ssl' : copy.deepcopy(self.INITIAL_NUMBERS_DICT)},
+                'nothing' : [0, []],
+                'error' : [0, []]}
+
+    def mergeResultDict(self, theResultDict, theAppResultDict):
+        """
+        Adds the numbers and app lists of an app result dict (analyzeAppWorker).
+        """
+        for key, numbers in theAppResultDict['numbers'].iteritems():
+            resultNumbers = theResultDict['numbers'][key]
+            for number, value in numbers.iteritems():
+                resultNumbers[number][0] += value[0]
+                resultNumbers[number][1].extend(value[1])
+        for key in ['nothing', 'error']:
+            theResultDict[key][0] += theAppResultDict[key][0]
+            theResultDict[key][1].extend(theAppResultDict[key][1])
+
+    def getAppArgsList(self, theDir, theAppReportList):
+        return [(self, theDir, appReport.appPath, appReport.logcatFile) for appReport in theAppReportList]
+
+    def loadApps(self, theDir, theAppReportList):
+        """
+        Yields APK and taint log of each app report in order. The apps are
+        loaded by the pool if several jobs are used.
+        """
+        argsList = self.getAppArgsList(theDir, theAppReportList)
+        if self.pool is None:
+            return itertools.imap(loadAppWorker, argsList)
+        else:
+            return self.pool.imap(loadAppWorker, argsList)
 
+    def analyzeApp(self, theDir, theAppPath, theLogcatFile, theResultDict):
         # Patterns
         filterList = [
             NetworkSendLogEntry(action=0,
@@ -467,77 +478,78 @@ class Analyzer:
                                tagList=[],
                                filePath='/data/data/com.android.music/shared_prefs/Music.xml',
                                stackTraceStr='')
-            ]        
+            ]
+
+        apk = self.getAppApk(theAppPath)
+        taintLog = self.getAppTaintLog(theDir, theLogcatFile)
+        if not taintLog is None:
+            #taintLog.printOverview()
+            taintLog.filterLogObjects(filterList) # filter for recurring patterns
+            #if taintLog.doesMatch(notInstrumentedPatterns): # check for not instrumented patters
+            #    taintLog.printOverview()
+            #    print '--------------------'
+
+            # Get numbers for overview table (eval calls)
+            oneMatch = self.evalTagNumbers(taintLog, apk, CallActionLogEntry(tagList=[]), theResultDict['numbers']['call'])
+            oneMatch |= self.evalTagNumbers(taintLog, apk, CipherUsageLogEntry(tagList=[]), theResultDict['numbers']['cipher'])
+            oneMatch |= self.evalTagNumbers(taintLog, apk, FileSystemLogEntry(actionList=[TaintLogActionEnum.FS_READ_ACTION,
+                                                                              TaintLogActionEnum.FS_READ_DIRECT_ACTION,
+                                                                              TaintLogActionEnum.FS_READV_ACTION],
+                                                                  tagList=[]),
+                                theResultDict['numbers']['fsRead'])
+            oneMatch |= self.evalTagNumbers(taintLog, apk, FileSystemLogEntry(actionList=[TaintLogActionEnum.FS_WRITE_ACTION,
+                                                                              TaintLogActionEnum.FS_WRITE_DIRECT_ACTION,
+                                                                              TaintLogActionEnum.FS_WRITEV_ACTION],
+                                                                  tagList=[]),
+                                theResultDict['numbers']['fsWrite'])
+            oneMatch |= self.evalTagNumbers(taintLog, apk, NetworkSendLogEntry(actionList=[TaintLogActionEnum.NET_READ_ACTION,
+                                                                               TaintLogActionEnum.NET_READ_DIRECT_ACTION,
+                                                                               TaintLogActionEnum.NET_RECV_ACTION,
+                                                                               TaintLogActionEnum.NET_RECV_DIRECT_ACTION],
+                                                                   tagList=[]),
+                                theResultDict['numbers']['netRead'])
+            oneMatch |= self.evalTagNumbers(taintLog, apk, NetworkSendLogEntry(actionList=[TaintLogActionEnum.NET_SEND_ACTION,
+                                                                               TaintLogActionEnum.NET_SEND_DIRECT_ACTION,
+                                                                               TaintLogActionEnum.NET_SEND_URGENT_ACTION,
+                                                                               TaintLogActionEnum.NET_WRITE_ACTION,
+                                                                               TaintLogActionEnum.NET_WRITE_DIRECT_ACTION],
+                                                                   tagList=[]),
+                                theResultDict['numbers']['netWrite'])
+            oneMatch |= self.evalTagNumbers(taintLog, apk, SSLLogEntry(tagList=[]), theResultDict['numbers']['ssl'])
+            oneMatch |= self.evalTagNumbers(taintLog, apk, SendSmsLogEntry(tagList=[]), theResultDict['numbers']['sms'])
+            oneMatch |= self.evalSmsDestTagNumbers(taintLog, apk, SendSmsLogEntry(destinationTagList=[]), theResultDict['numbers']['smsDest'])
+
+            # Nothing happens
+            if not oneMatch:
+                theResultDict['nothing'][0] += 1
+                theResultDict['nothing'][1].append(apk)
+
+        else:
+            theResultDict['error'][0] += 1
+            theResultDict['error'][1].append(apk)
+
+    def analyzeMain(self, theDir):  
+        # Factory
+        jsonFactory = JsonFactory()
+
+        # Read main report file
+        mainReport = self.getMainReport(theDir, jsonFactory)        
 
         callPatterns = [
             CallActionLogEntry(dialString='') # 15555218135
             ]
         
         # Analyze apps
-        numApps = 0
-        resultDict = {'numbers' : {'sms' : copy.deepcopy(self.INITIAL_NUMBERS_DICT),
-                                   'smsDest' : copy.deepcopy(self.INITIAL_NUMBERS_DICT),
-                                   'call' : copy.deepcopy(self.INITIAL_NUMBERS_DICT),
-                                   'netRead' : copy.deepcopy(self.INITIAL_NUMBERS_DICT),
-                                   'netWrite' : copy.deepcopy(self.INITIAL_NUMBERS_DICT),
-                                   'fsRead' : copy.deepcopy(self.INITIAL_NUMBERS_DICT),
-                                   'fsWrite' : copy.deepcopy(self.INITIAL_NUMBERS_DICT),
-                                   'cipher' : copy.deepcopy(self.INITIAL_NUMBERS_DICT),
-                                   'ssl' : copy.deepcopy(self.INITIAL_NUMBERS_DICT)},
-                      'nothing' : [0, []],
-                      'error' : [0, []],
-                      'mainReport' : mainReport}
-
-        for appReport in mainReport.appList:
-            
-            apk = self.getAppApk(appReport.appPath)
-            taintLog = self.getAppTaintLog(theDir, appReport.logcatFile)
-            if not taintLog is None:
-                numApps += 1 # increase counter
-                #taintLog.printOverview()
-                taintLog.filterLogObjects(filterList) # filter for recurring patterns
-                #if taintLog.doesMatch(notInstrumentedPatterns): # check for not instrumented patters
-                #    taintLog.printOverview()
-                #    print '--------------------'
-
-                # Get numbers for overview table (eval calls)
-                oneMatch = self.evalTagNumbers(taintLog, apk, CallActionLogEntry(tagList=[]), resultDict['numbers']['call'])
-                oneMatch |= self.evalTagNumbers(taintLog, apk, CipherUsageLogEntry(tagList=[]), resultDict['numbers']['cipher'])
-                oneMatch |= self.evalTagNumbers(taintLog, apk, FileSystemLogEntry(actionList=[TaintLogActionEnum.FS_READ_ACTION,
-                                                                                  TaintLogActionEnum.FS_READ_DIRECT_ACTION,
-                                                                                  TaintLogActionEnum.FS_READV_ACTION],
-                                                                      tagList=[]),
-                                    resultDict['numbers']['fsRead'])
-                oneMatch |= self.evalTagNumbers(taintLog, apk, FileSystemLogEntry(actionList=[TaintLogActionEnum.FS_WRITE_ACTION,
-                                                                                  TaintLogActionEnum.FS_WRITE_DIRECT_ACTION,
-                                                                                  TaintLogActionEnum.FS_WRITEV_ACTION],
-                                                                      tagList=[]),
-                                    resultDict['numbers']['fsWrite'])
-                oneMatch |= self.evalTagNumbers(taintLog, apk, NetworkSendLogEntry(actionList=[TaintLogActionEnum.NET_READ_ACTION,
-                                                                                   TaintLogActionEnum.NET_READ_DIRECT_ACTION,
-                                                                                   TaintLogActionEnum.NET_RECV_ACTION,
-                                                                                   TaintLogActionEnum.NET_RECV_DIRECT_ACTION],
-                                                                       tagList=[]),
-                                    resultDict['numbers']['netRead'])
-                oneMatch |= self.evalTagNumbers(taintLog, apk, NetworkSendLogEntry(actionList=[TaintLogActionEnum.NET_SEND_ACTION,
-                                                                                   TaintLogActionEnum.NET_SEND_DIRECT_ACTION,
-                                                                                   TaintLogActionEnum.NET_SEND_URGENT_ACTION,
-                                                                                   TaintLogActionEnum.NET_WRITE_ACTION,
-                                                                                   TaintLogActionEnum.NET_WRITE_DIRECT_ACTION],
-                                                                       tagList=[]),
-                                    resultDict['numbers']['netWrite'])
-                oneMatch |= self.evalTagNumbers(taintLog, apk, SSLLogEntry(tagList=[]), resultDict['numbers']['ssl'])
-                oneMatch |= self.evalTagNumbers(taintLog, apk, SendSmsLogEntry(tagList=[]), resultDict['numbers']['sms'])
-                oneMatch |= self.evalSmsDestTagNumbers(taintLog, apk, SendSmsLogEntry(destinationTagList=[]), resultDict['numbers']['smsDest'])
-
-                # Nothing happens
-                if not oneMatch:
-                    resultDict['nothing'][0] += 1
-                    resultDict['nothing'][1].append(apk)
-
-            else:
-                resultDict['error'][0] += 1
-                resultDict['error'][1].append(apk)
+        resultDict = self.getInitialResultDict()
+        resultDict['mainReport'] = mainReport
+        if self.pool is None:
+            for appReport in mainReport.appList:
+                self.analyzeApp(theDir, appReport.appPath, appReport.logcatFile, resultDict)
+        else:
+            # Results arrive in app order, so the app lists are the same as in one job
+            argsList = self.getAppArgsList(theDir, mainReport.appList)
+            for appResultDict in self.pool.imap(analyzeAppWorker, argsList):
+                self.mergeResultDict(resultDict, appResultDict)
 
         # Return
         return resultDict
@@ -607,10 +619,9 @@ class Analyzer:
                                    stackTraceStr='')
                 ]
 
-            for appReport in mainReport.appList:
-                apk = self.getAppApk(appReport.appPath)
+            loadedAppList = self.loadApps(directory, mainReport.appList)
+            for appReport, (apk, taintLog) in itertools.izip(mainReport.appList, loadedAppList):
                 md5 = apk.getMd5Hash()
-                taintLog = self.getAppTaintLog(directory, appReport.logcatFile)
                 if not taintLog is None:
                     taintLog.filterLogObjects(filterList) # filter for recurring patterns
 
@@ -765,8 +776,8 @@ class Analyzer:
         
         for directory in self.dirs:
             mainReport = self.getMainReport(directory, jsonFactory)
-            for appReport in mainReport.appList:
-                apk = self.getAppApk(appReport.appPath)
+            loadedAppList = self.loadApps(directory, mainReport.appList)
+            for appReport, (apk, taintLog) in itertools.izip(mainReport.appList, loadedAppList):
                 md5 = apk.getMd5Hash()
 
                 # Build entry in dict
@@ -775,7 +786,6 @@ class Analyzer:
                     result[md5]['apk'] = apk
                 
                 # Taint log and appropriate file names
-                taintLog = self.getAppTaintLog(directory, appReport.logcatFile)
                 if taintLog is None:
                     fileNameList = os.listdir(directory)
                     for logFile in fileNameList:
@@ -1111,9 +1121,8 @@ class Analyzer:
         for directory in self.dirs:
             print 'Look in %s' % directory
             mainReport = self.getMainReport(directory, jsonFactory)
-            for appReport in mainReport.appList:
-                apk = self.getAppApk(appReport.appPath)
-                taintLog = self.getAppTaintLog(directory, appReport.logcatFile)
+            loadedAppList = self.loadApps(directory, mainReport.appList)
+            for appReport, (apk, taintLog) in itertools.izip(mainReport.appList, loadedAppList):
                 if not taintLog is None:
                     if taintLog.doesMatch(notInstrumentedPatterns): # check for not instrumented patters
                         print '--------------------'
@@ -1127,9 +1136,8 @@ class Analyzer:
         for directory in self.dirs:
             print 'Look in %s' % directory
             mainReport = self.getMainReport(directory, jsonFactory)
-            for appReport in mainReport.appList:
-                apk = self.getAppApk(appReport.appPath)
-                taintLog = self.getAppTaintLog(directory, appReport.logcatFile)
+            loadedAppList = self.loadApps(directory, mainReport.appList)
+            for appReport, (apk, taintLog) in itertools.izip(mainReport.appList, loadedAppList):
                 if not taintLog is None:
                     if taintLog.doesMatch(patterns): # check for not instrumented patters
                         appList.append(apk)
@@ -1139,6 +1147,17 @@ class Analyzer:
             print '- %s (%s)' % (app.getPackage(), app.getMd5Hash())
             
     def analyze(self):
+        if int(self.numJobs) > 1:
+            self.pool = multiprocessing.Pool(int(self.numJobs))
+        try:
+            self.analyzeMode()
+        finally:
+            if not self.pool is None:
+                self.pool.close()
+                self.pool.join()
+                self.pool = None
+
+    def analyzeMode(self):
         if int(self.mode) == 0:
             self.analyzeModeNumbers()
         elif int(self.mode) == 1:
@@ -1166,6 +1185,8 @@ if __name__ == '__main__':
     parser.add_option('', '--printDictFile', metavar='<path>', default=None, help='Set path to file in which output dict should be printed')
     parser.add_option('', '--htmlOutputDir', metavar='<path>', default=None, help='Output directory for generated HTML report')
     parser.add_option('', '--reportAppDir', metavar='<path>', default=None, help='Default app directory on USB stick')
+    parser.add_option('-j', '--jobs', metavar='<int>', default=1, help='Set number of processes which load and analyze apps in parallel')
+    parser.add_option('', '--noLogCache', action='store_true', default=False, help='Do not read or write the parsed logcat caches (<logcat>%s)' % LOG_CACHE_SUFFIX)
     (options, args) = parser.parse_args()
 
     # Get report dir
@@ -1184,6 +1205,8 @@ if __name__ == '__main__':
     analyzer.printDictFile = options.printDictFile
     analyzer.htmlOutputDir = options.htmlOutputDir
     analyzer.reportAppDir = options.reportAppDir
+    analyzer.useLogCache = not options.noLogCache
+    analyzer.numJobs = int(options.jobs)
     analyzer.analyze()
 
     # malware full: python helper_analyzer.py -m 0 --baseAppDir /home/daniel/Documents/Malware/thesis_analysis/ ~/Documents/Malware/reports/mw_nb_1_20120112-213037/ ~/Documents/Malware/reports/mw_nb_2_20120122-111827/ ~/Documents/Malware/reports/mw_nb_3_20120122-143747/ ~/Documents/Malware/reports/mw_nb_4_20120123-215147/ ~/Documents/Malware/reports/mw_rub_full_20120123-214357/ ~/Documents/Malware/reports/mw_desk_full/
@@ -0,0 +1,504 @@
+from common import Logger, LogLevel, TaintTagEnum
+from helper_analyzer import Analyzer
+from taintlog_analyzer import TaintLogAnalyzer
+from taintlog_json import *
+from optparse import OptionParser
+
+import copy
+import json
+import os
+import random
+import re
+import time
+
+# ================================================================================
+# Synthetic Data
+# ================================================================================
+
+def generateLogcat(theFile, theNumLines, theSeed=1):
+    """
+    Writes a logcat file in thread format with TaintLog entries spread over
+    several lines and interleaved with other log lines.
+    """
+    rand = random.Random(theSeed)
+    stackTraceStr = 'com.example.Sender.send(Sender.java:42)||com.example.Main.onCreate(Main.java:7)||'
+    pidTidList = ['%5d:0x%x' % (rand.randint(100, 999), rand.randint(1, 30)) for i in xrange(6)]
+    pendingDict = {}
+    logFile = open(theFile, 'w')
+    for i in xrange(theNumLines):
+        pidTid = rand.choice(pidTidList)
+        if rand.random() < 0.5:
+            logFile.write('I(%s) ActivityManager: Displayed activity com.example/.Main: %dms\n' % (pidTid, rand.randint(1, 999)))
+        elif pendingDict.has_key(pidTid):
+            partList = pendingDict[pidTid]
+            logFile.write('W(%s) %s\n' % (pidTid, partList.pop(0)))
+            if len(partList) == 0:
+                del pendingDict[pidTid]
+        else:
+            if rand.random() < 0.6:
+                entry = {'__NetworkSendLogEntry__' : True, 'action' : 0x400,
+                         'tag' : '0x%X' % rand.choice([0x0, 0x1, 0x402]),
+                         'destination' : '10.0.0.%d' % rand.randint(1, 9), 'port' : 80,
+                         'taintLogId' : rand.choice([0, rand.randint(1, 50)]),
+                         'data' : 'GET /track?id=%d HTTP/1.1' % i,
+                         'stackTraceStr' : stackTraceStr, 'timestamp' : '2012-01-01 10:00:00'}
+            else:
+                entry = {'__FileSystemLogEntry__' : True, 'action' : 0x1,
+                         'tag' : '0x%X' % rand.choice([0x0, 0x2]),
+                         'fileDescriptor' : 12, 'filePath' : '/data/data/com.example/x',
+                         'taintLogId' : rand.choice([0, rand.randint(1, 50)]),
+                         'data' : 'payload %d' % i,
+                         'stackTraceStr' : stackTraceStr, 'timestamp' : '2012-01-01 10:00:00'}
+            jsonString = json.dumps([entry])
+            partList = [jsonString[j:j+120] for j in xrange(0, len(jsonString), 120)]
+            logFile.write('W(%s) TaintLog: %s\n' % (pidTid, partList.pop(0)))
+            if len(partList) > 0:
+                pendingDict[pidTid] = partList
+    for pidTid, partList in pendingDict.iteritems():
+        for part in partList:
+            logFile.write('W(%s) %s\n' % (pidTid, part))
+    logFile.close()
+
+def generateLogEntryList(theNumEntries, theNumIds=None, theDataSize=16, theSeed=1):
+    """
+    Returns a list of log entries as extracted from a logcat: cipher usages
+    with init/update/doFinal, network and file system calls with repeated
+    taint log ids, and other entries which are kept by postProcessLogObjects.
+    Few ids and a large data size simulate apps streaming data.
+    """
+    rand = random.Random(theSeed)
+    numIds = theNumIds
+    if numIds is None:
+        numIds = max(1, theNumEntries / 10)
+    padding = 'x' * theDataSize
+    stackTraceStr = 'com.example.Sender.send(Sender.java:42)||com.example.Main.onCreate(Main.java:7)||'
+    logEntryList = []
+    for i in xrange(theNumEntries):
+        choice = rand.random()
+        tag = rand.choice([0x0, 0x2, 0x402])
+        if choice < 0.2:
+            logEntryList.append(CipherUsageLogEntry(action=rand.choice([CipherActionEnum.INIT_ACTION, CipherActionEnum.UPDATE_ACTION, CipherActionEnum.DO_FINAL_ACTION]),
+                                                    id=rand.randint(1, max(1, numIds / 2)), mode=CipherModeEnum.ENCRYPT_MODE, tag=tag,
+                                                    input='in%d%s' % (i, padding), output='out%d%s' % (i, padding),
+                                                    stackTraceStr=stackTraceStr, timestamp='2012-01-01 10:00:00'))
+        elif choice < 0.45:
+            logEntryList.append(NetworkSendLogEntry(action=0x400, tag=tag, destination='10.0.0.1', port=80,
+                                                    taintLogId=rand.randint(1, numIds), data='GET /track?id=%d%s' % (i, padding),
+                                                    stackTraceStr=stackTraceStr, timestamp='2012-01-01 10:00:00'))
+        elif choice < 0.7:
+            logEntryList.append(FileSystemLogEntry(action=0x1, tag=tag, fileDescriptor=12, filePath='/data/data/com.example/x',
+                                                   taintLogId=rand.randint(1, numIds), data='payload %d%s' % (i, padding),
+                                                   stackTraceStr=stackTraceStr, timestamp='2012-01-01 10:00:00'))
+        else:
+            logEntryList.append(CallActionLogEntry(tag=tag, dialString='555-0100',
+                                                   stackTraceStr=stackTraceStr, timestamp='2012-01-01 10:00:00'))
+    return logEntryList
+
+class BenchmarkApp:
+    """
+    Stands in for APKWrapper in synthetic result dicts.
+    """
+    def __init__(self, theMd5Hash):
+        self.md5Hash = theMd5Hash
+
+    def getMd5Hash(self):
+        return self.md5Hash
+
+def generateResultDicts(theAnalyzer, theNumApps, theNumDirs=14, theSeed=1):
+    """
+    Returns result dicts of Analyzer.analyzeMain for several report dirs.
+    Each app is analyzed in one dir, some again in another one; most apps
+    match some tags, others nothing or fail.
+    """
+    rand = random.Random(theSeed)
+    resultDictList = []
+    for i in xrange(theNumDirs):
+        resultDict = theAnalyzer.getInitialResultDict()
+        resultDict['mainReport'] = MainReportEntry(startTime='20120101-100000', endTime='20120102-100000', appList=[])
+        resultDictList.append(resultDict)
+    numberList = [number for number in theAnalyzer.INITIAL_NUMBERS_DICT.iterkeys() if number != 'nothing']
+    for i in xrange(theNumApps):
+        app = BenchmarkApp('%032x' % rand.getrandbits(128))
+        numRuns = 1
+        if rand.random() < 0.1:
+            numRuns = 2
+        for resultDict in rand.sample(resultDictList, numRuns):
+            resultDict['mainReport'].appList.append(AppReportEntry())
+            if rand.random() < 0.05:
+                resultDict['error'][0] += 1
+                resultDict['error'][1].append(app)
+                continue
+            oneMatch = False
+            for key, numbers in resultDict['numbers'].iteritems():
+                if rand.random() < 0.3:
+                    for number in rand.sample(numberList, rand.randint(1, 2)):
+                        numbers[number][0] += 1
+                        numbers[number][1].append(app)
+                    oneMatch = True
+                else:
+                    numbers['nothing'][0] += 1
+            if not oneMatch:
+                resultDict['nothing'][0] += 1
+                resultDict['nothing'][1].append(app)
+    return resultDictList
+
+
+# ================================================================================
+# Legacy Implementations (for comparison)
+# ================================================================================
+
+def legacyExtractJsonStrings(theLogLines, theNumControlChars=1):
+    """
+    Line loop of TaintLogAnalyzer.extractLogEntries up to version 0.5.
+    """
+    regexBegin = 'W\([ 0-9]{5}:0x[0-9a-f]*\) TaintLog: \['
+    jsonStringVec = []
+    jsonStringDict = {}
+    for line in theLogLines:
+        startPidTidPos = line.find('(')
+        endPidTidPos = line.find(')')
+        pidTid = line[startPidTidPos+1:endPidTidPos]
+        if not jsonStringDict.has_key(pidTid):
+            regexMatch = re.match(regexBegin, line)
+            if not regexMatch is None:
+                if line[len(line)-1] == ']' or line[len(line)-2] == ']' or line[len(line)-3] == ']':
+                    jsonStringVec.append(line[regexMatch.end()-1:len(line)])
+                else:
+                    jsonStringDict[pidTid] = line[regexMatch.end()-1:len(line)-theNumControlChars]
+        else:
+            regexGoOn = 'W\(%s\) ' % pidTid
+            regexMatch = re.match(regexGoOn, line)
+            if not regexMatch is None:
+                jsonStringDict[pidTid] += line[regexMatch.end():len(line)-theNumControlChars]
+                if line[len(line)-1] == ']' or line[len(line)-2] == ']' or line[len(line)-3] == ']':
+                    jsonStringVec.append(jsonStringDict[pidTid])
+                    del jsonStringDict[pidTid]
+    return jsonStringVec
+
+def legacyExtractLogEntries(theLogLines, theNumControlChars=1):
+    """
+    TaintLogAnalyzer.extractLogEntries up to version 0.5.
+    """
+    jsonFactory = JsonFactory()
+    logEntryList = []
+    for jsonString in legacyExtractJsonStrings(theLogLines, theNumControlChars):
+        try:
+            logEntryList.extend(jsonFactory.json2Py(jsonString))
+        except Exception, ex:
+            pass
+    return logEntryList
+
+def legacyPostProcessLogObjects(theLogEntryList, theDeleteStaleObjectsFlag=True):
+    """
+    TaintLogAnalyzer.postProcessLogObjects up to version 0.5 (stale entries
+    removed by index after the loop, one list deletion per entry).
+    """
+    logEntryList = list(theLogEntryList)
+    cipherUsageDict = {}
+    netUsageDict = {}
+    fileSystemUsageDict = {}
+    logEntryIndex = 0
+    for logEntry in logEntryList:
+        if isinstance(logEntry, BaseLogEntry):
+            stackTrace = logEntry.stackTraceStr.split('||')
+            logEntry.stackTrace = stackTrace[:len(stackTrace)-1]
+
+        if isinstance(logEntry, CipherUsageLogEntry):
+            if cipherUsageDict.has_key(logEntry.id):
+                cipherUsageDict[logEntry.id][0].tag = TaintTagEnum.appendTaintTags(cipherUsageDict[logEntry.id][0].tag, logEntry.tag)
+                if logEntry.action == CipherActionEnum.INIT_ACTION:
+                    cipherUsageDict[logEntry.id][0].input = logEntry.input + cipherUsageDict[logEntry.id][0].input
+                    cipherUsageDict[logEntry.id][0].output = logEntry.output + cipherUsageDict[logEntry.id][0].output
+                else:
+                    cipherUsageDict[logEntry.id][0].input += logEntry.input
+                    cipherUsageDict[logEntry.id][0].output += logEntry.output
+                cipherUsageDict[logEntry.id][1].append(logEntryIndex)
+            else:
+                cipherUsageLogEntry = CipherUsageLogEntry(action=CipherActionEnum.CLEANED, id=logEntry.id, mode=logEntry.mode, tag=logEntry.tag,
+                                                          input='', output='', stackTraceStr=logEntry.stackTraceStr,
+                                                          stackTrace=logEntry.stackTrace, timestamp=logEntry.timestamp)
+                cipherUsageDict[logEntry.id] = [cipherUsageLogEntry, [logEntryIndex]]
+
+        if isinstance(logEntry, NetworkSendLogEntry) or isinstance(logEntry, FileSystemLogEntry):
+            usageDict = netUsageDict
+            if isinstance(logEntry, FileSystemLogEntry):
+                usageDict = fileSystemUsageDict
+            if usageDict.has_key(logEntry.taintLogId):
+                usageDict[logEntry.taintLogId][0].tag = TaintTagEnum.appendTaintTags(usageDict[logEntry.taintLogId][0].tag, logEntry.tag)
+                usageDict[logEntry.taintLogId][0].data = usageDict[logEntry.taintLogId][0].data + logEntry.data
+                usageDict[logEntry.taintLogId][1].append(logEntryIndex)
+            else:
+                mergedLogEntry = logEntry.__class__(**logEntry.__getstate__())
+                usageDict[logEntry.taintLogId] = [mergedLogEntry, [logEntryIndex]]
+
+        logEntryIndex += 1
+
+    if theDeleteStaleObjectsFlag:
+        delLogEntryIdxList = []
+        for usageDict in [cipherUsageDict, netUsageDict, fileSystemUsageDict]:
+            for id, logEntry in usageDict.iteritems():
+                delLogEntryIdxList.extend(logEntry[1])
+        delLogEntryIdxList.sort()
+        for i in xrange(len(delLogEntryIdxList)):
+            del logEntryList[delLogEntryIdxList[i] - i]
+
+    for usageDict in [cipherUsageDict, netUsageDict, fileSystemUsageDict]:
+        for id, logEntry in usageDict.iteritems():
+            logEntryList.append(logEntry[0])
+    return logEntryList
+
+def legacyConsolidateResultDicts(theAnalyzer, theResultDicts):
+    """
+    Analyzer.consolidateResultDicts up to version 0.5 (membership checks and
+    clean up on lists).
+    """
+    # Init overall list
+    resultDict = {}
+    resultDict['appList'] = []
+    resultDict['numbers'] = {'sms' : copy.deepcopy(theAnalyzer.INITIAL_NUMBERS_DICT),
+                             'smsDest' : copy.deepcopy(theAnalyzer.INITIAL_NUMBERS_DICT),
+                             'call' : copy.deepcopy(theAnalyzer.INITIAL_NUMBERS_DICT),
+                             'netRead' : copy.deepcopy(theAnalyzer.INITIAL_NUMBERS_DICT),
+                             'netWrite' : copy.deepcopy(theAnalyzer.INITIAL_NUMBERS_DICT),
+                             'fsRead' : copy.deepcopy(theAnalyzer.INITIAL_NUMBERS_DICT),
+                             'fsWrite' : copy.deepcopy(theAnalyzer.INITIAL_NUMBERS_DICT),
+                             'cipher' : copy.deepcopy(theAnalyzer.INITIAL_NUMBERS_DICT),
+                             'ssl' : copy.deepcopy(theAnalyzer.INITIAL_NUMBERS_DICT)}
+    resultDict['nothing'] = [0, []]
+    resultDict['error'] = [0, []]
+    numAnalyzeRuns = 0
+    overallRuntime = 0
+
+    # Analyzed apps -> Do be removed from nothing and error
+    analyzedApps = []
+
+    # For result dicts
+    for resultDictPart in theResultDicts:
+        # Runtime infos
+        numAnalyzeRuns += len(resultDictPart['mainReport'].appList)
+        overallRuntime += theAnalyzer.getRuntime(resultDictPart['mainReport']).seconds
+
+        # Consolidate numbers
+        for key, numbers in resultDictPart['numbers'].iteritems():
+            for number, value in numbers.iteritems():
+                for app in value[1]:
+                    md5 = app.getMd5Hash()
+
+                    # Add to app list
+                    if not md5 in resultDict['appList']:
+                        resultDict['appList'].append(md5)
+
+                    # Add to analyzed list
+                    if not md5 in analyzedApps:
+                        analyzedApps.append(md5)
+
+                    # Add to numbers
+                    if not md5 in resultDict['numbers'][key][number][1]:
+                        resultDict['numbers'][key][number][0] += 1
+                        resultDict['numbers'][key][number][1].append(md5)
+
+        # Nothing
+        for app in resultDictPart['nothing'][1]:
+            md5 = app.getMd5Hash()
+            if not md5 in resultDict['appList']:
+                resultDict['appList'].append(md5)
+            if not md5 in resultDict['nothing'][1]:
+                resultDict['nothing'][0] += 1
+                resultDict['nothing'][1].append(md5)
+                
+        # Errors
+        for app in resultDictPart['error'][1]:
+            md5 = app.getMd5Hash()
+            if not md5 in resultDict['appList']:
+                resultDict['appList'].append(md5)
+            if not md5 in resultDict['error'][1]:
+                resultDict['error'][0] += 1
+                resultDict['error'][1].append(md5)
+
+    # CleanUp nothing (dict)
+    for key, numbers in resultDict['numbers'].iteritems():
+        deleteIdxList = []
+        idx = 0
+        for app in numbers['nothing'][1]:
+            foundFlag = False
+            for number, value in numbers.iteritems():
+                if number == 'nothing':
+                    continue
+                if app in value[1]:
+                    foundFlag = True
+                    break
+            if foundFlag:
+                deleteIdxList.append(idx)                    
+            idx += 1
+        deleteIdxList.sort()
+        for i in xrange(len(deleteIdxList)):
+            numbers['nothing'][0] -= 1
+            del numbers['nothing'][1][deleteIdxList[i] - i]
+                
+    # CleanUp nothing (main)
+    deleteIdxList = []
+    idx = 0
+    for app in resultDict['nothing'][1]:
+        if app in analyzedApps:
+            deleteIdxList.append(idx)
+        idx += 1
+    deleteIdxList.sort()
+    for i in xrange(len(deleteIdxList)):
+        resultDict['nothing'][0] -= 1
+        del resultDict['nothing'][1][deleteIdxList[i] - i]            
+                
+    # CleanUp error
+    deleteIdxList = []
+    idx = 0
+    for app in resultDict['error'][1]:
+        if app in analyzedApps:
+            deleteIdxList.append(idx)
+        idx += 1
+    deleteIdxList.sort()
+    for i in xrange(len(deleteIdxList)):
+        resultDict['error'][0] -= 1
+        del resultDict['error'][1][deleteIdxList[i] - i]
+    
+    # Fill main list
+    resultDict['avgAppRuntime'] = overallRuntime / numAnalyzeRuns
+    return resultDict
+
+
+# ================================================================================
+# Benchmarks
+# ================================================================================
+
+def getBestTime(theFunc, theNumRuns):
+    """
+    Returns the best run time and the result of the last run.
+    """
+    bestTime = None
+    for i in xrange(theNumRuns):
+        startTime = time.time()
+        result = theFunc()
+        runTime = time.time() - startTime
+        if bestTime is None or runTime < bestTime:
+            bestTime = runTime
+    return bestTime, result
+
+def printComparison(theName, theNumItems, theLegacyTime, theCurrentTime, theUnit='lines'):
+    print '%s' % theName
+    print '- legacy:  %8.3fsec, %10.0f %s/sec' % (theLegacyTime, theNumItems / theLegacyTime, theUnit)
+    print '- current: %8.3fsec, %10.0f %s/sec' % (theCurrentTime, theNumItems / theCurrentTime, theUnit)
+    print '- speedup: %.2fx' % (theLegacyTime / theCurrentTime)
+
+def benchmarkExtraction(theLogcatFile, theNumRuns=3):
+    """
+    Compares lines/sec of the legacy and the current extraction, once for
+    finding the JSON strings only and once including their conversion.
+    """
+    logFile = open(theLogcatFile, 'r')
+    logLines = logFile.readlines()
+    logFile.close()
+    print 'Extraction of %s (%d lines, %.1f MB), best of %d runs' % (theLogcatFile, len(logLines), os.path.getsize(theLogcatFile) / 1048576.0, theNumRuns)
+
+    def runCurrentScan():
+        logAnalyzer = TaintLogAnalyzer(theLogger=Logger(LogLevel.ERROR))
+        return list(logAnalyzer.extractJsonStrings(logLines))
+
+    def runCurrentExtraction():
+        logAnalyzer = TaintLogAnalyzer(theLogger=Logger(LogLevel.ERROR))
+        logAnalyzer.logLines = logLines
+        logAnalyzer.extractLogEntries()
+        return logAnalyzer.getLogEntryList()
+
+    legacyTime, legacyResult = getBestTime(lambda: legacyExtractJsonStrings(logLines), theNumRuns)
+    currentTime, currentResult = getBestTime(runCurrentScan, theNumRuns)
+    if [jsonString.rstrip('\r\n') for jsonString in legacyResult] != currentResult:
+        print 'Error: JSON strings differ'
+    printComparison('JSON strings (%d)' % len(currentResult), len(logLines), legacyTime, currentTime)
+
+    legacyTime, legacyResult = getBestTime(lambda: legacyExtractLogEntries(logLines), theNumRuns)
+    currentTime, currentResult = getBestTime(runCurrentExtraction, theNumRuns)
+    if len(legacyResult) != len(currentResult):
+        print 'Error: Number of log entries differs'
+    printComparison('JSON strings and log entries (%d)' % len(currentResult), len(logLines), legacyTime, currentTime)
+
+def benchmarkPostProcessing(theNumEntries, theNumRuns=3):
+    """
+    Compares entries/sec of the legacy and the current postProcessLogObjects,
+    once with many short payloads and once with few streams of large ones.
+    """
+    for name, numIds, dataSize in [('many ids, 16 byte payloads', None, 16),
+                                   ('10 ids, 1 KB payloads', 10, 1024)]:
+        logEntryList = generateLogEntryList(theNumEntries, numIds, dataSize)
+        print 'Post processing of %d log entries (%s), best of %d runs' % (theNumEntries, name, theNumRuns)
+
+        def runCurrentPostProcessing():
+            logAnalyzer = TaintLogAnalyzer(theLogger=Logger(LogLevel.ERROR))
+            logAnalyzer.logEntryList = list(logEntryList)
+            logAnalyzer.postProcessLogObjects()
+            return logAnalyzer.getLogEntryList()
+
+        legacyTime, legacyResult = getBestTime(lambda: legacyPostProcessLogObjects(logEntryList), theNumRuns)
+        currentTime, currentResult = getBestTime(runCurrentPostProcessing, theNumRuns)
+        if len(legacyResult) != len(currentResult):
+            print 'Error: Number of log entries differs'
+        printComparison('Post processed log entries (%d)' % len(currentResult), theNumEntries, legacyTime, currentTime, 'entries')
+
+def benchmarkConsolidation(theNumApps, theNumRuns=3, theLegacyMaxApps=5000):
+    """
+    Compares apps/sec of the legacy and the current consolidateResultDicts.
+    The legacy one is quadratic in the number of apps and therefore only
+    run (and compared) up to theLegacyMaxApps.
+    """
+    analyzer = Analyzer([])
+    numAppsList = sorted(set([min(theNumApps, theLegacyMaxApps), theNumApps]))
+    for numApps in numAppsList:
+        resultDictList = generateResultDicts(analyzer, numApps)
+        print 'Consolidation of %d apps in %d result dicts, best of %d runs' % (numApps, len(resultDictList), theNumRuns)
+        currentTime, currentResult = getBestTime(lambda: analyzer.consolidateResultDicts(resultDictList), theNumRuns)
+        if numApps > theLegacyMaxApps:
+            print 'Consolidated apps (%d)' % len(currentResult['appList'])
+            print '- legacy:  skipped (more than %d apps)' % theLegacyMaxApps
+            print '- current: %8.3fsec, %10.0f apps/sec' % (currentTime, numApps / currentTime)
+            continue
+        legacyTime, legacyResult = getBestTime(lambda: legacyConsolidateResultDicts(analyzer, resultDictList), theNumRuns)
+        if legacyResult != currentResult:
+            print 'Error: Consolidated results differ'
+        printComparison('Consolidated apps (%d)' % len(currentResult['appList']), numApps, legacyTime, currentTime, 'apps')
+
+
+# ================================================================================
+# Main method
+# ================================================================================
+
+def getLogcatFile(theArgs, theNumLines):
+    """
+    Returns the provided logcat file or generates a synthetic one.
+    """
+    if len(theArgs) > 1:
+        return theArgs[1]
+    logcatFile = '/tmp/tdroid_benchmark_%d_logcat.log' % theNumLines
+    if not os.path.exists(logcatFile):
+        print 'Generate synthetic logcat %s' % logcatFile
+        generateLogcat(logcatFile, theNumLines)
+    return logcatFile
+
+def main():
+    parser = OptionParser(usage='usage: %prog [options] benchmark [logcatFile]\n\nbenchmarks: extract, postprocess, consolidate')
+    parser.add_option('-n', '--numLines', metavar='#', default=500000, help='Number of lines of the synthetic logcat (if no logcat file is provided)')
+    parser.add_option('-e', '--numEntries', metavar='#', default=100000, help='Number of synthetic log entries for postprocess')
+    parser.add_option('-a', '--numApps', metavar='#', default=50000, help='Number of synthetic apps for consolidate')
+    parser.add_option('-r', '--numRuns', metavar='#', default=3, help='Number of runs per implementation')
+    (options, args) = parser.parse_args()
+    if len(args) < 1:
+        parser.error('Provide a benchmark')
+
+    # Run
+    if args[0] == 'extract':
+        benchmarkExtraction(getLogcatFile(args, int(options.numLines)), int(options.numRuns))
+    elif args[0] == 'postprocess':
+        benchmarkPostProcessing(int(options.numEntries), int(options.numRuns))
+    elif args[0] == 'consolidate':
+        benchmarkConsolidation(int(options.numApps), int(options.numRuns))
+    else:
+        parser.error('Unknown benchmark: %s' % args[0])
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+################################################################################
+#
+# Copyright (c) 2011-2012, Daniel Baeumges (dbaeumges@googlemail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+################################################################################
+
+from common import Logger
+
+import os
+import shutil
+import subprocess
+import time
+
+
+# ================================================================================
+# Image Provisioner Enums
+# ================================================================================
+class ImageProvisionMode:
+    COPY   = 1 # full copy of all images
+    SHARED = 2 # share read-only images, reflink or sparse copy of writable images
+
+    @staticmethod
+    def getModeFromString(theStr):
+        if theStr == 'copy':
+            return ImageProvisionMode.COPY
+        elif theStr == 'shared':
+            return ImageProvisionMode.SHARED
+        else:
+            raise ValueError('Invalid image provision mode: %s' % theStr)
+
+
+# ================================================================================
+# Image Provisioner
+# ================================================================================
+class ImageProvisioner:
+    """
+    Provides the TaintDroid images for one emulator run.
+    The emulator never writes to ramdisk.img, system.img, and zImage, so in
+    shared mode these are hardlinked (or symlinked if the target directory is
+    on another file system). The writable images sdcard.img and userdata.img
+    are cloned via reflink if the file system supports it, otherwise they are
+    copied sparsely, i.e. blocks of zeros are skipped.
+    """
+    READ_ONLY_IMAGE_FILE_LIST = ['ramdisk.img', 'system.img', 'zImage']
+    WRITABLE_IMAGE_FILE_LIST = ['sdcard.img', 'userdata.img']
+    BLOCK_SIZE = 2**16
+
+    def __init__(self, theImageDirPath, theMode=ImageProvisionMode.SHARED, theLogger=Logger()):
+        self.imageDirPath = theImageDirPath
+        self.mode = theMode
+        self.log = theLogger
+
+        self.reflinkFlag = True # reset after first failed reflink
+
+    def getImageFileList(self):
+        """
+        Returns the list of all image files.
+        """
+        return sorted(self.READ_ONLY_IMAGE_FILE_LIST + self.WRITABLE_IMAGE_FILE_LIST)
+
+    def provision(self, theTargetDir, theCheckFunc=None):
+        """
+        Provides all images in the (existing) target directory.
+        theCheckFunc is called before every image, e.g. to check for cancelation.
+        Returns a dict with the needed time, the number of bytes written, and
+        the method used per image.
+        """
+        return self.__provisionFiles(self.getImageFileList(), theTargetDir, theCheckFunc)
+
+    def restoreWritableImages(self, theTargetDir, theCheckFunc=None):
+        """
+        Overwrites the writable images in the target directory with clean ones.
+        Returns the same dict as provision.
+        """
+        return self.__provisionFiles(self.WRITABLE_IMAGE_FILE_LIST, theTargetDir, theCheckFunc)
+
+    def __provisionFiles(self, theImageFileList, theTargetDir, theCheckFunc):
+        startTime = time.time()
+        stats = {'bytesWritten' : 0,
+                 'methods' : {}}
+        for imageFile in theImageFileList:
+            if not theCheckFunc is None:
+                theCheckFunc()
+            source = os.path.join(self.imageDirPath, imageFile)
+            target = os.path.join(theTargetDir, imageFile)
+            if os.path.lexists(target):
+                os.remove(target)
+
+            if self.mode == ImageProvisionMode.COPY:
+                shutil.copy2(source, target)
+                method = 'copy'
+                bytesWritten = os.path.getsize(source)
+            elif imageFile in self.READ_ONLY_IMAGE_FILE_LIST:
+                method = self.__shareImage(source, target)
+                bytesWritten = 0
+            else:
+                method, bytesWritten = self.__cloneImage(source, target)
+
+            self.log.info('- Provide %s (%s, %d bytes written)' % (imageFile, method, bytesWritten))
+            stats['methods'][imageFile] = method
+            stats['bytesWritten'] += bytesWritten
+        stats['time'] = time.time() - startTime
+        return stats
+
+    def __shareImage(self, theSource, theTarget):
+        """
+        Hardlinks the image, falls back to a symlink.
+        """
+        try:
+            os.link(theSource, theTarget)
+            return 'hardlink'
+        except OSError, osErr:
+            self.log.debug('Hardlink of %s failed, use symlink: %s' % (theSource, osErr.strerror))
+            os.symlink(os.path.abspath(theSource), theTarget)
+            return 'symlink'
+
+    def __cloneImage(self, theSource, theTarget):
+        """
+        Clones the image via reflink, falls back to a sparse copy.
+        Returns the used method and the number of bytes written.
+        """
+        if self.reflinkFlag:
+            try:
+                retval = subprocess.call(['cp', '--reflink=always', theSource, theTarget],
+                                         stdout=subprocess.PIPE,
+                                         stderr=subprocess.PIPE)
+            except OSError, osErr:
+                retval = -1
+            if retval == 0:
+                shutil.copystat(theSource, theTarget)
+                return 'reflink', 0
+            self.log.debug('Reflink not supported, use sparse copies')
+            self.reflinkFlag = False
+            if os.path.exists(theTarget):
+                os.remove(theTarget)
+
+        return 'sparse', self.__sparseCopy(theSource, theTarget)
+
+    def __sparseCopy(self, theSource, theTarget):
+        """
+        Copies the image and skips blocks which only contain zeros.
+        Returns the number of bytes written.
+        """
+        zeroBlock = '\0' * self.BLOCK_SIZE
+        bytesWritten = 0
+        sourceFile = open(theSource, 'rb')
+        targetFile = open(theTarget, 'wb')
+        try:
+            while True:
+                data = sourceFile.read(self.BLOCK_SIZE)
+                if not data:
+                    break
+                if data == zeroBlock[:len(data)]:
+                    targetFile.seek(len(data), os.SEEK_CUR)
+                else:
+                    targetFile.write(data)
+                    bytesWritten += len(data)
+            targetFile.truncate(sourceFile.tell())
+        finally:
+            sourceFile.close()
+            targetFile.close()
+        shutil.copystat(theSource, theTarget)
+        return bytesWritten
@@ -75,6 +75,21 @@ class ReportGenerator:
         report.write('<li><b>startTime</b>: %s-%s' % (Utils.getDateAsString(theResultEntry['startTime']), Utils.getTimeAsString(theResultEntry['startTime'])))
         report.write('<li><b>endTime</b>: %s-%s' % (Utils.getDateAsString(theResultEntry['endTime']), Utils.getTimeAsString(theResultEntry['endTime'])))
         report.write('<li><b>cleanImageDir</b>: %s' % theResultEntry['cleanImageDir'])        
+        if theResultEntry.has_key('bootTimes'):
+            bootTimeList = []
+            for step in ['waitForDevice', 'bootCompleted', 'bootAnimationStopped', 'packageManagerReady', 'total']:
+                if theResultEntry['bootTimes'].has_key(step):
+                    bootTimeList.append('%s=%.1fsec' % (step, theResultEntry['bootTimes'][step]))
+            report.write('<li><b>bootTimes</b>: %s' % ', '.join(bootTimeList))
+        provisionStats = None
+        if theResultEntry.has_key('imageProvisioning'):
+            provisionStats = theResultEntry['imageProvisioning']
+        elif theResultEntry.has_key('leaseTimes'):
+            provisionStats = theResultEntry['leaseTimes']['imageProvisioning']
+        if not provisionStats is None:
+            report.write('<li><b>imageProvisioning</b>: %.1fsec, %d bytes written' % (provisionStats['time'], provisionStats['bytesWritten']))
+        if theResultEntry.has_key('leaseTimes'):
+            report.write('<li><b>emulatorLease</b>: %.1fsec (cold boot: %s)' % (theResultEntry['leaseTimes']['total'], theResultEntry['leaseTimes']['coldBoot']))
         report.write('<li><b>MD5 (hex)</b>: %s' % app.getMd5Hash())
         report.write('<li><b>Sha256 (hex)</b>: %s' % app.getSha256Hash())
         report.write('<li><b>maxLogcatSize</b>: %d' % theResultEntry['maxLogcatSize'])        
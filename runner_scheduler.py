@@ -0,0 +1,233 @@
+################################################################################
+#
+# Copyright (c) 2011-2012, Daniel Baeumges (dbaeumges@googlemail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+################################################################################
+
+from common import Logger
+
+import collections
+import datetime
+import heapq
+import Queue
+import time
+import traceback
+
+
+# ================================================================================
+# Runner Scheduler
+# ================================================================================
+class RunnerScheduler:
+    """
+    Dispatches apps to a fixed number of thread slots.
+    Runner threads put themselves into the finished queue as soon as they
+    are done, so the next app is started without delay. Runtime limits are
+    kept in a deadline heap: at the first deadline the thread is asked to
+    cancel, at the second one (theCancelTimeout later) it is killed.
+    Apps are either provided as list or pulled via theFetchAppFunc whenever
+    a slot is free (e.g. from a shared work queue).
+    """
+    CANCEL_DEADLINE = 1
+    KILL_DEADLINE = 2
+
+    MAX_WAIT_TIME = 60 # wake up at least once a minute
+    FETCH_INTERVAL = 10 # retry fetching apps every 10sec if a slot is free
+
+    def __init__(self, theNumSlots,
+                       theBuildThreadFunc,
+                       theResultFunc,
+                       theMaxThreadRuntime=300,
+                       theCancelTimeout=60,
+                       theFetchAppFunc=None,
+                       theFetchInterval=FETCH_INTERVAL,
+                       theLogger=Logger()):
+        """
+        theBuildThreadFunc(theApp, theSlot) returns a (not started) RunnerThread.
+        theResultFunc(theResult, theBadCancelationFlag) handles the result of a thread.
+        Apps whose thread cannot be built or started are handed over as well,
+        with a result containing app, times, and the error in the errorList.
+        theFetchAppFunc() returns the next app, None if there is currently no
+        app available, or raises StopIteration if there are no apps anymore.
+        It is called again after theFetchInterval seconds if a slot is free.
+        """
+        self.numSlots = theNumSlots
+        self.buildThreadFunc = theBuildThreadFunc
+        self.resultFunc = theResultFunc
+        self.maxThreadRuntime = theMaxThreadRuntime
+        self.cancelTimeout = theCancelTimeout
+        self.fetchAppFunc = theFetchAppFunc
+        self.fetchInterval = theFetchInterval
+        self.log = theLogger
+
+        self.slotList = [None] * theNumSlots
+        self.finishedQueue = Queue.Queue()
+        self.deadlineHeap = []
+        self.deadlineCounter = 0
+        self.pendingAppList = collections.deque()
+        self.fetchDoneFlag = theFetchAppFunc is None
+
+    def getNumRunningThreads(self):
+        return self.numSlots - self.slotList.count(None)
+
+    def run(self, theAppList=[]):
+        """
+        Runs all apps and returns after the last thread has finished.
+        """
+        self.pendingAppList.extend(theAppList)
+        try:
+            while True:
+                self._dispatch()
+                if len(self.pendingAppList) == 0 and self.getNumRunningThreads() == 0 and self.fetchDoneFlag:
+                    break
+
+                # Wait for a finished thread or the next deadline
+                waitTime = self.MAX_WAIT_TIME
+                if not self.fetchDoneFlag and None in self.slotList:
+                    waitTime = self.fetchInterval
+                if len(self.deadlineHeap) > 0:
+                    waitTime = max(0, min(waitTime, self.deadlineHeap[0][0] - time.time()))
+                try:
+                    runnerThread = self.finishedQueue.get(True, waitTime)
+                    self._finishThread(runnerThread)
+                except Queue.Empty:
+                    pass
+                self._checkDeadlines()
+
+        except KeyboardInterrupt:
+            self.log.write('KeyboardInterrupt detected, stop threads')
+            self._cancelAll()
+
+    def _dispatch(self):
+        """
+        Starts threads for pending apps as long as there are free slots.
+        """
+        while None in self.slotList:
+            if len(self.pendingAppList) == 0 and not self._fetchApp():
+                break
+            slot = self.slotList.index(None)
+            app = self.pendingAppList.popleft()
+            self.log.debug('Free thread found (%d) for analyzing %s' % (slot+1, app.getApkName()))
+            self.log.write('Analyze %s' % app.getApk())
+
+            try:
+                runnerThread = self.buildThreadFunc(app, slot)
+                runnerThread.finishedQueue = self.finishedQueue
+                self.slotList[slot] = runnerThread
+                self._pushDeadline(time.time() + self.maxThreadRuntime, self.CANCEL_DEADLINE, slot, runnerThread)
+                runnerThread.start()
+            except Exception, ex:
+                # Report the app as failed, the other apps are still dispatched
+                self.log.error('Failed to start thread for %s: %s' % (app.getApk(), str(ex)))
+                traceback.print_exc(file=self.log.log)
+                self.slotList[slot] = None
+                self._handleStartError(app, ex)
+
+    def _handleStartError(self, theApp, theError):
+        """
+        Hands an error result over for an app whose thread could not be
+        started, so it is still part of the results.
+        """
+        currentTime = datetime.datetime.now()
+        result = {'app' : theApp,
+                  'startTime' : currentTime,
+                  'endTime' : currentTime,
+                  'errorList' : [theError]}
+        try:
+            self.resultFunc(result, False)
+        except Exception, ex:
+            self.log.error('Failed to handle start error of %s: %s' % (theApp.getApk(), str(ex)))
+            traceback.print_exc(file=self.log.log)
+
+    def _fetchApp(self):
+        """
+        Fetches the next app into the pending list.
+        Returns false if no app is available.
+        """
+        if self.fetchDoneFlag:
+            return False
+        try:
+            app = self.fetchAppFunc()
+        except StopIteration:
+            self.log.debug('No more apps to fetch')
+            self.fetchDoneFlag = True
+            return False
+        except Exception, ex:
+            # Fetching is retried after the fetch interval
+            self.log.error('Failed to fetch app: %s' % str(ex))
+            traceback.print_exc(file=self.log.log)
+            return False
+        if app is None:
+            return False
+        self.pendingAppList.append(app)
+        return True
+
+    def _finishThread(self, theRunnerThread, theBadCancelationFlag=False):
+        """
+        Hands the result of the thread over and frees its slot.
+        Threads which do not own a slot anymore (killed before) are ignored.
+        """
+        if not theRunnerThread in self.slotList:
+            return
+        slot = self.slotList.index(theRunnerThread)
+        if not theBadCancelationFlag:
+            theRunnerThread.join()
+            self.log.debug('Thread %d for %s finished' % ((slot+1), theRunnerThread.app.getApk()))
+        try:
+            self.resultFunc(theRunnerThread.getResult(), theBadCancelationFlag)
+        except Exception, ex:
+            self.log.error('Failed to handle result of thread %d: %s' % ((slot+1), str(ex)))
+            traceback.print_exc(file=self.log.log)
+        finally:
+            self.slotList[slot] = None
+
+    def _pushDeadline(self, theTime, theType, theSlot, theRunnerThread):
+        self.deadlineCounter += 1
+        heapq.heappush(self.deadlineHeap, (theTime, self.deadlineCounter, theType, theSlot, theRunnerThread))
+
+    def _checkDeadlines(self):
+        """
+        Cancels or kills all threads whose deadline is reached.
+        """
+        currentTime = time.time()
+        while len(self.deadlineHeap) > 0 and self.deadlineHeap[0][0] <= currentTime:
+            deadline, counter, deadlineType, slot, runnerThread = heapq.heappop(self.deadlineHeap)
+            if not self.slotList[slot] is runnerThread:
+                continue # already finished
+
+            if deadlineType == self.CANCEL_DEADLINE:
+                self.log.debug('Thread %d for %s is running more than %dsec, cancel' % ((slot+1), runnerThread.app.getApk(), self.maxThreadRuntime))
+                runnerThread.cancelFlag = True
+                self._pushDeadline(currentTime + self.cancelTimeout, self.KILL_DEADLINE, slot, runnerThread)
+
+            elif runnerThread.isAlive(): # self.KILL_DEADLINE
+                self.log.error('Thread %d cannot be terminated, anyway free it up.' % ((slot+1)))
+                self._finishThread(runnerThread, True)
+                runnerThread.killEmulator()
+                runnerThread.join(10)
+
+    def _cancelAll(self):
+        """
+        Cancels all running threads and waits for them.
+        """
+        for runnerThread in list(self.slotList):
+            if not runnerThread is None:
+                runnerThread.cancelFlag = True
+                runnerThread.join(self.cancelTimeout) # Wait until finished
+                if runnerThread.isAlive():
+                    self._finishThread(runnerThread, True)
+                    runnerThread.killEmulator()
+                    runnerThread.join(10)
+                else:
+                    self._finishThread(runnerThread)
@@ -17,19 +17,25 @@
 ################################################################################
 
 from apk_wrapper import APKWrapper, APKWrapperError
+from app_loader import AppLoader
 from common import Logger, LogLevel, LogMode, SimulationSteps, Utils
 from emulator_client import *
+from emulator_pool import EmulatorPool, EmulatorPoolError, EmulatorResetMode
 from emulator_telnet_client import *
+from image_provisioner import ImageProvisioner, ImageProvisionMode
 from ms_db_interface import MsDbInterface, MsDbInterfaceError
 from optparse import OptionParser
 from report_generator import ReportGenerator
+from runner_scheduler import RunnerScheduler
 from taintlog_analyzer import TaintLogAnalyzer, TaintLogAnalyzerError
 from taintlog_json import CallActionLogEntry, CipherUsageLogEntry, FileSystemLogEntry, NetworkSendLogEntry, SSLLogEntry, SendSmsLogEntry
 from taintlog_json import AppReportEntry, MainReportEntry
 from taintlog_json import JsonFactory
 from threading import Thread
+from work_queue import WorkQueue, WorkQueueHeartbeat
 
 import datetime
+import json
 import os
 import shutil
 import time
@@ -45,6 +51,8 @@ class TaintDroidRunnerMode:
     INTERACTIVE_MODE = 3
     MS_MODE          = 4
     JSON_MODE        = 5
+    COORDINATOR_MODE = 6
+    WORKER_MODE      = 7
 
     @staticmethod
     def getModeFromString(theStr):
@@ -58,6 +66,10 @@ class TaintDroidRunnerMode:
             return TaintDroidRunnerMode.MS_MODE
         elif theStr == 'json':
             return TaintDroidRunnerMode.JSON_MODE
+        elif theStr == 'coordinator':
+            return TaintDroidRunnerMode.COORDINATOR_MODE
+        elif theStr == 'worker':
+            return TaintDroidRunnerMode.WORKER_MODE
         else:
             raise ValueError('Invalid TaintDroid Runner mode: %s' % theStr)
 
@@ -90,9 +102,12 @@ class RunnerThread(Thread):
         self.startTime = datetime.datetime.now()
 
         self.emulator = None
+        self.emulatorPool = None # leased from pool if set
+        self.emulatorSlot = 0
         self.result = {}
 
         self.cancelFlag = False # Flag for canceling run
+        self.finishedQueue = None # Queue to put thread in when finished
 
     def __checkForCancelation(self):
         """
@@ -108,10 +123,20 @@ class RunnerThread(Thread):
         return self.result
 
     def killEmulator(self):
-        if not self.emulator is None:
+        if not self.emulator is None and self.emulator.isRunning():
             self.emulator.killRun()
         
     def run(self):
+        """
+        Run the simulations and notify the scheduler afterwards.
+        """
+        try:
+            self._runSimulations()
+        finally:
+            if not self.finishedQueue is None:
+                self.finishedQueue.put(self)
+
+    def _runSimulations(self):
         """
         Run the simulations.
         """
@@ -122,13 +147,11 @@ class RunnerThread(Thread):
         self.log.debug('maxLogcatSize: %d' % self.maxLogcatSize)        
                     
         # Run apps    
+        brokenEmulatorFlag = True
         try:            
             imageDirPath = None
             self.log.write('Analyze app %s (%s)' % (self.app.getApkFileName(), self.app.getApkPath()))          
             
-            # Init clean image dir
-            imageDirPath = self._initCleanImageDir(self.tdRunnerMain.imageDirPath, self.app.getId(), self.app.getApkName())
-
             # Init result
             self.result['app'] = self.app
             self.result['cleanImageDir'] = imageDirPath
@@ -138,24 +161,41 @@ class RunnerThread(Thread):
             self.result['sleepTime'] = self.tdRunnerMain.sleepTime
             self.result['startTime'] = self.startTime
             self.result['errorList'] = []
+
+            # Init clean image dir
+            if self.emulatorPool is None:
+                imageDirPath = self._initCleanImageDir(self.tdRunnerMain.imageDirPath, self.app.getId(), self.app.getApkName())
+                self.result['cleanImageDir'] = imageDirPath
                 
             # Check for calcelation flag
             self.__checkForCancelation()                
                 
             # Start emulator
-            self.emulator = EmulatorClient(theSdkPath=self.tdRunnerMain.sdkPath,
-                                      thePort=self.emulatorPort,
-                                      theImageDirPath=imageDirPath,
-                                      theAvdName=self.tdRunnerMain.avdName,
-                                      theRunHeadlessFlag=self.tdRunnerMain.runHeadless,
-                                      theLogger=self.log)
-            self.emulator.start()                
+            if self.emulatorPool is None:
+                self.emulator = EmulatorClient(theSdkPath=self.tdRunnerMain.sdkPath,
+                                          thePort=self.emulatorPort,
+                                          theImageDirPath=imageDirPath,
+                                          theAvdName=self.tdRunnerMain.avdName,
+                                          theRunHeadlessFlag=self.tdRunnerMain.runHeadless,
+                                          theBootTimeout=self.tdRunnerMain.bootTimeout,
+                                          theAdbServerFlag=self.tdRunnerMain.useAdbServer,
+                                          theLogger=self.log)
+                try:
+                    self.emulator.start()
+                finally:
+                    self.result['bootTimes'] = self.emulator.getBootTimes()
+            else:
+                self.emulator, self.result['leaseTimes'] = self.emulatorPool.lease(self.emulatorSlot, self.log)
+                self.result['bootTimes'] = self.emulator.getBootTimes()
+                self.result['cleanImageDir'] = self.emulatorPool.getImageDirPath(self.emulatorSlot)
 
             # Run app
             keyboardInterruptFlag = self.runApp(self.emulator, self.app, self.simulationSteps)
 
             # Stop emulator
-            self.emulator.stop()
+            if self.emulatorPool is None:
+                self.emulator.stop()
+            brokenEmulatorFlag = False
 
             # Print results
             self.log.write('- App: %s (package: %s)' % (self.app.getApkFileName(), self.app.getPackage()))
@@ -170,14 +210,20 @@ class RunnerThread(Thread):
         except KeyboardInterrupt:
             pass
         except EmulatorClientError, ecErr:
-            pass
+            if self.result.has_key('errorList'):
+                self.result['errorList'].append(ecErr)
         except Exception, ex:
             traceback.print_exc(file=self.log.log)
             #raise ex
 
         finally:
+            # Give emulator back to pool
+            if not self.emulatorPool is None:
+                if not self.emulator is None:
+                    self.emulatorPool.release(self.emulatorSlot, self.emulator, brokenEmulatorFlag)
+                    
             # CleanUp folder
-            if self.tdRunnerMain.cleanUpImageDir:
+            elif self.tdRunnerMain.cleanUpImageDir:
                 self._cleanUpImageDir(imageDirPath)
             else:
                 self.log.info('Image dir \'%s\' will not be removed, cleanUpImageDir flag set to false.' % imageDirPath)
@@ -189,7 +235,6 @@ class RunnerThread(Thread):
         Also checks if all images are available.
         Return the new folder.
         """
-        imageFileList = ['ramdisk.img', 'sdcard.img', 'system.img', 'userdata.img', 'zImage']
         newPath = '/tmp/%s_%06d' % (theAppName, theSampleId)
         if os.path.exists(newPath):
             i = 1
@@ -202,10 +247,10 @@ class RunnerThread(Thread):
                 
         self.log.info('Create clean image dir: %s' % newPath)
         os.mkdir(newPath)
-        for imageFile in imageFileList:
-            self.__checkForCancelation()
-            self.log.info('- Copy %s' % imageFile)
-            shutil.copy2(os.path.join(theImageDir, imageFile), os.path.join(newPath, imageFile))
+        provisioner = ImageProvisioner(theImageDir,
+                                       ImageProvisionMode.getModeFromString(self.tdRunnerMain.imageProvisionMode),
+                                       theLogger=self.log)
+        self.result['imageProvisioning'] = provisioner.provision(newPath, self.__checkForCancelation)
         return newPath
 
     def _cleanUpImageDir(self, theImageDirPath):
@@ -226,7 +271,6 @@ class RunnerThread(Thread):
             if not os.path.exists(theLogcatDirPath):
                 os.mkdir(theLogcatDirPath)
         logcatFileName = '%s%s_%06d_logcat.log' % (theLogcatDirPath, theFileName, theSampleId)
-        self.result['logcatFileName'] = logcatFileName
         if os.path.exists(logcatFileName):
             i = 1
             while True:
@@ -235,6 +279,7 @@ class RunnerThread(Thread):
                     i += 1
                 else:
                     break
+        self.result['logcatFileName'] = logcatFileName
         self.log.debug('Store logcat in %s' % logcatFileName)
         return logcatFileName
     
@@ -311,22 +356,32 @@ class RunnerThread(Thread):
         # Change language code
         #theEmulator.setSimCountryIso('de')
                     
-        # Start logcat redirect
+        # Start logcat redirect (or stream which is analyzed while the app is running)
         logcatRedirectFile = '/mnt/sdcard/logcat.log'
-        theEmulator.startLogcatRedirect(logcatRedirectFile, self.maxLogcatSize)
+        logAnalyzer = None
+        if self.tdRunnerMain.streamLogcat:
+            logcatFileName = self._getLogcatFileName(self.tdRunnerMain._getLogDirPath(), theApp.getId(), theApp.getApkName())
+            logAnalyzer = TaintLogAnalyzer(theLogger=self.log)
+            logAnalyzer.startLogStream()
+            theEmulator.startLogcatStream(logcatFileName, logAnalyzer.addLogLine)
+        else:
+            theEmulator.startLogcatRedirect(logcatRedirectFile, self.maxLogcatSize)
         
-        # Switch on taint tracking
-        #theEmulator.setProperty('tdroid.global.taintmask', '7176')
-        theEmulator.changeGlobalTaintLogState('1', True)
-                    
-        # Start all services
+        # Switch on taint tracking and start all services (one adb shell call)
+        deviceSession = theEmulator.createDeviceSession()
+        #deviceSession.setProperty('tdroid.global.taintmask', '7176')
+        deviceSession.changeGlobalTaintLogState('1', True)
         self.__checkForCancelation()
         if (theSteps & SimulationSteps.START):
-            try:
-                for service in theApp.getServiceNameList():
-                    theEmulator.startService(theApp.getPackage(), service)
-            except EmulatorClientError, ecErr:
-                self.result['errorList'].append(ecErr)
+            for service in theApp.getServiceNameList():
+                deviceSession.startService(theApp.getPackage(), service)
+        try:
+            for cmd, status, output in deviceSession.flush():
+                if status != 0:
+                    self.result['errorList'].append(EmulatorClientError('Command %s failed with exit status %d: %s' % (cmd, status, output.strip()),
+                                                                        theCode=EmulatorClientError.DEVICE_SESSION_ERROR))
+        except EmulatorClientError, ecErr:
+            self.result['errorList'].append(ecErr)
 
         # Simulations
         keyboardInterruptFlag = False
@@ -366,27 +421,30 @@ class RunnerThread(Thread):
             raw_input('Press to end...')
 
         # End
-        logAnalyzer = None
         try:
             self.log.write('- %s: Analyze log' % Utils.getTimeAsString(datetime.datetime.now()))
-            # Store log in logfile
-            #log = theEmulator.getLog()
-            theEmulator.stopLogcatRedirect()
-            #log = theEmulator.getLogcatRedirectFile(logcatRedirectFile)
-            #self._storeLogcatAsFile(self.tdRunnerMain._getLogDirPath(), theApp.getId(), theApp.getApkName(), log)
-            logcatFileName = self._getLogcatFileName(self.tdRunnerMain._getLogDirPath(), theApp.getId(), theApp.getApkName())
-            theEmulator.storeLogcatRedirectFile(logcatRedirectFile, logcatFileName)
-            
-            # Build LogAnalyzer
-            logAnalyzer = TaintLogAnalyzer(theLogger=self.log)
-            #logAnalyzer.setLogString(log)
-            logAnalyzer.setLogFile(logcatFileName)
-            logAnalyzer.extractLogEntries()
+            if self.tdRunnerMain.streamLogcat:
+                # Log entries are already extracted
+                theEmulator.stopLogcatStream()
+            else:
+                # Store log in logfile
+                #log = theEmulator.getLog()
+                theEmulator.stopLogcatRedirect()
+                #log = theEmulator.getLogcatRedirectFile(logcatRedirectFile)
+                #self._storeLogcatAsFile(self.tdRunnerMain._getLogDirPath(), theApp.getId(), theApp.getApkName(), log)
+                logcatFileName = self._getLogcatFileName(self.tdRunnerMain._getLogDirPath(), theApp.getId(), theApp.getApkName())
+                theEmulator.storeLogcatRedirectFile(logcatRedirectFile, logcatFileName)
+
+                # Build LogAnalyzer
+                logAnalyzer = TaintLogAnalyzer(theLogger=self.log)
+                #logAnalyzer.setLogString(log)
+                logAnalyzer.setLogFile(logcatFileName)
+                logAnalyzer.extractLogEntries()
             logAnalyzer.postProcessLogObjects()
             self.result['errorList'].extend(logAnalyzer.getJson2PyFailedErrorList())
             
         except EmulatorClientError, ecErr:
-            self.result['errorList'].append(exErr)
+            self.result['errorList'].append(ecErr)
             
         except TaintLogAnalyzerError, tlaErr:
             self.result['errorList'].append(tlaErr)
@@ -544,8 +602,21 @@ class TaintDroidRunner:
 
         self.imageDirPath = '' # path to TaintDroid 2.3 image files
         self.numThreads = 1 # number of parallell threads for analyzing
+        self.numLoaderThreads = 4 # number of threads loading the apps of appDir
         self.emulatorStartPort = 5554
         self.maxThreadRuntime = 300
+        self.bootTimeout = 300
+        self.useAdbServer = True # talk to the adb server instead of running adb per command
+
+        self.imageProvisionMode = 'shared'
+        self.useEmulatorPool = False # reuse emulators instead of cold boot per app
+        self.poolResetMode = 'snapshot'
+        self.streamLogcat = False # analyze logcat while the app is running
+
+        self.workQueueDb = 'work_queue.db' # shared queue of coordinator and worker mode
+        self.workerId = None
+        self.leaseTimeout = 120
+        self.queuePollInterval = 10
 
         self.reportPathSuffix = theReportPathSuffix
         self.reportPath = ''
@@ -575,7 +646,8 @@ class TaintDroidRunner:
         # Report mode
         if self.mode == TaintDroidRunnerMode.REPORT_MODE or \
                 self.mode == TaintDroidRunnerMode.MS_MODE or \
-                self.mode == TaintDroidRunnerMode.JSON_MODE:
+                self.mode == TaintDroidRunnerMode.JSON_MODE or \
+                self.mode == TaintDroidRunnerMode.COORDINATOR_MODE:
             # Create report directory if it not exists
             self.reportPath = self._getReportDirPath()
             if not os.path.exists(self.reportPath):
@@ -650,6 +722,95 @@ class TaintDroidRunner:
                 
         return reportName    
 
+    def _buildRunnerThread(self, theApp, theSlot, theEmulatorPool=None, theThreadLogFileList=None):
+        """
+        Builds the runner thread for analyzing the app in the provided slot.
+        """
+        # Determine logger
+        threadLogger = self.log
+        if self.storeLogInFile:
+            logFileName = self._getAppThreadLogFile(theApp.getId(), theApp.getApkName())
+            logFile = '%s%s' % (self._getLogDirPath(), logFileName)
+            if not theThreadLogFileList is None:
+                theThreadLogFileList.append(logFileName)
+            threadLogger = Logger(theLevel=self.log.level,
+                                  theMode=LogMode.FILE,
+                                  theLogFile=logFile)
+
+        # Build thread
+        runnerThread = RunnerThread(self, theApp=theApp, theLogger=threadLogger)
+        runnerThread.emulatorPort = self.emulatorStartPort + (theSlot*2)
+        runnerThread.emulatorPool = theEmulatorPool
+        runnerThread.emulatorSlot = theSlot
+        runnerThread.daemon = False
+        runnerThread.startTime = datetime.datetime.now()
+        return runnerThread
+
+    def _buildEmulatorPool(self, theNumThreads):
+        """
+        Builds the emulator pool if it should be used.
+        """
+        if not self.useEmulatorPool:
+            return None
+        return EmulatorPool(theNumThreads,
+                            self.imageDirPath,
+                            theStartPort=self.emulatorStartPort,
+                            theSdkPath=self.sdkPath,
+                            theAvdName=self.avdName,
+                            theRunHeadlessFlag=self.runHeadless,
+                            theBootTimeout=self.bootTimeout,
+                            theResetMode=EmulatorResetMode.getModeFromString(self.poolResetMode),
+                            theProvisionMode=ImageProvisionMode.getModeFromString(self.imageProvisionMode),
+                            theAdbServerFlag=self.useAdbServer,
+                            theLogger=self.log)
+
+    def _getBootTime(self, theThreadResult):
+        """
+        Returns the total boot time of the thread result or -1.
+        """
+        if theThreadResult.has_key('bootTimes') and theThreadResult['bootTimes'].has_key('total'):
+            return theThreadResult['bootTimes']['total']
+        return -1
+
+    def _getAppReportEntry(self, theAppResult):
+        """
+        Builds the JSON app report entry of an entry of the result list.
+        """
+        return AppReportEntry(id=theAppResult['id'],
+                              appPackage=theAppResult['appPackage'],
+                              appPath=theAppResult['appPath'],
+                              logcatFile=theAppResult['logcatFileName'],
+                              md5Hash=theAppResult['appMd5Hash'],
+                              bootTime=theAppResult['bootTime'],
+                              startTime='%s %s' % (Utils.getDateAsString(theAppResult['startTime']), Utils.getTimeAsString(theAppResult['startTime'])),
+                              endTime='%s %s' % (Utils.getDateAsString(theAppResult['endTime']), Utils.getTimeAsString(theAppResult['endTime'])),
+                              errorList=theAppResult['errorList'])
+
+    def _getErrorResultEntry(self, theAppPath, theErrorList, theId=0):
+        """
+        Builds the result list entry of an app which could not be analyzed
+        at all (e.g. it could not be loaded).
+        """
+        currentTime = datetime.datetime.now()
+        return {'app' : theAppPath,
+                'id' : theId,
+                'appPackage' : '',
+                'appPath' : theAppPath,
+                'reportName' : '',
+                'startTime' : currentTime,
+                'endTime' : currentTime,
+                'appMd5Hash' : '',
+                'logcatFileName' : '',
+                'bootTime' : -1,
+                'numCallAction' : -1,
+                'numCipherUsage' : -1,
+                'numFileSystem' : -1,
+                'numNetwork' : -1,
+                'numSSL' : -1,
+                'numSMS' : -1,
+                'numErrors' : len(theErrorList),
+                'errorList' : [str(error) for error in theErrorList]}
+
     # ================================================================================
     # Run
     # ================================================================================
@@ -660,171 +821,79 @@ class TaintDroidRunner:
         # Check for equal emulatorStartPort
         if int(self.emulatorStartPort) % 2 != 0:
             raise ValueError('Emulator start port has to be even')
+
+        # Distributed modes
+        if self.mode == TaintDroidRunnerMode.COORDINATOR_MODE:
+            self._runCoordinator()
+            return
+        elif self.mode == TaintDroidRunnerMode.WORKER_MODE:
+            self._runWorker()
+            return
             
         # Init result vec
         threadLogFileList = []
             
         # Build list of apps to be run      
         appList = [] 
+        appLoader = None
         if self.app is not None and self.appDir is not None:
             raise TaintDroidRunnerError('Both application and application directory set')
         elif self.app is not None:
             try:                
                 appList.append(APKWrapper(self.app, theSdkPath=self.sdkPath, theLogger=self.log))
             except APKWrapperError, apkwErr:
-                self.log.debug('App %s could not be load: %s' % (self.app, str(apkwErr)))
-                aResultEntry = {'app' : self.app,
-                                'errorList' : [apkwErr]}
-                self.resultVec.append(aResultEntry)
+                self._handleAppLoadError(self.app, apkwErr)
         elif self.appDir is not None:
+            if self.mode == TaintDroidRunnerMode.INTERACTIVE_MODE:
+                raise TaintDroidRunnerError('Interactive mode can only work with one app')
+            # Apps are loaded in the background and started as soon as they are ready
             appNameList = Utils._getAppListInDirectory(self.appDir)
-            for appName in appNameList:
-                try:
-                    appList.append(APKWrapper(appName, theSdkPath=self.sdkPath, theLogger=self.log))
-                except APKWrapperError, apkwErr:
-                    aResultEntry = {'app' : appName,
-                                    'errorList' : [apkwErr]}
-                    self.resultVec.append(aResultEntry)
+            appLoader = AppLoader(appNameList,
+                                  lambda theAppName: APKWrapper(theAppName, theSdkPath=self.sdkPath, theLogger=self.log),
+                                  self._handleAppLoadError,
+                                  theNumThreads=self.numLoaderThreads,
+                                  theLogger=self.log)
+            appLoader.start()
         else:
             raise TaintDroidRunnerError('Neither application nor application directory set')        
 
-        # Determine SampleIds
-        if self.mode == TaintDroidRunnerMode.MS_MODE:
-            self.msDb.connect()
-            for app in appList:
-                sampleId = self.msDb.storeSample(app.getApkFileName(),
-                                                 app.getPackage(),
-                                                 theMd5Value=app.getMd5Hash(),
-                                                 theSha256Value=app.getSha256Hash(),
-                                                 theFilesystemPosition=app.getApk())
-                app.setId(sampleId)
-            self.msDb.commit()
-            self.msDb.close()
-
-        # Debug info
+        # Determine SampleIds and debug info
         self.log.write('The following apps are analyzed:')
-        for app in appList:
-            self.log.write('- %s (%s), id=%06d' % (app.getApkFileName(), app.getApkPath(), app.getId()))
+        self._registerApps(appList)
           
         # Run
         if self.mode != TaintDroidRunnerMode.INTERACTIVE_MODE:
             # Adjust max thread number if numTheads > numApps
             numThreads = self.numThreads
-            if numThreads > len(appList):
-                self.log.debug('- Number of threads is greater than number of apps to be analyzed. Reduce number of threads from %d to %d.' % (int(numThreads), int(len(appList))))
-                numThreads = len(appList)
-
-            # Inits
-            numFinishedApps = 0 # number of analyzed apps
-            lastAppIndex = 0 # next app to be analyzed
-            numRunningThreads = 0 # number of running threads
-            threadList = [] # list of threads, size=numThreads
-            threadActiveMask = [] # bitmask to determine if thread is active, size=numThreads            
-            for i in xrange(numThreads):
-                threadList.append(None)
-                threadActiveMask.append(False)
-                
-            while True:
-                try:
-                    # Get app and start thread
-                    if numRunningThreads < numThreads and lastAppIndex < len(appList):
-                        # Get app
-                        app = appList[lastAppIndex]                    
-
-                        # Check for inactive thread
-                        threadIndex = -1
-                        for i in xrange(numThreads):
-                            if not threadActiveMask[i]:
-                                threadIndex = i
-                        if threadIndex == -1:
-                            self.log.error('No free thread index found even though numRunningThreads < numThreads')
-                            continue
-                        lastAppIndex += 1
-                        self.log.debug('Free thread found (%d) for analyzing %s' % (threadIndex+1, app.getApkName()))
-                        self.log.write('Analyze %s' % app.getApk())
-
-                        # Determine logger
-                        threadLogger = self.log
-                        if self.storeLogInFile:
-                            logFileName = self._getAppThreadLogFile(app.getId(), app.getApkName())
-                            logFile = '%s%s' % (self._getLogDirPath(), logFileName)
-                            threadLogFileList.append(logFileName)
-                            threadLogger = Logger(theLevel=self.log.level,
-                                                  theMode=LogMode.FILE,
-                                                  theLogFile=logFile)
-
-                        # Build thread
-                        runnerThread = RunnerThread(self, theApp=app, theLogger=threadLogger)
-                        runnerThread.emulatorPort = self.emulatorStartPort + (threadIndex*2)
-                        runnerThread.daemon = False
-                        runnerThread.startTime = datetime.datetime.now()
-
-                        # Start thread
-                        threadList[threadIndex] = runnerThread
-                        threadActiveMask[threadIndex] = True
-                        numRunningThreads += 1
-                        runnerThread.start()
+            numApps = len(appList)
+            if not appLoader is None:
+                numApps = appLoader.getNumPendingApps()
+            if numThreads > numApps:
+                self.log.debug('- Number of threads is greater than number of apps to be analyzed. Reduce number of threads from %d to %d.' % (int(numThreads), int(numApps)))
+                numThreads = numApps
+
+            # Emulator pool
+            emulatorPool = self._buildEmulatorPool(numThreads)
+
+            # Run apps
+            fetchAppFunc = None
+            if not appLoader is None and appLoader.getNumPendingApps() > 0:
+                fetchAppFunc = lambda: self._fetchLoadedApp(appLoader)
+            scheduler = RunnerScheduler(numThreads,
+                                        lambda theApp, theSlot: self._buildRunnerThread(theApp, theSlot, emulatorPool, threadLogFileList),
+                                        self._handleThreadResult,
+                                        theMaxThreadRuntime=self.maxThreadRuntime,
+                                        theFetchAppFunc=fetchAppFunc,
+                                        theFetchInterval=AppLoader.FETCH_INTERVAL,
+                                        theLogger=self.log)
+            try:
+                scheduler.run(appList)
+            except Exception, ex:
+                traceback.print_exc(file=self.log.log)
 
-                    # No free thread -> check timing
-                    else:
-                        if lastAppIndex < len(appList):
-                            self.log.debug('No free thread found, wait for free thread')
-                        else:
-                            self.log.debug('No more apps to be analyzed, wait for end of analysis')
-                        
-                        # Check for inactive threads
-                        currentTime = datetime.datetime.now()
-                        for i in xrange(numThreads):
-                            # Thread terminated regulary
-                            if not threadList[i] is None and not threadList[i].isAlive():
-                                self.log.debug('Thread %d for %s finished' % ((i+1), threadList[i].app.getApk()))
-                                self._handleThreadResult(threadList[i].getResult())
-                                numFinishedApps += 1
-                                threadList[i] = None
-                                threadActiveMask[i] = False
-                                numRunningThreads -= 1
-
-                            # Check how long thread is running                           
-                            elif not threadList[i] is None:                                
-                                runningTime = currentTime - threadList[i].startTime
-                                if runningTime.seconds > self.maxThreadRuntime:
-                                    self.log.debug('Thread %d for %s is running more than %dsec, cancel' % ((i+1), threadList[i].app.getApk(), self.maxThreadRuntime))
-                                    threadList[i].cancelFlag = True
-                                    threadList[i].join(60) # Wait until finished, max 1min
-                                    if threadList[i].isAlive():
-                                        self.log.error('Thread %d cannot be terminated, anyway free it up.' % ((i+1)))
-                                        self._handleThreadResult(threadList[i].getResult(), True)
-                                        threadList[i].killEmulator()
-                                        threadList[i].join(10)
-                                    else:
-                                        self.log.debug('Thread %d successfully terminated' % ((i+1)))
-                                        self._handleThreadResult(threadList[i].getResult())
-                                    numFinishedApps += 1
-                                    threadList[i] = None
-                                    threadActiveMask[i] = False
-                                    numRunningThreads -= 1                                    
-
-                        # Sleep
-                        time.sleep(10)
-
-                    # Check for end
-                    if numFinishedApps == len(appList):
-                        break
-                    
-                except KeyboardInterrupt:
-                    self.log.write('KeyboardInterrupt detected, stop threads')
-                    for runnerThread in threadList:
-                        if not runnerThread is None:
-                            runnerThread.cancelFlag = True
-                            runnerThread.join(60) # Wait until finished, max 1min
-                            self._handleThreadResult(runnerThread.getResult())
-                            if runnerThread.isAlive():
-                                runnerThread.killEmulator()
-                                runnerThread.join(10)
-                    break
-                        
-                except Exception, ex:
-                    traceback.print_exc(file=self.log.log)
+            # Stop pooled emulators
+            if not emulatorPool is None:
+                emulatorPool.shutdown(self.cleanUpImageDir)
                     
         else: # self.mode == TaintDroidRunnerMode.INTERACTIVE_MODE:
             # Initial check
@@ -868,10 +937,8 @@ class TaintDroidRunner:
                         runnerThread.start()
                         self.log.debug('Runner thread started')
                         try:
-                            while True:
-                                time.sleep(10)
-                                if not runnerThread.isAlive():
-                                    break
+                            while runnerThread.isAlive():
+                                runnerThread.join(1)
                         except KeyboardInterrupt:
                             self.log.debug('KeyboardInterrupt detected, stop threads')
                             runnerThread.cancelFlag = True
@@ -894,6 +961,42 @@ class TaintDroidRunner:
         self._handleMainResult(threadLogFileList)
             
 
+    def _handleAppLoadError(self, theAppName, theError):
+        """
+        Adds an app which could not be loaded to the result list.
+        """
+        self.log.debug('App %s could not be load: %s' % (theAppName, str(theError)))
+        self.resultVec.append(self._getErrorResultEntry(theAppName, [theError]))
+
+    def _registerApps(self, theAppList):
+        """
+        Determines the sample ids of the apps (MS mode) and logs them.
+        """
+        if len(theAppList) == 0:
+            return
+        if self.mode == TaintDroidRunnerMode.MS_MODE:
+            self.msDb.connect()
+            for app in theAppList:
+                sampleId = self.msDb.storeSample(app.getApkFileName(),
+                                                 app.getPackage(),
+                                                 theMd5Value=app.getMd5Hash(),
+                                                 theSha256Value=app.getSha256Hash(),
+                                                 theFilesystemPosition=app.getApk())
+                app.setId(sampleId)
+            self.msDb.commit()
+            self.msDb.close()
+        for app in theAppList:
+            self.log.write('- %s (%s), id=%06d' % (app.getApkFileName(), app.getApkPath(), app.getId()))
+
+    def _fetchLoadedApp(self, theAppLoader):
+        """
+        Returns the next app of the loader and registers it (see _registerApps).
+        """
+        app = theAppLoader.fetchApp()
+        if not app is None:
+            self._registerApps([app])
+        return app
+
     def _handleThreadResult(self, theThreadResult, theBadCancelationFlag=False):
         """
         Adds the thread results to the result list.
@@ -1021,6 +1124,10 @@ class TaintDroidRunner:
             logcatFileName = ''
             if theThreadResult.has_key('logcatFileName'):
                 logcatFileName = theThreadResult['logcatFileName']
+            bootTime = self._getBootTime(theThreadResult)
+            errorList = [str(error) for error in theThreadResult['errorList']]
+            if theBadCancelationFlag:
+                errorList.append('Thread was aborted and not terminated')
             reportResultEntry = {'id' : appId,
                                  'appPackage' : theThreadResult['app'].getPackage(),
                                  'appPath' : theThreadResult['app'].getApk(),
@@ -1029,13 +1136,15 @@ class TaintDroidRunner:
                                  'endTime' : theThreadResult['endTime'],
                                  'appMd5Hash' : theThreadResult['app'].getMd5Hash(),
                                  'logcatFileName' : logcatFileName,
+                                 'bootTime' : bootTime,
                                  'numCallAction' : numCallAction,
                                  'numCipherUsage' : numCipherUsage,
                                  'numFileSystem' : numFileSystem,
                                  'numNetwork' : numNetwork,
                                  'numSSL' : numSSL,
                                  'numSMS' : numSMS,
-                                 'numErrors' : numErrors}
+                                 'numErrors' : numErrors,
+                                 'errorList' : errorList}
                         
             self.resultVec.append(reportResultEntry)
 
@@ -1071,25 +1180,225 @@ class TaintDroidRunner:
             reportFile = '%sreport.html' % (self.reportPath)
             ReportGenerator.generateMainReport(reportFile, report)
 
-            jsonFileName = '%sreport.json' % (self.reportPath)
-            mainReport = MainReportEntry(workingDir=Utils.addSlashToPath(os.getcwd()),
-                                         startTime='%s %s' % (Utils.getDateAsString(self.startTime), Utils.getTimeAsString(self.startTime)),
-                                         endTime='%s %s' % (Utils.getDateAsString(endTime), Utils.getTimeAsString(endTime)),
-                                         appList=[])
+            appReportList = []
             for appResult in self.resultVec:
-                appReport = AppReportEntry(id=appResult['id'],
-                                           appPackage=appResult['appPackage'],
-                                           appPath=appResult['appPath'],
-                                           logcatFile=appResult['logcatFileName'],
-                                           md5Hash=appResult['appMd5Hash'],
-                                           startTime='%s %s' % (Utils.getDateAsString(appResult['startTime']), Utils.getTimeAsString(appResult['startTime'])),
-                                           endTime='%s %s' % (Utils.getDateAsString(appResult['endTime']), Utils.getTimeAsString(appResult['endTime'])))
-                mainReport.appList.append(appReport)
-
-            jsonFactory = JsonFactory()
-            jsonReportStr = jsonFactory.py2Json(mainReport)
-            jsonFile = open(jsonFileName, "w")
-            jsonFile.write(jsonReportStr)
+                appReportList.append(self._getAppReportEntry(appResult))
+            self._storeJsonMainReport(appReportList, endTime)
+
+    def _storeJsonMainReport(self, theAppReportList, theEndTime):
+        """
+        Stores the JSON main report.
+        """
+        jsonFileName = '%sreport.json' % (self.reportPath)
+        mainReport = MainReportEntry(workingDir=Utils.addSlashToPath(os.getcwd()),
+                                     startTime='%s %s' % (Utils.getDateAsString(self.startTime), Utils.getTimeAsString(self.startTime)),
+                                     endTime='%s %s' % (Utils.getDateAsString(theEndTime), Utils.getTimeAsString(theEndTime)),
+                                     appList=theAppReportList)
+
+        jsonFactory = JsonFactory()
+        jsonReportStr = jsonFactory.py2Json(mainReport)
+        jsonFile = open(jsonFileName, "w")
+        jsonFile.write(jsonReportStr)
+
+    # ================================================================================
+    # Distributed Run (Coordinator and Worker)
+    # ================================================================================
+    def _runCoordinator(self):
+        """
+        Fills the work queue with the provided applications and collects the
+        results pushed back by the workers until all jobs are done.
+        If the queue already contains jobs the previous run is resumed.
+        """
+        workQueue = WorkQueue(self.workQueueDb, theLeaseTimeout=self.leaseTimeout, theLogger=self.log)
+        workQueue.createTables()
+
+        # Fill queue
+        if workQueue.getNumJobs() > 0:
+            self.log.write('Work queue %s already contains %d jobs, resume' % (self.workQueueDb, workQueue.getNumJobs()))
+        else:
+            if self.app is not None and self.appDir is not None:
+                raise TaintDroidRunnerError('Both application and application directory set')
+            elif self.app is not None:
+                appPathList = [self.app]
+            elif self.appDir is not None:
+                appPathList = Utils._getAppListInDirectory(self.appDir)
+            else:
+                raise TaintDroidRunnerError('Neither application nor application directory set')
+            for appPath in appPathList:
+                workQueue.addJob(os.path.abspath(appPath))
+            self.log.write('Added %d apps to work queue %s' % (len(appPathList), self.workQueueDb))
+
+        # Collect results
+        appReportList = []
+        reportedJobIdSet = set()
+        lastResultId = 0
+        try:
+            while True:
+                workQueue.requeueExpiredJobs()
+                # Check before fetching: results committed after the check
+                # are still fetched in this iteration
+                finishedFlag = workQueue.isFinished()
+                for queueResult in workQueue.getResults(lastResultId):
+                    appReportList.append(self._handleQueueResult(queueResult))
+                    reportedJobIdSet.add(queueResult['jobId'])
+                    lastResultId = queueResult['resultId']
+                if finishedFlag:
+                    break
+                time.sleep(self.queuePollInterval)
+        except KeyboardInterrupt:
+            self.log.write('KeyboardInterrupt detected, stop collecting results (workers keep running)')
+
+        # Jobs given up after too many expired leases have no result
+        for jobId, apkPath in workQueue.getFailedJobList():
+            self.log.write('- Job %d (%s) failed' % (jobId, apkPath))
+            if not jobId in reportedJobIdSet:
+                errorList = ['Job was given up after %d attempts without result' % workQueue.maxNumAttempts]
+                appReportList.append(self._getAppReportEntry(self._getErrorResultEntry(apkPath, errorList, jobId)))
+
+        # Store results
+        self._storeJsonMainReport(appReportList, datetime.datetime.now())
+
+    def _handleQueueResult(self, theQueueResult):
+        """
+        Stores logcat and log entries of a result from the work queue in the
+        log directory and returns the app report entry (an error entry if the
+        app could not be analyzed).
+        """
+        self.log.write('Result of job %d received from worker %s' % (theQueueResult['jobId'], theQueueResult['workerId']))
+        errorList = []
+        if not theQueueResult['errorList'] is None:
+            errorList = json.loads(theQueueResult['errorList'])
+        for error in errorList:
+            self.log.write('- Error: %s' % error)
+
+        logcatFileName = ''
+        if not theQueueResult['logcatFileName'] is None:
+            logcatFileName = '%s%s' % (self._getLogDirPath(), theQueueResult['logcatFileName'])
+            if not theQueueResult['logcat'] is None:
+                logcatFile = open(logcatFileName, "w")
+                logcatFile.write(theQueueResult['logcat'])
+                logcatFile.close()
+            if not theQueueResult['logEntries'] is None:
+                logEntriesFile = open(logcatFileName.replace('_logcat.log', '_logentries.json'), "w")
+                logEntriesFile.write(theQueueResult['logEntries'])
+                logEntriesFile.close()
+
+        if theQueueResult['appReport'] is None:
+            return self._getAppReportEntry(self._getErrorResultEntry(theQueueResult['apkPath'], errorList, theQueueResult['jobId']))
+        jsonFactory = JsonFactory()
+        appReport = jsonFactory.json2Py(theQueueResult['appReport'])
+        appReport.logcatFile = logcatFileName
+        return appReport
+
+    def _runWorker(self):
+        """
+        Leases apps from the work queue, analyzes them in local threads,
+        and pushes the results back until the queue is finished.
+        """
+        workQueue = WorkQueue(self.workQueueDb, theLeaseTimeout=self.leaseTimeout, theLogger=self.log)
+        workerId = self.workerId
+        if workerId is None:
+            workerId = WorkQueue.getDefaultWorkerId()
+        workQueue.registerWorker(workerId, self.numThreads)
+        self.log.write('Worker %s started with %d threads' % (workerId, self.numThreads))
+
+        heartbeat = WorkQueueHeartbeat(workQueue, workerId, theInterval=max(1, self.leaseTimeout / 4), theLogger=self.log)
+        heartbeat.start()
+
+        # Run apps
+        emulatorPool = self._buildEmulatorPool(self.numThreads)
+        threadLogFileList = []
+        jobDict = {} # app -> job id
+        scheduler = RunnerScheduler(self.numThreads,
+                                    lambda theApp, theSlot: self._buildRunnerThread(theApp, theSlot, emulatorPool, threadLogFileList),
+                                    lambda theResult, theBadCancelationFlag: self._handleWorkerResult(workQueue, workerId, jobDict, theResult, theBadCancelationFlag),
+                                    theMaxThreadRuntime=self.maxThreadRuntime,
+                                    theFetchAppFunc=lambda: self._fetchWorkerApp(workQueue, workerId, jobDict),
+                                    theLogger=self.log)
+        try:
+            scheduler.run()
+        except Exception, ex:
+            traceback.print_exc(file=self.log.log)
+
+        # Stop
+        heartbeat.stop()
+        if not emulatorPool is None:
+            emulatorPool.shutdown(self.cleanUpImageDir)
+        self.log.write('Worker %s finished' % workerId)
+
+    def _fetchWorkerApp(self, theWorkQueue, theWorkerId, theJobDict):
+        """
+        Leases the next job from the work queue and returns its app.
+        Returns None if there is currently no job and raises StopIteration
+        if all jobs are finished.
+        """
+        while True:
+            job = theWorkQueue.leaseJob(theWorkerId)
+            if job is None:
+                if theWorkQueue.isFinished():
+                    raise StopIteration
+                return None
+
+            jobId, apkPath = job
+            try:
+                app = APKWrapper(apkPath, theSdkPath=self.sdkPath, theLogger=self.log)
+            except Exception, ex:
+                # The job is leased (and kept alive by the heartbeat), finish it
+                self.log.debug('App %s could not be load: %s' % (apkPath, str(ex)))
+                if not isinstance(ex, APKWrapperError):
+                    traceback.print_exc(file=self.log.log)
+                theWorkQueue.storeResult(jobId, theWorkerId,
+                                         theErrorList=json.dumps([str(ex)]),
+                                         theFailedFlag=True)
+                continue
+            app.setId(jobId)
+            theJobDict[app] = jobId
+            return app
+
+    def _handleWorkerResult(self, theWorkQueue, theWorkerId, theJobDict, theThreadResult, theBadCancelationFlag=False):
+        """
+        Pushes the thread result (logcat, log entries, and app report) back
+        into the work queue.
+        """
+        if not theThreadResult.has_key('endTime'):
+            theThreadResult['endTime'] = datetime.datetime.now()
+        app = theThreadResult['app']
+        jobId = theJobDict.pop(app)
+        jsonFactory = JsonFactory()
+
+        logcatFileName = None
+        logcat = None
+        if theThreadResult.has_key('logcatFileName'):
+            logcatFileName = os.path.basename(theThreadResult['logcatFileName'])
+            if os.path.exists(theThreadResult['logcatFileName']):
+                logcatFile = open(theThreadResult['logcatFileName'], "r")
+                logcat = logcatFile.read()
+                logcatFile.close()
+
+        logEntries = None
+        if theThreadResult.has_key('log') and not theThreadResult['log'] is None:
+            logEntries = jsonFactory.py2Json(theThreadResult['log'].getLogEntryList())
+
+        errorList = [str(error) for error in theThreadResult['errorList']]
+        if theBadCancelationFlag:
+            errorList.append('Thread was aborted and not terminated')
+
+        appResult = {'id' : app.getId(),
+                     'appPackage' : app.getPackage(),
+                     'appPath' : app.getApk(),
+                     'logcatFileName' : logcatFileName,
+                     'appMd5Hash' : app.getMd5Hash(),
+                     'bootTime' : self._getBootTime(theThreadResult),
+                     'startTime' : theThreadResult['startTime'],
+                     'endTime' : theThreadResult['endTime'],
+                     'errorList' : errorList}
+        theWorkQueue.storeResult(jobId, theWorkerId,
+                                 theLogcatFileName=logcatFileName,
+                                 theLogcat=logcat,
+                                 theLogEntries=logEntries,
+                                 theAppReport=jsonFactory.py2Json(self._getAppReportEntry(appResult)),
+                                 theErrorList=json.dumps(errorList),
+                                 theFailedFlag=theBadCancelationFlag or logEntries is None)
             
 
 # ================================================================================
@@ -1104,13 +1413,24 @@ def main():
     
     parser.add_option('-i', '--imageDirPath', metavar='<path>', help='Set path to the TaintDroid 2.3 image files zImage, system.img, ramdisk.img, and sdcard.img')
     parser.add_option('-t', '--numThreads', metavar='#', default=1, help='Number of threads to be used')
+    parser.add_option('', '--numLoaderThreads', metavar='#', default=4, help='Number of threads which load the apps of the app directory')
     parser.add_option('', '--maxThreadRuntime', metavar='<secs>', default=300, help='Maximum seconds for thread')
     parser.add_option('', '--emulatorStartPort', metavar='<port>', default=5554, help='First emulator port (has to be an even number)')
+    parser.add_option('', '--bootTimeout', metavar='<secs>', default=300, help='Maximum seconds to wait for the emulator to boot')
+    parser.add_option('', '--noAdbServer', action='store_true', default=False, help='Run the adb binary for each adb command instead of talking to the adb server directly')
+    parser.add_option('', '--imageProvisionMode', metavar='<mode>', default='shared', help='Provisioning of clean images: shared (link read-only images, reflink or sparse copy writable images) or copy (copy all images)')
+    parser.add_option('', '--useEmulatorPool', action='store_true', default=False, help='Keep one emulator per thread running and reset it between apps instead of booting a new one.')
+    parser.add_option('', '--poolResetMode', metavar='<mode>', default='snapshot', help='Reset of pooled emulators: snapshot (load snapshot of first boot) or restore (restore userdata.img and sdcard.img and reboot)')
+
+    parser.add_option('', '--workQueueDb', metavar='<file>', default='work_queue.db', help='Shared work queue database of coordinator and worker mode')
+    parser.add_option('', '--workerId', metavar='<id>', help='Name of the worker in worker mode (default: hostname and start time)')
+    parser.add_option('', '--leaseTimeout', metavar='<secs>', default=120, help='Seconds after which jobs of a worker without heartbeat are handed out again')
 
     parser.add_option('', '--reportPathSuffix', metavar='<path>', help='Report directory in which all files are stored (date is appended)')
     
     parser.add_option('-l', '--logPathSuffix', metavar='<path>', help='Set path to directory in which log and logcat files should be stored')
     parser.add_option('', '--storeLogInFile', action='store_true', default=False, help='Set to true (1) if outputs should be logged in separate file.')
+    parser.add_option('', '--streamLogcat', action='store_true', default=False, help='Read logcat via adb while the app is running and analyze it on the fly instead of pulling the (size limited) logcat file afterwards.')
     parser.add_option('', '--maxLogcatSize', metavar='kBytes', default=4096, help='Define the maximum logcat size in kBytes (logcat is ringbuffer), default is 4096kByes')
 
     parser.add_option('', '--sdkPath', metavar='<path>', help='Set path to Android SDK')
@@ -1139,13 +1459,23 @@ def main():
     
     tdroidRunner.imageDirPath = options.imageDirPath
     tdroidRunner.numThreads = int(options.numThreads)
+    tdroidRunner.numLoaderThreads = int(options.numLoaderThreads)
     tdroidRunner.maxThreadRuntime = int(options.maxThreadRuntime)
     tdroidRunner.emulatorStartPort = int(options.emulatorStartPort)    
+    tdroidRunner.bootTimeout = int(options.bootTimeout)
+    tdroidRunner.useAdbServer = not options.noAdbServer
+    tdroidRunner.imageProvisionMode = options.imageProvisionMode
+    tdroidRunner.useEmulatorPool = options.useEmulatorPool
+    tdroidRunner.poolResetMode = options.poolResetMode
+    tdroidRunner.workQueueDb = options.workQueueDb
+    tdroidRunner.workerId = options.workerId
+    tdroidRunner.leaseTimeout = int(options.leaseTimeout)
     
     if not tdroidRunner.storeLogInFile:
         tdroidRunner.storeLogInFile = options.storeLogInFile
 
     tdroidRunner.maxLogcatSize = int(options.maxLogcatSize)
+    tdroidRunner.streamLogcat = options.streamLogcat
 
     tdroidRunner.sdkPath = options.sdkPath
     tdroidRunner.avdName = options.avdName
@@ -23,6 +23,26 @@ from common import Logger, LogLevel
 import re
 
 
+# ================================================================================
+# TaintLog Line Patterns
+# ================================================================================
+TAINTLOG_BEGIN_STR = ') TaintLog: ['
+TAINTLOG_BEGIN_REGEX = re.compile('W\([ 0-9]{5}:0x[0-9a-f]*\) TaintLog: \[')
+#TAINTLOG_BEGIN_REGEX = re.compile('W/dalvikvm\([ 0-9]{5}\): TaintLog: \[')
+
+JSON_BATCH_SIZE = 1000 # JSON strings converted with one decoder call
+
+
+# ================================================================================
+# TaintLog Analyzer Enums
+# ================================================================================
+class LineEndingEnum:
+    NONE  = 'none'  # lines without line ending (log string, log stream)
+    LF    = 'lf'
+    CRLF  = 'crlf'  # also \r\r\n as written by some adb versions
+    MIXED = 'mixed'
+
+
 # ================================================================================
 # TaintLog Analyzer Error Obejct
 # ================================================================================ 
@@ -34,6 +54,97 @@ class TaintLogAnalyzerError(Exception):
         return repr(self.value)
 
 
+# ================================================================================
+# Log Pattern Matcher
+# ================================================================================ 
+class LogPatternMatcher:
+    """
+    Compiles a list of patterns (log entries used as templates) once for
+    matching many log entries. The patterns are grouped by log entry class
+    so that each entry is only checked against the patterns of its class,
+    with the match functions of the patterns (see getMatchFunc).
+    """
+    def __init__(self, thePatternList):
+        self.patternList = list(thePatternList)
+        self.matchFuncDict = {} # log entry class -> [(pattern index, match func)]
+        for i, pattern in enumerate(self.patternList):
+            matchFunc = pattern.getMatchFunc()
+            for aClass in pattern.__class__.__mro__:
+                if aClass is BaseLogEntry or not issubclass(aClass, BaseLogEntry):
+                    continue
+                self.matchFuncDict.setdefault(aClass, []).append((i, matchFunc))
+
+    def getNumPatterns(self):
+        return len(self.patternList)
+
+    def matches(self, theLogEntry):
+        """
+        Returns if the log entry matches to one of the patterns.
+        """
+        for i, matchFunc in self.matchFuncDict.get(theLogEntry.__class__, []):
+            if matchFunc(theLogEntry):
+                return True
+        return False
+
+    def getMatchingPatternIndexList(self, theLogEntry):
+        """
+        Returns the indices of all patterns the log entry matches to.
+        """
+        return [i for i, matchFunc in self.matchFuncDict.get(theLogEntry.__class__, []) if matchFunc(theLogEntry)]
+
+
+# ================================================================================
+# Log Entry Index
+# ================================================================================ 
+class LogEntryIndex:
+    """
+    Index of a list of log entries by log entry class and by action, built
+    in one pass. The indexed lists keep the order of the log entries.
+    """
+    def __init__(self, theLogEntryList):
+        self.logEntryList = theLogEntryList
+        self.numLogEntries = len(theLogEntryList)
+        self.classDict = {} # log entry class -> log entries
+        self.actionDict = {} # action -> log entries
+        for logEntry in theLogEntryList:
+            classLogEntryList = self.classDict.get(logEntry.__class__)
+            if classLogEntryList is None:
+                classLogEntryList = self.classDict[logEntry.__class__] = []
+            classLogEntryList.append(logEntry)
+            action = getattr(logEntry, 'action', None)
+            if not action is None:
+                self.actionDict.setdefault(action, []).append(logEntry)
+
+    def isValid(self, theLogEntryList):
+        """
+        Returns if the index belongs to the provided list, i.e. the list was
+        neither replaced nor extended since the index was built.
+        """
+        return self.logEntryList is theLogEntryList and self.numLogEntries == len(theLogEntryList)
+
+    def getLogEntryList(self, theType):
+        classList = [aClass for aClass in self.classDict.iterkeys() if issubclass(aClass, theType)]
+        if len(classList) == 0:
+            return []
+        if len(classList) == 1:
+            return list(self.classDict[classList[0]])
+        # Several classes: keep the order of the log entries
+        return [logEntry for logEntry in self.logEntryList if isinstance(logEntry, theType)]
+
+    def getNumLogEntries(self, theType):
+        num = 0
+        for aClass, logEntryList in self.classDict.iteritems():
+            if issubclass(aClass, theType):
+                num += len(logEntryList)
+        return num
+
+    def getLogEntryListByAction(self, theAction):
+        return list(self.actionDict.get(theAction, []))
+
+    def getNumLogEntriesByAction(self, theAction):
+        return len(self.actionDict.get(theAction, []))
+
+
 # ================================================================================
 # Log Analyzer
 # ================================================================================ 
@@ -43,43 +154,45 @@ class TaintLogAnalyzer:
 
         self.jsonFactory = JsonFactory()
         
+        self.logFile = None # read line by line during extraction
         self.logLines = []
         self.logEntryList = []
+        self.logEntryIndex = None # LogEntryIndex of logEntryList (see __getIndex)
         self.json2pyFailedList = []
         self.json2pyFailedErrorList = []
 
-        self.numControlChars = 0
+        self.lineEnding = None # detected on the TaintLog lines during extraction
+
+        self.jsonStringDict = {} # parts of unfinished JSON strings per pidTid
 
     def setLogFile(self, theFile):
         """
-        Sets the log lines from the provided file
+        Sets the file from which the log lines are read.
+        The file is not read before the extraction and its lines are not
+        kept in memory. Raises an IOError if the file cannot be opened.
         """
-        logFile = open(theFile, 'r')
-        for line in logFile:
-            self.logLines.append(line)
-        self.numControlChars = 1
+        open(theFile, 'r').close()
+        self.logFile = theFile
+        self.logLines = []
 
     def setLogString(self, theStr):
         """
         Sets the log lines from the provided string splitted by \r\n
         """
+        self.logFile = None
         self.logLines = theStr.split('\r\n')
-        self.numControlChars = 0
 
     def getLogEntryList(self, theType=None):
         """
         Returns the extracted log objects.
         extractLogObjects need to be run before.
         If theType is specified only entries of this instance are returned
+        (looked up in the index)
         """
         if theType is None:
             return self.logEntryList
         else:
-            logEntryList = []
-            for logEntry in self.logEntryList:
-                if isinstance(logEntry, theType):
-                    logEntryList.append(logEntry)
-            return logEntryList
+            return self.__getIndex().getLogEntryList(theType)
 
     def getNumLogEntries(self, theType=None):
         """
@@ -90,12 +203,38 @@ class TaintLogAnalyzer:
         if theType is None:
             return len(self.logEntryList)
         else:
-            num = 0
-            for logEntry in self.logEntryList:
-                if isinstance(logEntry, theType):
-                    num += 1
-            return num
+            return self.__getIndex().getNumLogEntries(theType)
+
+    def getLogEntryListByAction(self, theAction):
+        """
+        Returns the log objects with the provided action (e.g. a
+        TaintLogActionEnum or CipherActionEnum value).
+        """
+        return self.__getIndex().getLogEntryListByAction(theAction)
+
+    def getNumLogEntriesByAction(self, theAction):
+        """
+        Returns the number of log objects with the provided action.
+        """
+        return self.__getIndex().getNumLogEntriesByAction(theAction)
+
+    def __getIndex(self):
+        """
+        Returns the index of the log objects. It is built after post
+        processing and filtering, and rebuilt here if the list was changed
+        otherwise (e.g. extended while streaming or set from a cache).
+        """
+        if self.logEntryIndex is None or not self.logEntryIndex.isValid(self.logEntryList):
+            self.logEntryIndex = LogEntryIndex(self.logEntryList)
+        return self.logEntryIndex
                 
+    def getLineEnding(self):
+        """
+        Returns the line ending of the TaintLog lines (LineEndingEnum) found
+        during the extraction, None if there was no TaintLog line.
+        """
+        return self.lineEnding
+
     def getJson2PyFailedList(self):
         """
         Returns the list of JSON strings which couldn't
@@ -115,258 +254,363 @@ class TaintLogAnalyzer:
         Extract JSON objects out of the log lines.
         setLogFile(<file>) or setLogString(<string>) need to be run before
         """
-        # Init regex
-        regexBegin = 'W\([ 0-9]{5}:0x[0-9a-f]*\) TaintLog: \['
-        #regexBegin = 'W/dalvikvm\([ 0-9]{5}\): TaintLog: \['
-        #regexGoOn = 'W/dalvikvm\([ 0-9]{5}\): '
-        
-        # Extract JSON strings
-        self.log.info('Extract JSON string lines')
-        jsonStringVec = []
+        self.log.info('Extract JSON strings and objects')
+        self.logEntryList = list(self.iterLogEntries())
+
+    def iterLogEntries(self):
+        """
+        Yields the log objects of the log file (or string) one by one:
+        file -> log line -> JSON string -> log objects.
+        Neither the log lines nor the JSON strings are kept in memory, so
+        consumers which do not need the complete list can process logs of
+        any size. Failed conversions are collected as in extractLogEntries.
+        setLogFile(<file>) or setLogString(<string>) need to be run before
+        """
+        self.__resetExtraction()
+        jsonStringList = []
+        for jsonString in self.extractJsonStrings(self.__iterLogLines()):
+            jsonStringList.append(jsonString)
+            if len(jsonStringList) >= JSON_BATCH_SIZE:
+                for logEntry in self.__convertJsonStrings(jsonStringList):
+                    yield logEntry
+                jsonStringList = []
+        for logEntry in self.__convertJsonStrings(jsonStringList):
+            yield logEntry
+
+    def startLogStream(self):
+        """
+        Prepares the analyzer for log lines which are added one by one
+        while the log is written (see addLogLine).
+        """
+        self.logFile = None
+        self.logLines = []
+        self.__resetExtraction()
+
+    def addLogLine(self, theLine):
+        """
+        Extracts the JSON objects of one log line (without line ending).
+        Entries spread over several lines are added with their last line.
+        """
+        for jsonString in self.extractJsonStrings((theLine,)):
+            self.logEntryList.extend(self.__convertJsonString(jsonString))
+
+    def __iterLogLines(self):
+        """
+        Yields the lines of the log file or log string.
+        """
+        if self.logFile is None:
+            for line in self.logLines:
+                yield line
+        else:
+            logFile = open(self.logFile, 'r')
+            try:
+                for line in logFile:
+                    yield line
+            finally:
+                logFile.close()
+
+    def __resetExtraction(self):
+        self.lineEnding = None
+        self.jsonStringDict = {}
+        self.logEntryList = []
+        self.logEntryIndex = None
+        self.json2pyFailedList = []
+        self.json2pyFailedErrorList = []
+
+    def extractJsonStrings(self, theLines):
+        """
+        Yields the finished JSON strings of the provided log lines.
+        JSON strings spread over several lines are collected per PID/TID as
+        list of parts, unfinished ones are kept for the next call.
+        Lines are expected in the thread format 'W(  PID:0xTID) ...', so
+        the PID/TID starts at position 2. Lines which are neither the
+        beginning of a TaintLog entry nor the continuation of one are
+        rejected by string comparisons before any regex is used.
+        Line endings (LF, CRLF, or none) are stripped from the TaintLog
+        lines and the found variant is recorded (see getLineEnding).
+        """
+        jsonStringDict = self.jsonStringDict
+        matchBegin = TAINTLOG_BEGIN_REGEX.match
+        debugFlag = self.log.isDebug()
+        lastLineEnding = None
+
+        for line in theLines:
+            if not line.startswith('W('):
+                if len(jsonStringDict) > 0 and line[1:2] == '(' and jsonStringDict.has_key(line[2:line.find(')', 2)]):
+                    self.log.info('Warning: Do not find line match even though it was expected\n')
+                continue
 
-        jsonStringDict = {}
-        for line in self.logLines:
             # Extract PID and TID
-            startPidTidPos = line.find('(')
-            endPidTidPos = line.find(')')
-            pidTid = line[startPidTidPos+1:endPidTidPos]
+            endPidTidPos = line.find(')', 2)
+            if endPidTidPos == -1:
+                continue
+            pidTid = line[2:endPidTidPos]
 
-            #print 'line: "%s", pidTid: "%s"' % (line, pidTid)
-            
             # Check for entry
-            if not jsonStringDict.has_key(pidTid):
-                regexMatch = re.match(regexBegin, line)
-                if not regexMatch is None:
-                    #print "FOUND regex"
-                    
-                    # Check for end in same line
-                    if line[len(line)-1] == ']' or line[len(line)-2] == ']' or line[len(line)-3] == ']':
-                        jsonString = line[regexMatch.end()-1:len(line)]
-                        jsonStringVec.append(jsonString)
-                        self.log.debug('Found JSON string: \'%s\'\n' % jsonString)
-                    else:
-                        jsonString = line[regexMatch.end()-1:len(line)-self.numControlChars] # remove control chars at the end
-                        jsonStringDict[pidTid] = jsonString
-
+            jsonPartList = jsonStringDict.get(pidTid)
+            if jsonPartList is None:
+                if not line.startswith(TAINTLOG_BEGIN_STR, endPidTidPos):
+                    continue
+                regexMatch = matchBegin(line)
+                if regexMatch is None:
+                    continue
+                jsonPart = line[regexMatch.end()-1:]
             else: # pidTid found
-                regexGoOn = 'W\(%s\) ' % pidTid
-                #print 'regex: %s' % regexGoOn
-                regexMatch = re.match(regexGoOn, line)
-                if not regexMatch is None:
-                    partString = line[regexMatch.end():len(line)-self.numControlChars] # remove control chars at the end
-                    jsonStringDict[pidTid] += partString
-                    if line[len(line)-1] == ']' or line[len(line)-2] == ']' or line[len(line)-3] == ']':                        
-                        jsonStringVec.append(jsonStringDict[pidTid])                    
-                        self.log.debug('Found JSON string: \'%s\'\n' % jsonStringDict[pidTid])
-                        del jsonStringDict[pidTid]
-                else:
+                if line[endPidTidPos+1:endPidTidPos+2] != ' ':
                     self.log.info('Warning: Do not find line match even though it was expected\n')
+                    continue
+                jsonPart = line[endPidTidPos+2:]
+
+            # Remove control chars at the end
+            strippedJsonPart = jsonPart.rstrip('\r\n')
+            lineEnding = jsonPart[len(strippedJsonPart):]
+            if lineEnding != lastLineEnding:
+                self.__addLineEnding(lineEnding)
+                lastLineEnding = lineEnding
+
+            # Check for end in same line
+            if jsonPartList is None:
+                if strippedJsonPart.endswith(']'):
+                    if debugFlag:
+                        self.log.debug('Found JSON string: \'%s\'\n' % strippedJsonPart)
+                    yield strippedJsonPart
+                else:
+                    jsonStringDict[pidTid] = [strippedJsonPart]
+            else:
+                jsonPartList.append(strippedJsonPart)
+                if strippedJsonPart.endswith(']'):
+                    jsonString = ''.join(jsonPartList)
+                    if debugFlag:
+                        self.log.debug('Found JSON string: \'%s\'\n' % jsonString)
+                    del jsonStringDict[pidTid]
+                    yield jsonString
 
-        # Extract JSON objects
-        self.logEntryList = []
-        self.json2pyFailedList = []
-        self.json2pyFailedErrorList = []
-        self.log.info('Extract JSON objects')
-        for jsonString in jsonStringVec:
+    def __addLineEnding(self, theLineEnding):
+        """
+        Records the line ending of a TaintLog line.
+        """
+        if theLineEnding == '':
+            lineEnding = LineEndingEnum.NONE
+        elif theLineEnding == '\n':
+            lineEnding = LineEndingEnum.LF
+        else:
+            lineEnding = LineEndingEnum.CRLF
+        if self.lineEnding is None:
+            self.lineEnding = lineEnding
+        elif self.lineEnding != lineEnding:
+            self.lineEnding = LineEndingEnum.MIXED
+
+    def __convertJsonStrings(self, theJsonStringList):
+        """
+        Returns the log objects of several JSON strings, converted with one
+        decoder call. If this fails (or the result does not consist of one
+        list per JSON string) the strings are converted one by one, so only
+        the malformed ones are reported as failed.
+        """
+        if len(theJsonStringList) == 0:
+            return []
+        for jsonString in theJsonStringList:
             self.log.dev(jsonString)
-            try:
-                self.logEntryList.extend(self.jsonFactory.json2Py(jsonString))
-            except Exception, ex:
-                self.json2pyFailedList.append(jsonString)
-                errMsg = 'Conversion for JSON string \'%s\' failed: %s.' % (jsonString, str(ex))
-                self.log.error(errMsg)
-                self.json2pyFailedErrorList.append(errMsg)
+        try:
+            resultList = self.jsonFactory.json2PyList(theJsonStringList)
+            if len(resultList) == len(theJsonStringList):
+                logEntryList = []
+                for result in resultList:
+                    if not isinstance(result, list):
+                        break
+                    logEntryList.extend(result)
+                else:
+                    return logEntryList
+        except Exception, ex:
+            pass
+        logEntryList = []
+        for jsonString in theJsonStringList:
+            logEntryList.extend(self.__convertJsonString(jsonString, False))
+        return logEntryList
+
+    def __convertJsonString(self, theJsonString, theDevLogFlag=True):
+        """
+        Returns the log objects of the JSON string.
+        Failed conversions are stored and an empty list is returned.
+        """
+        if theDevLogFlag:
+            self.log.dev(theJsonString)
+        try:
+            return list(self.jsonFactory.json2Py(theJsonString))
+        except Exception, ex:
+            self.json2pyFailedList.append(theJsonString)
+            errMsg = 'Conversion for JSON string \'%s\' failed: %s.' % (theJsonString, str(ex))
+            self.log.error(errMsg)
+            self.json2pyFailedErrorList.append(errMsg)
+            return []
 
     def postProcessLogObjects(self, theDeleteStaleObjectsFlag=True):
         """
         CleanUp log objects:
         - Generate stack trace vector
-        - Set file path for OSFileAccess
+        - Combine cipher usages with the same id and network and file system
+          calls with the same taint log id
+        The surviving and the combined log objects are collected in a new
+        list in one pass instead of deleting the stale objects afterwards.
+        Payloads of combined objects are collected as chunks and joined once
+        at the end.
         """
         cipherUsageDict = {}
         netUsageDict = {}
         fileSystemUsageDict = {}
-        
+
+        # Calls of ids which occur more than once
+        cipherUsageLogEntryListDict = {}
+        netDataChunkListDict = {}
+        fileSystemDataChunkListDict = {}
+
         filteredLogEntryList = []
-        logEntryIndex = 0
         for logEntry in self.logEntryList:
             # Stack trace vec
-            if isinstance(logEntry, CallActionLogEntry) or \
-               isinstance(logEntry, CipherUsageLogEntry) or \
-               isinstance(logEntry, ErrorLogEntry) or \
-               isinstance(logEntry, FileSystemLogEntry) or \
-               isinstance(logEntry, NetworkSendLogEntry) or \
-               isinstance(logEntry, SSLLogEntry) or \
-               isinstance(logEntry, SendSmsLogEntry):
+            if isinstance(logEntry, BaseLogEntry):
                 stackTrace = logEntry.stackTraceStr.split('||')
                 logEntry.stackTrace = stackTrace[:len(stackTrace)-1]
-                
+
             # Cipher cleaning (combine inputs and outputs)
             if isinstance(logEntry, CipherUsageLogEntry):
-                if logEntry.action == CipherActionEnum.INIT_ACTION:
-                    if cipherUsageDict.has_key(logEntry.id):
-                        cipherUsageDict[logEntry.id][0].tag = TaintTagEnum.appendTaintTags(cipherUsageDict[logEntry.id][0].tag, logEntry.tag)
-                        cipherUsageDict[logEntry.id][0].input = logEntry.input + cipherUsageDict[logEntry.id][0].input
-                        cipherUsageDict[logEntry.id][0].output = logEntry.output + cipherUsageDict[logEntry.id][0].output
-                        cipherUsageDict[logEntry.id][1].append(logEntryIndex)               
-                    else:
-                        cipherUsageLogEntry = CipherUsageLogEntry(action=CipherActionEnum.CLEANED,
-                                                                  id=logEntry.id,
-                                                                  mode=logEntry.mode,
-                                                                  tag=logEntry.tag,
-                                                                  input='',
-                                                                  output='',
-                                                                  stackTraceStr=logEntry.stackTraceStr,
-                                                                  stackTrace=logEntry.stackTrace,
-                                                                  timestamp=logEntry.timestamp)
-                        cipherUsageDict[logEntry.id] = [cipherUsageLogEntry, [logEntryIndex]]
-                        
-                else: # logEntry.action != CipherActionEnum.INIT_ACTION
-                    if cipherUsageDict.has_key(logEntry.id):
-                        cipherUsageDict[logEntry.id][0].tag = TaintTagEnum.appendTaintTags(cipherUsageDict[logEntry.id][0].tag, logEntry.tag)
-                        cipherUsageDict[logEntry.id][0].input += logEntry.input
-                        cipherUsageDict[logEntry.id][0].output += logEntry.output
-                        cipherUsageDict[logEntry.id][1].append(logEntryIndex)
-                        
+                if cipherUsageDict.has_key(logEntry.id):
+                    cipherUsageLogEntry = cipherUsageDict[logEntry.id]
+                    cipherUsageLogEntry.tag |= logEntry.tag
+                    if cipherUsageLogEntryListDict.has_key(logEntry.id):
+                        cipherUsageLogEntryListDict[logEntry.id].append(logEntry)
                     else:
-                        cipherUsageLogEntry = CipherUsageLogEntry(action=CipherActionEnum.CLEANED,
-                                                                  id=logEntry.id,
-                                                                  mode=logEntry.mode,
-                                                                  tag=logEntry.tag,
-                                                                  input='',
-                                                                  output='',
-                                                                  stackTraceStr=logEntry.stackTraceStr,
-                                                                  stackTrace=logEntry.stackTrace,
-                                                                  timestamp=logEntry.timestamp)
-                        cipherUsageDict[logEntry.id] = [cipherUsageLogEntry, [logEntryIndex]]
+                        cipherUsageLogEntryListDict[logEntry.id] = [logEntry]
+                else:
+                    if logEntry.action != CipherActionEnum.INIT_ACTION:
                         self.log.info("CipherUsageLogEntry with action '%s' found without starting init" % logEntry.action)
+                    cipherUsageDict[logEntry.id] = CipherUsageLogEntry(action=CipherActionEnum.CLEANED,
+                                                                       id=logEntry.id,
+                                                                       mode=logEntry.mode,
+                                                                       tag=logEntry.tag,
+                                                                       input='',
+                                                                       output='',
+                                                                       stackTraceStr=logEntry.stackTraceStr,
+                                                                       stackTrace=logEntry.stackTrace,
+                                                                       timestamp=logEntry.timestamp)
 
             # Network cleaning (combine multiple calls)
-            if isinstance(logEntry, NetworkSendLogEntry):
-                if logEntry.taintLogId == 0: continue
+            elif isinstance(logEntry, NetworkSendLogEntry) and logEntry.taintLogId != 0:
                 if netUsageDict.has_key(logEntry.taintLogId):
-                    netUsageDict[logEntry.taintLogId][0].tag = TaintTagEnum.appendTaintTags(netUsageDict[logEntry.taintLogId][0].tag, logEntry.tag)
-                    netUsageDict[logEntry.taintLogId][0].data = netUsageDict[logEntry.taintLogId][0].data + logEntry.data
-                    netUsageDict[logEntry.taintLogId][1].append(logEntryIndex)
-                    
+                    netSendLogEntry = netUsageDict[logEntry.taintLogId]
+                    netSendLogEntry.tag |= logEntry.tag
+                    if netDataChunkListDict.has_key(logEntry.taintLogId):
+                        netDataChunkListDict[logEntry.taintLogId].append(logEntry.data)
+                    else:
+                        netDataChunkListDict[logEntry.taintLogId] = [netSendLogEntry.data, logEntry.data]
                 else:
-                    netSendLogEntry = NetworkSendLogEntry(action=logEntry.action,
-                                                          tag=logEntry.tag,
-                                                          destination=logEntry.destination,
-                                                          port=logEntry.port,
-                                                          taintLogId=logEntry.taintLogId,
-                                                          data=logEntry.data,
-                                                          stackTraceStr=logEntry.stackTraceStr,
-                                                          stackTrace=logEntry.stackTrace,
-                                                          timestamp=logEntry.timestamp)
-                    netUsageDict[logEntry.taintLogId] = [netSendLogEntry, [logEntryIndex]]
+                    netUsageDict[logEntry.taintLogId] = NetworkSendLogEntry(action=logEntry.action,
+                                                                            tag=logEntry.tag,
+                                                                            destination=logEntry.destination,
+                                                                            port=logEntry.port,
+                                                                            taintLogId=logEntry.taintLogId,
+                                                                            data=logEntry.data,
+                                                                            stackTraceStr=logEntry.stackTraceStr,
+                                                                            stackTrace=logEntry.stackTrace,
+                                                                            timestamp=logEntry.timestamp)
 
             # File system cleaning (combine multiple calls)
-            if isinstance(logEntry, FileSystemLogEntry):
-                if logEntry.taintLogId == 0: continue
+            elif isinstance(logEntry, FileSystemLogEntry) and logEntry.taintLogId != 0:
                 if fileSystemUsageDict.has_key(logEntry.taintLogId):
-                    fileSystemUsageDict[logEntry.taintLogId][0].tag = TaintTagEnum.appendTaintTags(fileSystemUsageDict[logEntry.taintLogId][0].tag, logEntry.tag)
-                    fileSystemUsageDict[logEntry.taintLogId][0].data = fileSystemUsageDict[logEntry.taintLogId][0].data + logEntry.data
-                    fileSystemUsageDict[logEntry.taintLogId][1].append(logEntryIndex)
-                    
+                    fileSystemLogEntry = fileSystemUsageDict[logEntry.taintLogId]
+                    fileSystemLogEntry.tag |= logEntry.tag
+                    if fileSystemDataChunkListDict.has_key(logEntry.taintLogId):
+                        fileSystemDataChunkListDict[logEntry.taintLogId].append(logEntry.data)
+                    else:
+                        fileSystemDataChunkListDict[logEntry.taintLogId] = [fileSystemLogEntry.data, logEntry.data]
                 else:
-                    fileSystemLogEntry = NetworkSendLogEntry(action=logEntry.action,
-                                                             tag=logEntry.tag,
-                                                             fileDescriptor=logEntry.fileDescriptor,
-                                                             filePath=logEntry.filePath,
-                                                             taintLogId=logEntry.taintLogId,
-                                                             data=logEntry.data,
-                                                             stackTraceStr=logEntry.stackTraceStr,
-                                                             stackTrace=logEntry.stackTrace,
-                                                             timestamp=logEntry.timestamp)
-                    fileSystemUsageDict[logEntry.taintLogId] = [fileSystemLogEntry, [logEntryIndex]]
-                
-            # Update index
-            logEntryIndex += 1
-
-        # Delete stale objects
-        if theDeleteStaleObjectsFlag:
-            # Collect indices
-            delLogEntryIdxList = []
-            
-            # Cipher usage
-            for id, logEntry in cipherUsageDict.iteritems():
-                delLogEntryIdxList.extend(logEntry[1])
-
-            # Net log entry
-            for id, logEntry in netUsageDict.iteritems():
-                delLogEntryIdxList.extend(logEntry[1])
-
-            # File system log entry
-            for id, logEntry in fileSystemUsageDict.iteritems():
-                delLogEntryIdxList.extend(logEntry[1])
-
-            # Do drop
-            self.__deleteStaleLogObjects(delLogEntryIdxList)
-            
-
-        # Add cleaned cipher usage objects
-        for id, logEntry in cipherUsageDict.iteritems():
-            self.logEntryList.append(logEntry[0])
-
-        # Add cleaned network objects
-        for id, logEntry in netUsageDict.iteritems():
-            self.logEntryList.append(logEntry[0])
-
-        # Add cleaned file system objects
-        for id, logEntry in fileSystemUsageDict.iteritems():
-            self.logEntryList.append(logEntry[0])
-            
-
-    def __deleteStaleLogObjects(self, theDelLogEntryIdxList):
-        """
-        Delete all log entries whose indices are included in the provided
-        delete log entry index list.
-        """
-        theDelLogEntryIdxList.sort()
-        for i in xrange(len(theDelLogEntryIdxList)):
-            del self.logEntryList[theDelLogEntryIdxList[i] - i]
-            
+                    fileSystemUsageDict[logEntry.taintLogId] = FileSystemLogEntry(action=logEntry.action,
+                                                                                  tag=logEntry.tag,
+                                                                                  fileDescriptor=logEntry.fileDescriptor,
+                                                                                  filePath=logEntry.filePath,
+                                                                                  taintLogId=logEntry.taintLogId,
+                                                                                  data=logEntry.data,
+                                                                                  stackTraceStr=logEntry.stackTraceStr,
+                                                                                  stackTrace=logEntry.stackTrace,
+                                                                                  timestamp=logEntry.timestamp)
+
+            # Keep entries which are not combined
+            else:
+                filteredLogEntryList.append(logEntry)
+                continue
+
+            # Keep stale objects if requested
+            if not theDeleteStaleObjectsFlag:
+                filteredLogEntryList.append(logEntry)
+
+        # Join inputs and outputs of combined cipher usages (init calls are
+        # put in front of the calls seen before)
+        for id, logEntryList in cipherUsageLogEntryListDict.iteritems():
+            initLogEntryList = [logEntry for logEntry in logEntryList if logEntry.action == CipherActionEnum.INIT_ACTION]
+            initLogEntryList.reverse()
+            initLogEntryList.extend([logEntry for logEntry in logEntryList if logEntry.action != CipherActionEnum.INIT_ACTION])
+            cipherUsageLogEntry = cipherUsageDict[id]
+            cipherUsageLogEntry.input = ''.join([logEntry.input for logEntry in initLogEntryList])
+            cipherUsageLogEntry.output = ''.join([logEntry.output for logEntry in initLogEntryList])
+
+        # Join data of combined network and file system calls
+        for usageDict, dataChunkListDict in [(netUsageDict, netDataChunkListDict),
+                                             (fileSystemUsageDict, fileSystemDataChunkListDict)]:
+            for taintLogId, dataChunkList in dataChunkListDict.iteritems():
+                usageDict[taintLogId].data = ''.join(dataChunkList)
+
+        # Add cleaned cipher usage, network, and file system objects
+        filteredLogEntryList.extend(cipherUsageDict.itervalues())
+        filteredLogEntryList.extend(netUsageDict.itervalues())
+        filteredLogEntryList.extend(fileSystemUsageDict.itervalues())
+        self.logEntryList = filteredLogEntryList
+        self.logEntryIndex = LogEntryIndex(self.logEntryList)
 
     def filterLogObjects(self, theFilterList):
         """
         Remove entries which match to one of the provided patterns.
+        theFilterList can also be a LogPatternMatcher.
         """
-        delLogEntryIdxList = []
-        logEntryIndex = 0
-        for logEntry in self.logEntryList:
-            if self.__matches(logEntry, theFilterList):
-                delLogEntryIdxList.append(logEntryIndex)
-            logEntryIndex += 1
-        self.__deleteStaleLogObjects(delLogEntryIdxList)
+        matcher = self.__getMatcher(theFilterList)
+        self.logEntryList = [logEntry for logEntry in self.logEntryList if not matcher.matches(logEntry)]
+        self.logEntryIndex = LogEntryIndex(self.logEntryList)
         
-    def __matches(self, theLogObject, thePatternList):
+    def __getMatcher(self, thePatternList):
         """
-        Returns if log object should be filtered.
+        Returns the compiled matcher of the pattern list.
         """
-        for pattern in thePatternList:
-            if theLogObject.doesMatch(pattern):
-                return True
+        if isinstance(thePatternList, LogPatternMatcher):
+            return thePatternList
+        return LogPatternMatcher(thePatternList)
 
     def getMatchingLogEntries(self, thePatternList):
         """
         Returns a list of log entries matching with one of the provided patterns
         """
-        logEntryList = []
-        for logEntry in self.logEntryList:
-            if self.__matches(logEntry, thePatternList):
-                logEntryList.append(logEntry)
-        return logEntryList
+        matcher = self.__getMatcher(thePatternList)
+        return [logEntry for logEntry in self.logEntryList if matcher.matches(logEntry)]
 
     def doesMatch(self, thePatternList):
         """
         Returns if there are any log entries matching to one of the provided
         patterns.
         """
+        matcher = self.__getMatcher(thePatternList)
         for logEntry in self.logEntryList:
-            if self.__matches(logEntry, thePatternList):
+            if matcher.matches(logEntry):
                 return True
         return False
+
+    def getNumMatchingLogEntries(self, thePatternList):
+        """
+        Returns the number of matching log entries for each of the provided
+        patterns, all patterns are evaluated in one pass over the log entries.
+        """
+        matcher = self.__getMatcher(thePatternList)
+        numList = [0] * matcher.getNumPatterns()
+        for logEntry in self.logEntryList:
+            for i in matcher.getMatchingPatternIndexList(logEntry):
+                numList[i] += 1
+        return numList
         
     def printOverview(self):
         """
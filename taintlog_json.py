@@ -17,7 +17,11 @@
 ################################################################################
 
 from common import TaintLogActionEnum, TaintTagEnum
-import json
+
+try:
+    import simplejson as json # C speedups, faster than json of Python 2.6/2.7
+except ImportError:
+    import json
 
 
 # ================================================================================
@@ -37,11 +41,13 @@ class CipherModeEnum:
 # ================================================================================
 # Json Base Class
 # ================================================================================
-class JsonBase:
+class JsonBase(object):
+    __slots__ = ()
     _json = True
     
     def __init__(self, **keys):
-        self.__dict__.update(keys)
+        for key, value in keys.iteritems():
+            setattr(self, key, value)
         
     def append(self, name, value):
         setdefault(self.__dict__, name, []).append(value)
@@ -67,8 +73,10 @@ class AppReportEntry(BaseReportEntry):
     appPath = ''
     logcatFile = ''
     md5Hash = ''
+    bootTime = -1
     startTime = ''
     endTime = ''
+    errorList = []
 
 class MainReportEntry(BaseReportEntry):
     """
@@ -82,13 +90,113 @@ class MainReportEntry(BaseReportEntry):
 # ================================================================================
 # Json Log Objects (comming from TaintDroid)
 # ================================================================================
+def _getSlotList(theDefaultList):
+    return [key for key, value in theDefaultList]
+
 class BaseLogEntry(JsonBase):
+    """
+    Log entries keep their fields in slots instead of a __dict__, there are
+    millions of them in larger analyses. Each class lists its fields with
+    their default values in _defaultList. actionList and tagList are only
+    set for patterns.
+    """
+    _defaultList = []
+    __slots__ = ['actionList', 'tagList']
+
+    def __init__(self, **keys):
+        for key, value in self._defaultList:
+            setattr(self, key, value)
+        JsonBase.__init__(self, **keys)
+
+    def __getstate__(self):
+        """
+        Returns all set fields as dict (for pickle and the JSON encoder).
+        """
+        state = {}
+        for slot in self._getAllSlotList():
+            try:
+                state[slot] = getattr(self, slot)
+            except AttributeError:
+                pass
+        return state
+
+    def __setstate__(self, theState):
+        for key, value in theState.iteritems():
+            setattr(self, key, value)
+
+    @classmethod
+    def _getAllSlotList(theClass):
+        """
+        Returns the slots of the class and its base classes.
+        """
+        if not theClass.__dict__.has_key('_allSlotList'):
+            allSlotList = []
+            for aClass in theClass.__mro__:
+                allSlotList.extend(aClass.__dict__.get('__slots__', []))
+            theClass._allSlotList = allSlotList
+        return theClass._allSlotList
+
+    def getMatchFunc(self):
+        """
+        Returns a function which tells if a log entry matches this pattern,
+        the same as logEntry.doesMatch(pattern) for log entries of this
+        class. Subclasses compute the checks of the pattern once (see
+        _compileMatchFunc).
+        """
+        return lambda theLogEntry: theLogEntry.doesMatch(self)
+
+    def _getTagMask(self, theTagListName):
+        """
+        Returns the tags of a tag list of a pattern as one mask or None if the
+        list is not set (matches every tag).
+        """
+        tagList = getattr(self, theTagListName, None)
+        if tagList is None or len(tagList) == 0:
+            return None
+        tagMask = 0
+        for tag in tagList:
+            tagMask |= tag
+        return tagMask
+
+    def _compileMatchFunc(self, theActionFlag=True, theTagFlag=True, theFieldList=[]):
+        """
+        Returns the match function of this pattern for doesActionMatch,
+        doesTagMatch (if flags are set), doesStackTraceMatch, and the fields in
+        theFieldList ((name, emptyValue) pairs, set fields have to be equal).
+        """
+        actionSet = None
+        actionList = getattr(self, 'actionList', None)
+        if theActionFlag and not actionList is None and len(actionList) > 0:
+            actionSet = frozenset(actionList)
+        noTagFlag = theTagFlag and self.tag == -1
+        tagMask = None
+        if theTagFlag:
+            tagMask = self._getTagMask('tagList')
+        fieldList = [(name, getattr(self, name)) for name, emptyValue in theFieldList if getattr(self, name) != emptyValue]
+        stackTraceStr = self.stackTraceStr
+
+        def matchFunc(theLogEntry):
+            if not actionSet is None and not theLogEntry.action in actionSet:
+                return False
+            if noTagFlag and theLogEntry.tag != 0:
+                return False
+            if not tagMask is None and not theLogEntry.tag & tagMask:
+                return False
+            for name, value in fieldList:
+                if getattr(theLogEntry, name) != value:
+                    return False
+            if stackTraceStr and theLogEntry.stackTraceStr.find(stackTraceStr) == -1:
+                return False
+            return True
+        return matchFunc
+
     def doesActionMatch(self, theOther):
         #if theOther.action != 0 and theOther.action != self.action:
         #    return False
-        if theOther.__dict__.has_key('actionList') and len(theOther.actionList) > 0:
+        actionList = getattr(theOther, 'actionList', None)
+        if not actionList is None and len(actionList) > 0:
             match = False
-            for action in theOther.actionList:
+            for action in actionList:
                 if self.action == action:
                     match = True
                     break
@@ -107,12 +215,13 @@ class BaseLogEntry(JsonBase):
         return False
 
     def doesTagMatch(self, theOther):
-        if theOther.tag == -1 and int(self.tag, 16) != 0:
+        if theOther.tag == -1 and self.tag != 0:
             return False
-        if theOther.__dict__.has_key('tagList') and len(theOther.tagList) > 0:
+        tagList = getattr(theOther, 'tagList', None)
+        if not tagList is None and len(tagList) > 0:
             match = False
-            for tag in theOther.tagList:
-                if int(self.tag, 16) & tag:
+            for tag in tagList:
+                if self.tag & tag:
                     match = True
             if not match:
                 return False
@@ -124,19 +233,21 @@ class BaseLogEntry(JsonBase):
 class ErrorLogEntry(BaseLogEntry):
     """
     """
-    message = ''
-    stackTraceStr = ''
-    stackTrace = [] # filled by postProcess
-    timestamp = ''
+    _defaultList = [('message', ''),
+                    ('stackTraceStr', ''),
+                    ('stackTrace', []), # filled by postProcess
+                    ('timestamp', '')]
+    __slots__ = _getSlotList(_defaultList)
 
 class CallActionLogEntry(BaseLogEntry):
     """
     """
-    tag = TaintTagEnum.TAINT_CLEAR
-    dialString = ''
-    stackTraceStr = ''
-    stackTrace = [] # filled by postProcess
-    timestamp = ''
+    _defaultList = [('tag', TaintTagEnum.TAINT_CLEAR),
+                    ('dialString', ''),
+                    ('stackTraceStr', ''),
+                    ('stackTrace', []), # filled by postProcess
+                    ('timestamp', '')]
+    __slots__ = _getSlotList(_defaultList)
 
     def doesMatch(self, theOther):
         if not isinstance(theOther, CallActionLogEntry):
@@ -149,6 +260,9 @@ class CallActionLogEntry(BaseLogEntry):
             return False
         return True
 
+    def getMatchFunc(self):
+        return self._compileMatchFunc(theActionFlag=False, theTagFlag=False, theFieldList=[('dialString', '')])
+
     def getOverviewLogStr(self):
         return 'CallAction, dialString: %s' % (self.dialString)
 
@@ -163,15 +277,16 @@ class CallActionLogEntry(BaseLogEntry):
 class CipherUsageLogEntry(BaseLogEntry):
     """
     """
-    action = '' # CipherActionEnum
-    id = 0    
-    mode = 0 # CipherModeEnum
-    tag = TaintTagEnum.TAINT_CLEAR
-    input = ''
-    output = ''
-    stackTraceStr = ''
-    stackTrace = [] # filled by postProcess
-    timestamp = ''
+    _defaultList = [('action', ''), # CipherActionEnum
+                    ('id', 0),
+                    ('mode', 0), # CipherModeEnum
+                    ('tag', TaintTagEnum.TAINT_CLEAR),
+                    ('input', ''),
+                    ('output', ''),
+                    ('stackTraceStr', ''),
+                    ('stackTrace', []), # filled by postProcess
+                    ('timestamp', '')]
+    __slots__ = _getSlotList(_defaultList)
 
     def doesMatch(self, theOther):
         if not isinstance(theOther, CipherUsageLogEntry):
@@ -183,6 +298,9 @@ class CipherUsageLogEntry(BaseLogEntry):
         if not self.doesStackTraceMatch(theOther):
             return False
         return True
+
+    def getMatchFunc(self):
+        return self._compileMatchFunc()
     
     def getOverviewLogStr(self):
         return 'CipherUsage (%s), id: %d, tag: %s, mode: %d' % (self.action, self.id, TaintTagEnum.getTaintString(self.tag), self.mode)
@@ -202,15 +320,16 @@ class CipherUsageLogEntry(BaseLogEntry):
 class FileSystemLogEntry(BaseLogEntry):
     """
     """
-    action = 0 # TaintLogActionEnum.FS_*
-    tag = TaintTagEnum.TAINT_CLEAR
-    fileDescriptor = 0
-    filePath = '' # filled by postProcess
-    taintLogId = 0
-    data = ''
-    stackTraceStr = ''    
-    stackTrace = [] # filled by postProcess
-    timestamp = ''
+    _defaultList = [('action', 0), # TaintLogActionEnum.FS_*
+                    ('tag', TaintTagEnum.TAINT_CLEAR),
+                    ('fileDescriptor', 0),
+                    ('filePath', ''), # filled by postProcess
+                    ('taintLogId', 0),
+                    ('data', ''),
+                    ('stackTraceStr', ''),
+                    ('stackTrace', []), # filled by postProcess
+                    ('timestamp', '')]
+    __slots__ = _getSlotList(_defaultList)
 
     def doesMatch(self, theOther):
         if not isinstance(theOther, FileSystemLogEntry):
@@ -225,6 +344,9 @@ class FileSystemLogEntry(BaseLogEntry):
             return False
         return True
 
+    def getMatchFunc(self):
+        return self._compileMatchFunc(theFieldList=[('filePath', '')])
+
     def getOverviewLogStr(self):
         return 'FileSystemAccess (%s), tag: %s, file: %s (%d)' % (TaintLogActionEnum.getActionString(self.action), TaintTagEnum.getTaintString(self.tag), self.filePath, self.fileDescriptor)
 
@@ -241,15 +363,16 @@ class FileSystemLogEntry(BaseLogEntry):
 class NetworkSendLogEntry(BaseLogEntry):
     """
     """
-    action = 0 # TaintLogActionEnum.NET_*
-    tag = TaintTagEnum.TAINT_CLEAR
-    destination = ''
-    port = 0
-    taintLogId = 0
-    data = ''
-    stackTraceStr = ''
-    stackTrace = [] # filled by postProcess
-    timestamp = ''
+    _defaultList = [('action', 0), # TaintLogActionEnum.NET_*
+                    ('tag', TaintTagEnum.TAINT_CLEAR),
+                    ('destination', ''),
+                    ('port', 0),
+                    ('taintLogId', 0),
+                    ('data', ''),
+                    ('stackTraceStr', ''),
+                    ('stackTrace', []), # filled by postProcess
+                    ('timestamp', '')]
+    __slots__ = _getSlotList(_defaultList)
 
     def doesMatch(self, theOther):
         if not isinstance(theOther, NetworkSendLogEntry):
@@ -265,6 +388,9 @@ class NetworkSendLogEntry(BaseLogEntry):
         if not self.doesStackTraceMatch(theOther):
             return False
         return True
+
+    def getMatchFunc(self):
+        return self._compileMatchFunc(theFieldList=[('destination', ''), ('port', 0)])
     
     def getOverviewLogStr(self):
         return 'NetworkAccess (%s), tag: %s, destination: %s:%d' % (TaintLogActionEnum.getActionString(self.action), TaintTagEnum.getTaintString(self.tag), self.destination, self.port)
@@ -282,14 +408,15 @@ class NetworkSendLogEntry(BaseLogEntry):
 class SSLLogEntry(BaseLogEntry):
     """
     """
-    action = 0 # TaintLogActionEnum.SSL_*
-    tag = TaintTagEnum.TAINT_CLEAR
-    destination = ''
-    port = 0
-    data = ''
-    stackTraceStr = ''
-    stackTrace = [] # filled by postProcess
-    timestamp = ''
+    _defaultList = [('action', 0), # TaintLogActionEnum.SSL_*
+                    ('tag', TaintTagEnum.TAINT_CLEAR),
+                    ('destination', ''),
+                    ('port', 0),
+                    ('data', ''),
+                    ('stackTraceStr', ''),
+                    ('stackTrace', []), # filled by postProcess
+                    ('timestamp', '')]
+    __slots__ = _getSlotList(_defaultList)
 
     def doesMatch(self, theOther):
         if not isinstance(theOther, SSLLogEntry):
@@ -303,6 +430,9 @@ class SSLLogEntry(BaseLogEntry):
         if not self.doesStackTraceMatch(theOther):
             return False
         return True
+
+    def getMatchFunc(self):
+        return self._compileMatchFunc(theFieldList=[('destination', '')])
     
     def getOverviewLogStr(self):
         return 'SSL (%s), tag: %s, destination: %s:%d' % (TaintLogActionEnum.getActionString(self.action), TaintTagEnum.getTaintString(self.tag), self.destination, self.port)
@@ -319,15 +449,16 @@ class SSLLogEntry(BaseLogEntry):
 class SendSmsLogEntry(BaseLogEntry):
     """
     """
-    action = 0 # TaintLogActionEnum.SMS_*
-    tag = TaintTagEnum.TAINT_CLEAR
-    destination = ''
-    destinationTag = TaintTagEnum.TAINT_CLEAR
-    scAddress = ''
-    text = ''
-    stackTraceStr = ''
-    stackTrace = [] # filled by postProcess
-    timestamp = ''
+    _defaultList = [('action', 0), # TaintLogActionEnum.SMS_*
+                    ('tag', TaintTagEnum.TAINT_CLEAR),
+                    ('destination', ''),
+                    ('destinationTag', TaintTagEnum.TAINT_CLEAR),
+                    ('scAddress', ''),
+                    ('text', ''),
+                    ('stackTraceStr', ''),
+                    ('stackTrace', []), # filled by postProcess
+                    ('timestamp', '')]
+    __slots__ = _getSlotList(_defaultList) + ['destinationTagList'] # destinationTagList for patterns only
 
     def doesMatch(self, theOther):
         if not isinstance(theOther, SendSmsLogEntry):
@@ -338,18 +469,34 @@ class SendSmsLogEntry(BaseLogEntry):
             return False
         if theOther.destination != '' and theOther.destination != self.destination:
             return False
-        if theOther.destinationTag == -1 and int(self.destinationTag, 16) != 0:
+        if theOther.destinationTag == -1 and self.destinationTag != 0:
             return False
-        if theOther.__dict__.has_key('destinationTagList') and len(theOther.destinationTagList) > 0:
+        destinationTagList = getattr(theOther, 'destinationTagList', None)
+        if not destinationTagList is None and len(destinationTagList) > 0:
             match = False
-            for tag in theOther.destinationTagList:
-                if int(self.destinationTag, 16) & tag:
+            for tag in destinationTagList:
+                if self.destinationTag & tag:
                     match = True
             if not match:
                 return False        
         if not self.doesStackTraceMatch(theOther):
             return False
         return True
+
+    def getMatchFunc(self):
+        matchFunc = self._compileMatchFunc(theFieldList=[('destination', '')])
+        noDestinationTagFlag = self.destinationTag == -1
+        destinationTagMask = self._getTagMask('destinationTagList')
+        if not noDestinationTagFlag and destinationTagMask is None:
+            return matchFunc
+
+        def smsMatchFunc(theLogEntry):
+            if noDestinationTagFlag and theLogEntry.destinationTag != 0:
+                return False
+            if not destinationTagMask is None and not theLogEntry.destinationTag & destinationTagMask:
+                return False
+            return matchFunc(theLogEntry)
+        return smsMatchFunc
     
     def getOverviewLogStr(self):
         return 'SMS (%s), tag: %s, destination: %s (%s), source: %s, text: %s, timestamp: %s' % (TaintLogActionEnum.getActionString(self.action), TaintTagEnum.getTaintString(self.tag), self.destination, TaintTagEnum.getTaintString(self.destinationTag), self.scAddress, self.text, self.timestamp)
@@ -369,11 +516,30 @@ class SendSmsLogEntry(BaseLogEntry):
 # ================================================================================
 # Json En-/Decoder
 # ================================================================================
+TAG_KEY_LIST = ['tag', 'destinationTag']
+
+# Type markers in order of their frequency in TaintDroid logs
+JSON_TYPE_LIST = [('__FileSystemLogEntry__',  FileSystemLogEntry),
+                  ('__NetworkSendLogEntry__', NetworkSendLogEntry),
+                  ('__CipherUsageLogEntry__', CipherUsageLogEntry),
+                  ('__SSLLogEntry__',         SSLLogEntry),
+                  ('__SendSmsLogEntry__',     SendSmsLogEntry),
+                  ('__CallActionLogEntry__',  CallActionLogEntry),
+                  ('__ErrorLogEntry__',       ErrorLogEntry),
+                  ('__AppReportEntry__',      AppReportEntry),
+                  ('__MainReportEntry__',     MainReportEntry)]
+
 class _JSONEncoder(json.JSONEncoder):
     def default(self, theObject):
         if hasattr(theObject, '_json'):
             res = {}
-            if theObject._json == True:
+            if isinstance(theObject, BaseLogEntry):
+                res = theObject.__getstate__()
+                # Tags are written as hex strings like TaintDroid does
+                for key in TAG_KEY_LIST:
+                    if isinstance(res.get(key), (int, long)) and res[key] >= 0:
+                        res[key] = '0x%X' % res[key]
+            elif theObject._json == True:
                 for key in theObject.__dict__:
                     if not key.startswith('_'):
                         res[key] = theObject.__dict__[key]
@@ -385,44 +551,31 @@ class _JSONEncoder(json.JSONEncoder):
         return json.JSONEncoder.default(self, theObject)
 
 def _JSONDecoder(theDict):
-    object = None
-    type = None
-
-    for type in theDict.keys():
-        if type.startswith("__"):
+    # Find the type marker
+    for typeKey, objectClass in JSON_TYPE_LIST:
+        if typeKey in theDict:
             break
-    if type == None: return theDict
-
-    # Log objects
-    if '__CallActionLogEntry__' == type:
-        object = CallActionLogEntry()
-    elif '__CipherUsageLogEntry__' == type:
-        object = CipherUsageLogEntry()
-    elif '__FileDescriptorLogEntry__' == type:
-        object = FileDescriptorLogEntry()
-    elif '__FileSystemLogEntry__' == type:
-        object = FileSystemLogEntry()
-    elif '__NetworkSendLogEntry__' == type:
-        object = NetworkSendLogEntry()
-    elif '__SSLLogEntry__' == type:
-        object = SSLLogEntry()
-    elif '__SendSmsLogEntry__' == type:
-        object = SendSmsLogEntry()
-
-    # Report objects
-    elif '__AppReportEntry__' == type:
-        object = AppReportEntry()
-    elif '__MainReportEntry__' == type:
-        object = MainReportEntry()
-        
-    # Else...
     else:
+        if len(theDict) == 0: return theDict
+        for type in theDict:
+            if type.startswith('__'):
+                break
         raise Exception('Unkown type \'%s\' found' % type)
 
-    if not object: return theDict
-
-    object.__dict__.update(theDict)
-
+    # Report objects
+    if not issubclass(objectClass, BaseLogEntry):
+        object = objectClass()
+        object.__dict__.update(theDict)
+        return object
+
+    # Log objects (unknown keys are dropped, tags as integers)
+    object = objectClass.__new__(objectClass)
+    getValue = theDict.get
+    for key, value in objectClass._defaultList:
+        setattr(object, key, getValue(key, value))
+    for key in TAG_KEY_LIST:
+        if isinstance(getValue(key), basestring):
+            setattr(object, key, int(theDict[key], 16))
     return object
 
 
@@ -438,3 +591,11 @@ class JsonFactory:
 
     def json2Py(self, theString):
         return json.loads(theString, object_hook=_JSONDecoder)
+
+    def json2PyList(self, theStringList):
+        """
+        Converts several JSON strings with one decoder call and returns the
+        list of their results. The strings are joined into one JSON array,
+        so one malformed string lets the whole call fail.
+        """
+        return json.loads('[%s]' % ','.join(theStringList), object_hook=_JSONDecoder)
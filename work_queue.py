@@ -0,0 +1,310 @@
+################################################################################
+#
+# Copyright (c) 2011-2012, Daniel Baeumges (dbaeumges@googlemail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+################################################################################
+
+from sqlite3 import dbapi2 as sqlite
+from common import Logger
+from threading import Event, Thread
+
+import socket
+import time
+import zlib
+
+
+# ================================================================================
+# Work Queue Enums
+# ================================================================================
+class WorkQueueJobState:
+    PENDING = 'pending'
+    LEASED  = 'leased'
+    DONE    = 'done'
+    FAILED  = 'failed'
+
+
+# ================================================================================
+# Work Queue Error
+# ================================================================================
+class WorkQueueError(Exception):
+    def __init__(self, theValue):
+        self.value = theValue
+
+    def __str__(self):
+        return repr(self.value)
+
+
+# ================================================================================
+# Work Queue
+# ================================================================================
+class WorkQueue:
+    """
+    Shared queue of apps to be analyzed by several hosts.
+    The queue is stored in a SQLite database which has to be reachable by the
+    coordinator and all workers (e.g. on a shared file system). Workers lease
+    one job per free thread and renew their leases by heartbeats. Leases of
+    dead workers expire and their jobs are put back into the queue.
+    Each connection is only used for one operation, so the queue can be
+    used from several threads and processes at the same time.
+    """
+    def __init__(self, theDb, theLeaseTimeout=900, theMaxNumAttempts=3, theLogger=Logger()):
+        self.db = theDb
+        self.leaseTimeout = theLeaseTimeout
+        self.maxNumAttempts = theMaxNumAttempts
+        self.log = theLogger
+
+    def __connect(self):
+        conn = sqlite.connect(self.db, timeout=60, isolation_level=None)
+        conn.text_factory = str
+        return conn
+
+    def __execTransaction(self, theFunc):
+        """
+        Runs theFunc(theCursor) in an exclusive write transaction and
+        returns its return value.
+        """
+        conn = self.__connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                retval = theFunc(cursor)
+            except:
+                cursor.execute('ROLLBACK')
+                raise
+            cursor.execute('COMMIT')
+            return retval
+        finally:
+            conn.close()
+
+    def __query(self, theSql, theParams=()):
+        conn = self.__connect()
+        try:
+            return conn.execute(theSql, theParams).fetchall()
+        finally:
+            conn.close()
+
+    # ================================================================================
+    # Coordinator
+    # ================================================================================
+    def createTables(self):
+        """
+        Creates the queue tables if they do not exist.
+
+        CREATE TABLE Jobs (
+          id INTEGER PRIMARY KEY,
+          apk_path VARCHAR(255),
+          state VARCHAR(16),
+          worker_id VARCHAR(255),
+          lease_expiry REAL,
+          num_attempts INTEGER)
+
+        CREATE TABLE Workers (
+          id VARCHAR(255) PRIMARY KEY,
+          num_threads INTEGER,
+          last_heartbeat REAL)
+
+        CREATE TABLE Results (
+          id INTEGER PRIMARY KEY,
+          job_id INTEGER UNIQUE,
+          worker_id VARCHAR(255),
+          logcat_file_name VARCHAR(255),
+          logcat BLOB,
+          log_entries TEXT,
+          app_report TEXT,
+          error_list TEXT,
+          finish_time REAL)
+        """
+        def createFunc(theCursor):
+            theCursor.execute('CREATE TABLE IF NOT EXISTS Jobs (id INTEGER PRIMARY KEY, apk_path VARCHAR(255), state VARCHAR(16), worker_id VARCHAR(255), lease_expiry REAL, num_attempts INTEGER)')
+            theCursor.execute('CREATE INDEX IF NOT EXISTS Jobs_state ON Jobs (state)')
+            theCursor.execute('CREATE TABLE IF NOT EXISTS Workers (id VARCHAR(255) PRIMARY KEY, num_threads INTEGER, last_heartbeat REAL)')
+            theCursor.execute('CREATE TABLE IF NOT EXISTS Results (id INTEGER PRIMARY KEY, job_id INTEGER UNIQUE, worker_id VARCHAR(255), logcat_file_name VARCHAR(255), logcat BLOB, log_entries TEXT, app_report TEXT, error_list TEXT, finish_time REAL)')
+        self.__execTransaction(createFunc)
+
+    def addJob(self, theApkPath):
+        """
+        Adds an app to the queue and returns the job id.
+        The job id is also used as sample id of the app.
+        """
+        def addFunc(theCursor):
+            theCursor.execute('INSERT INTO Jobs (apk_path, state, num_attempts) VALUES (?, ?, 0)',
+                              (theApkPath, WorkQueueJobState.PENDING))
+            return theCursor.lastrowid
+        return self.__execTransaction(addFunc)
+
+    def requeueExpiredJobs(self):
+        """
+        Puts jobs with expired leases (worker died or hangs) back into the
+        queue. Jobs which failed too often are marked as failed.
+        Returns the number of requeued jobs.
+        """
+        def requeueFunc(theCursor):
+            currentTime = time.time()
+            theCursor.execute('UPDATE Jobs SET state = ?, worker_id = NULL, lease_expiry = NULL WHERE state = ? AND lease_expiry < ? AND num_attempts >= ?',
+                              (WorkQueueJobState.FAILED, WorkQueueJobState.LEASED, currentTime, self.maxNumAttempts))
+            theCursor.execute('UPDATE Jobs SET state = ?, worker_id = NULL, lease_expiry = NULL WHERE state = ? AND lease_expiry < ?',
+                              (WorkQueueJobState.PENDING, WorkQueueJobState.LEASED, currentTime))
+            return theCursor.rowcount
+        numRequeued = self.__execTransaction(requeueFunc)
+        if numRequeued > 0:
+            self.log.info('Requeued %d jobs with expired lease' % numRequeued)
+        return numRequeued
+
+    def getNumJobs(self, theState=None):
+        if theState is None:
+            return self.__query('SELECT COUNT(*) FROM Jobs')[0][0]
+        else:
+            return self.__query('SELECT COUNT(*) FROM Jobs WHERE state = ?', (theState,))[0][0]
+
+    def isFinished(self):
+        """
+        Returns true if all jobs are done or failed.
+        """
+        return self.__query('SELECT COUNT(*) FROM Jobs WHERE state IN (?, ?)',
+                            (WorkQueueJobState.PENDING, WorkQueueJobState.LEASED))[0][0] == 0
+
+    def getFailedJobList(self):
+        """
+        Returns (jobId, apkPath) of all jobs given up after too many attempts.
+        """
+        return self.__query('SELECT id, apk_path FROM Jobs WHERE state = ? ORDER BY id',
+                            (WorkQueueJobState.FAILED,))
+
+    def getResults(self, theMinResultId=0):
+        """
+        Returns all results stored after the result with id theMinResultId
+        in the order they were stored. Each result is a dict with the keys
+        resultId, jobId, workerId, logcatFileName, logcat, logEntries,
+        appReport, errorList, finishTime, and apkPath.
+        """
+        resultList = []
+        for row in self.__query('SELECT Results.id, job_id, Results.worker_id, logcat_file_name, logcat, log_entries, app_report, error_list, finish_time, apk_path FROM Results JOIN Jobs ON Jobs.id = job_id WHERE Results.id > ? ORDER BY Results.id',
+                                (theMinResultId,)):
+            logcat = None
+            if not row[4] is None:
+                logcat = zlib.decompress(str(row[4]))
+            resultList.append({'resultId' : row[0],
+                               'jobId' : row[1],
+                               'workerId' : row[2],
+                               'logcatFileName' : row[3],
+                               'logcat' : logcat,
+                               'logEntries' : row[5],
+                               'appReport' : row[6],
+                               'errorList' : row[7],
+                               'finishTime' : row[8],
+                               'apkPath' : row[9]})
+        return resultList
+
+    # ================================================================================
+    # Worker
+    # ================================================================================
+    @staticmethod
+    def getDefaultWorkerId():
+        return '%s_%d' % (socket.gethostname(), int(time.time()))
+
+    def registerWorker(self, theWorkerId, theNumThreads):
+        def registerFunc(theCursor):
+            theCursor.execute('INSERT OR REPLACE INTO Workers (id, num_threads, last_heartbeat) VALUES (?, ?, ?)',
+                              (theWorkerId, theNumThreads, time.time()))
+        self.__execTransaction(registerFunc)
+
+    def leaseJob(self, theWorkerId):
+        """
+        Leases the next pending job for the worker.
+        Returns (jobId, apkPath) or None if no job is pending.
+        """
+        self.requeueExpiredJobs()
+        def leaseFunc(theCursor):
+            theCursor.execute('SELECT id, apk_path FROM Jobs WHERE state = ? ORDER BY id LIMIT 1',
+                              (WorkQueueJobState.PENDING,))
+            row = theCursor.fetchone()
+            if row is None:
+                return None
+            theCursor.execute('UPDATE Jobs SET state = ?, worker_id = ?, lease_expiry = ?, num_attempts = num_attempts + 1 WHERE id = ?',
+                              (WorkQueueJobState.LEASED, theWorkerId, time.time() + self.leaseTimeout, row[0]))
+            return (row[0], row[1])
+        return self.__execTransaction(leaseFunc)
+
+    def heartbeat(self, theWorkerId):
+        """
+        Renews the leases of all jobs of the worker.
+        """
+        def heartbeatFunc(theCursor):
+            currentTime = time.time()
+            theCursor.execute('UPDATE Workers SET last_heartbeat = ? WHERE id = ?',
+                              (currentTime, theWorkerId))
+            theCursor.execute('UPDATE Jobs SET lease_expiry = ? WHERE state = ? AND worker_id = ?',
+                              (currentTime + self.leaseTimeout, WorkQueueJobState.LEASED, theWorkerId))
+        self.__execTransaction(heartbeatFunc)
+
+    def storeResult(self, theJobId, theWorkerId, theLogcatFileName=None, theLogcat=None, theLogEntries=None, theAppReport=None, theErrorList=None, theFailedFlag=False):
+        """
+        Stores the result of a job and marks it as done (or failed).
+        Results of workers which lost their lease in the meantime are
+        ignored, the job was handed out again. Returns true if the result
+        was stored.
+        """
+        def storeFunc(theCursor):
+            theCursor.execute('SELECT state, worker_id FROM Jobs WHERE id = ?', (theJobId,))
+            row = theCursor.fetchone()
+            if row is None or row[0] != WorkQueueJobState.LEASED or row[1] != theWorkerId:
+                return False
+
+            logcat = None
+            if not theLogcat is None:
+                logcat = sqlite.Binary(zlib.compress(theLogcat))
+            theCursor.execute('INSERT INTO Results (job_id, worker_id, logcat_file_name, logcat, log_entries, app_report, error_list, finish_time) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                              (theJobId, theWorkerId, theLogcatFileName, logcat, theLogEntries, theAppReport, theErrorList, time.time()))
+            state = WorkQueueJobState.DONE
+            if theFailedFlag:
+                state = WorkQueueJobState.FAILED
+            theCursor.execute('UPDATE Jobs SET state = ?, lease_expiry = NULL WHERE id = ?',
+                              (state, theJobId))
+            return True
+        stored = self.__execTransaction(storeFunc)
+        if not stored:
+            self.log.error('Result of job %d dropped, lease of worker %s expired' % (theJobId, theWorkerId))
+        return stored
+
+
+# ================================================================================
+# Work Queue Heartbeat
+# ================================================================================
+class WorkQueueHeartbeat(Thread):
+    """
+    Renews the leases of a worker until it is stopped.
+    """
+    def __init__(self, theWorkQueue, theWorkerId, theInterval=30, theLogger=Logger()):
+        Thread.__init__(self)
+        self.workQueue = theWorkQueue
+        self.workerId = theWorkerId
+        self.interval = theInterval
+        self.log = theLogger
+
+        self.stopEvent = Event()
+        self.daemon = True
+
+    def stop(self):
+        self.stopEvent.set()
+        self.join()
+
+    def run(self):
+        while not self.stopEvent.isSet():
+            try:
+                self.workQueue.heartbeat(self.workerId)
+            except sqlite.Error, sqlErr:
+                self.log.error('Heartbeat of worker %s failed: %s' % (self.workerId, str(sqlErr)))
+            self.stopEvent.wait(self.interval)